@@ -27,6 +27,7 @@ from .errors import *
 from . import errors as errors
 
 from .utils import num2date, date2num, time2num, num2time,num2dt
+from .utils import date2num_array, num2date_array
 
 from .linebuffer import *
 from .functions import *
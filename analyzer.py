@@ -21,16 +21,79 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import array
 import calendar
 from collections import OrderedDict
 import datetime
 import pprint as pp
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import backtrader as bt
 from backtrader import TimeFrame
+from backtrader.linebuffer import NumpyLineArray
+from backtrader.utils import date2num, num2date, num2date_array
+from backtrader.utils.dateintern import MUSECONDS_PER_DAY_INT
 from backtrader.utils.py3 import MAXINT, with_metaclass
 
 
+def _seriesarray():
+    '''Returns a growable array of floats to keep the series of an analyzer
+    (preallocated ``numpy`` storage if available)'''
+    if np is not None:
+        return NumpyLineArray()
+    return array.array(str('d'))
+
+
+def _num2dates(nums, tz=None):
+    '''Converts the float datetimes kept by an analyzer to a list of
+    ``datetime`` objects with the same values ``num2date`` returns'''
+    if np is not None:
+        return num2date_array(nums, tz=tz).astype(object).tolist()
+    return [num2date(x, tz=tz) for x in nums]
+
+
+# 策略运行的时候给运行结束之后计算的analyzer记录的数据
+class AnalyzerRecord(object):
+    '''
+    Compact record of what the analyzers of a strategy are notified during a
+    run with ``postanalyzers=True``, used by the analyzers which calculate
+    their results after the run (see ``Analyzer.postrun``)
+
+    The values are appended to ``array.array`` objects during the run and
+    ``finish`` turns them into ``numpy`` arrays with one entry per cycle
+    (``prenext``/``nextstart``/``next``) of the strategy:
+
+      - ``datetime``: float datetime of the strategy
+
+      - ``status``: ``1`` for ``prenext``, ``0`` for ``nextstart`` and
+        ``-1`` for ``next``
+
+      - ``cash``, ``value``, ``fundvalue`` and ``fundshares``: the values
+        notified with ``notify_fund`` in the cycle
+
+    ``trades`` is a list of ``(cycle, trade)`` with the notified trades
+    '''
+    _columns = ('datetime', 'cash', 'value', 'fundvalue', 'fundshares')
+
+    def __init__(self):
+        for name in self._columns:
+            setattr(self, name, array.array(str('d')))
+
+        self.status = array.array(str('b'))
+        self.trades = list()
+
+    def finish(self):
+        '''Converts the recorded values to ``numpy`` arrays'''
+        for name in self._columns + ('status',):
+            setattr(self, name, np.array(getattr(self, name)))
+
+        return self
+
+
 # analyzer元类
 class MetaAnalyzer(bt.MetaParams):
     def donew(cls, *args, **kwargs):
@@ -230,6 +293,57 @@ class Analyzer(with_metaclass(MetaAnalyzer, object)):
 
         self.stop()
 
+    # 运行结束之后计算的时候，不能被子类重写的方法
+    _postrun_callbacks = ('prenext', 'nextstart', 'next', 'notify_cashvalue',
+                          'notify_fund', 'notify_order', 'notify_trade')
+
+    # 是否可以在运行结束之后计算
+    def _canpostrun(self):
+        '''Returns ``True`` if the analysis can be calculated after the run
+        with ``postrun``, i.e.: ``postrun`` has been implemented, the
+        notification and ``next`` family of methods are the ones ``postrun``
+        was written for and the same applies to all children'''
+        if np is None:
+            return False
+
+        mro = type(self).__mro__
+        owner = next(c for c in mro if 'postrun' in c.__dict__)
+        if owner is Analyzer:
+            return False
+
+        for name in self._postrun_callbacks:
+            definer = next((c for c in mro if name in c.__dict__), None)
+            if definer is not None and definer not in owner.__mro__:
+                return False  # overridden in a subclass
+
+        return all(child._canpostrun() for child in self._children)
+
+    # 运行结束之后根据记录计算
+    def _postrun(self, record):
+        for child in self._children:
+            child._postrun(record)
+
+        self.postrun(record)
+
+    # 调用next的周期
+    def _postrun_nexts(self, record):
+        '''Returns a boolean array flagging the cycles of ``record`` in which
+        ``next`` is invoked'''
+        return np.ones(len(record.status), dtype=bool)
+
+    def postrun(self, record):
+        '''Invoked right before ``stop`` when running with the ``Cerebro``
+        parameter ``postanalyzers=True``, instead of the notifications and
+        ``next`` family of methods during the run, with the
+        ``AnalyzerRecord`` of the strategy
+
+        Analyzers which are a function of the values of the broker and of the
+        trades override it to bring (in vectorized form) their attributes to
+        the state a regular run would have left, letting ``stop`` calculate
+        the results as usual
+        '''
+        pass
+
     # 通知cash 和 value
     def notify_cashvalue(self, cash, value):
         '''Receives the cash/value notification before each next cycle'''
@@ -365,6 +479,14 @@ class TimeFrameAnalyzerBase(with_metaclass(MetaTimeFrameAnalyzerBase,
         self.compression = self.p.compression or self.data._compression
 
         self.dtcmp, self.dtkey = self._get_dt_cmpkey(datetime.datetime.min)
+        # 策略的datetime line，使用浮点数的时间和下个周期开始的时间进行比较，
+        # 周期没有结束的时候不需要把时间转换成datetime
+        self._dtline = self.strategy.datetime
+        self._dtnext = float('-inf')
+        self._oneday = datetime.timedelta(days=1)
+        self._dtunit = datetime.timedelta(
+            minutes=self.timeframe == TimeFrame.Minutes,
+            seconds=self.timeframe == TimeFrame.Seconds)
         super(TimeFrameAnalyzerBase, self)._start()
 
     # 调用_prenext
@@ -410,8 +532,14 @@ class TimeFrameAnalyzerBase(with_metaclass(MetaTimeFrameAnalyzerBase,
         # 否则，就调用_get_dt_cmpkey(dt)获取dtcmp, dtkey
         else:
             # With >= 1.9.x the system datetime is in the strategy
-            dt = self.strategy.datetime.datetime()
+            dtnum = self._dtline[0]
+            # 还没有到下个周期开始的时间，周期没有结束
+            if dtnum < self._dtnext:
+                return False
+
+            dt = num2date(dtnum, tz=self._dtline._tz)
             dtcmp, dtkey = self._get_dt_cmpkey(dt)
+            self._dtnext = self._get_dt_next(dt, dtkey)
         # 如果dtcmp是None，或者dtcmp大于self.dtcmp的话
         if self.dtcmp is None or dtcmp > self.dtcmp:
             # 设置dtkey，dtkey1，dtcmp，dtcmp1返回True
@@ -421,6 +549,129 @@ class TimeFrameAnalyzerBase(with_metaclass(MetaTimeFrameAnalyzerBase,
         # 返回False
         return False
 
+    # 为了保证结果精确而留出的时间(天)，num2date会对10微秒以内的误差进行补偿
+    _dtmargin = 1e-8
+
+    # 获取下个周期开始的时间
+    def _get_dt_next(self, dt, dtkey):
+        '''Returns the (UTC) float datetime before which the strategy is
+        guaranteed to be still in the period of ``dt`` (``dtkey``)
+
+        ``-inf`` is returned if it cannot be safely calculated, forcing the
+        full calculation of ``_get_dt_cmpkey`` for each bar
+        '''
+        tf = self.timeframe
+        try:
+            if tf == TimeFrame.Years:
+                dtnext = datetime.datetime(dt.year + 1, 1, 1)
+            elif tf >= TimeFrame.Days:
+                dtnext = dtkey + self._oneday
+            elif tf >= TimeFrame.Seconds:
+                # 日内的周期在午夜也会结束
+                midnight = datetime.datetime(dt.year, dt.month, dt.day)
+                dtnext = min(dtkey + self._dtunit, midnight + self._oneday)
+            else:
+                return float('-inf')
+        except (ValueError, OverflowError):
+            return float('-inf')
+
+        tz = self._dtline._tz
+        if tz is None:
+            # 周期的边界没有微秒，误差远小于留出的时间
+            return (dtnext.toordinal() - self._dtmargin +
+                    (dtnext.hour * 3600 + dtnext.minute * 60 +
+                     dtnext.second) / 86400.0)
+
+        # 夏令时切换的时候，取本地时间两种解释中最早的UTC时间
+        try:
+            return min(date2num(tz.localize(dtnext, is_dst=isdst))
+                       for isdst in (True, False)) - self._dtmargin
+        except TypeError:  # not a pytz timezone
+            return float('-inf')
+
+    # 把保存的浮点数时间转换成每个周期的dtkey
+    def _get_dtkeys(self, nums):
+        '''Returns the ``dtkey`` of the periods of the float datetimes
+        ``nums`` of the strategy'''
+        if self.timeframe == TimeFrame.NoTimeFrame:
+            return [datetime.datetime.max] * len(nums)
+
+        return [self._get_dt_cmpkey(dt)[1]
+                for dt in _num2dates(nums, tz=self._dtline._tz)]
+
+    # on_dt_over也不能被子类重写
+    _postrun_callbacks = Analyzer._postrun_callbacks + ('on_dt_over',)
+
+    # 运行结束之后计算的时候支持的交易周期
+    _postrun_timeframes = (TimeFrame.Seconds, TimeFrame.Minutes, TimeFrame.Days,
+                           TimeFrame.Weeks, TimeFrame.Months, TimeFrame.Years,
+                           TimeFrame.NoTimeFrame)
+
+    # 是否可以在运行结束之后计算
+    def _canpostrun(self):
+        return (self.timeframe in self._postrun_timeframes and
+                super(TimeFrameAnalyzerBase, self)._canpostrun())
+
+    # 调用next的周期
+    def _postrun_nexts(self, record):
+        if self.p._doprenext:
+            return np.ones(len(record.status), dtype=bool)
+
+        return record.status <= 0
+
+    # 运行结束之后，计算调用on_dt_over的周期
+    def _postrun_dtover(self, record):
+        '''Returns a boolean array flagging the cycles of ``record`` in which
+        ``on_dt_over`` is invoked and leaves ``dtcmp``/``dtkey`` (and
+        ``dtcmp1``/``dtkey1``) as a regular run would have left them'''
+        dts = record.datetime
+        ids = self._get_dt_cmpids(dts)
+        overs = np.ones(len(ids), dtype=bool)
+        overs[1:] = ids[1:] > np.maximum.accumulate(ids)[:-1]
+
+        # 只需要最后两个周期的dtcmp, dtkey
+        for i in np.flatnonzero(overs)[-2:]:
+            if self.timeframe == TimeFrame.NoTimeFrame:
+                dtcmp, dtkey = MAXINT, datetime.datetime.max
+            else:
+                dt = num2date(dts[i], tz=self._dtline._tz)
+                dtcmp, dtkey = self._get_dt_cmpkey(dt)
+
+            self.dtkey, self.dtkey1 = dtkey, self.dtkey
+            self.dtcmp, self.dtcmp1 = dtcmp, self.dtcmp
+
+        if not self.p._doprenext:
+            overs[record.status == 0] = True  # always called in nextstart
+
+        return overs
+
+    # 按照dtcmp的顺序给每个时间一个整数
+    def _get_dt_cmpids(self, dts):
+        '''Returns integers with the same order as the ``dtcmp`` values of the
+        float datetimes ``dts``'''
+        tf = self.timeframe
+        if tf == TimeFrame.NoTimeFrame:
+            return np.zeros(len(dts), dtype=np.int64)
+
+        dts = num2date_array(dts, tz=self._dtline._tz)
+        if tf == TimeFrame.Years:
+            return dts.astype('M8[Y]').view(np.int64)
+        if tf == TimeFrame.Months:
+            return dts.astype('M8[M]').view(np.int64)
+
+        us = dts.view(np.int64)
+        days = us // MUSECONDS_PER_DAY_INT
+        if tf == TimeFrame.Weeks:
+            return (days + 3) // 7  # iso weeks start on monday, 1970-01-01 thu
+        if tf == TimeFrame.Days:
+            return days
+
+        # 日内的周期，同一天中根据compression分组
+        unit = 60000000 if tf == TimeFrame.Minutes else 1000000
+        points = (us - days * MUSECONDS_PER_DAY_INT) // unit
+        return (days * (MUSECONDS_PER_DAY_INT // unit) +
+                points // self.compression)
+
     # 获取dtcmp, dtkey
     def _get_dt_cmpkey(self, dt):
         # 如果当前的交易周期是没有时间周期的话，返回两个None
@@ -38,6 +38,7 @@ from .returns import *
 from .vwr import *
 
 from .logreturnsrolling import *
+from .correlation import *
 
 from .calmar import *
 from .periodstats import *
@@ -23,8 +23,14 @@ from __future__ import (absolute_import, division, print_function,
 
 from collections import OrderedDict
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
 from backtrader.utils.py3 import range
-from backtrader.utils.date import num2date
+from backtrader.utils.date import num2date_array
 from backtrader import Analyzer
 
 
@@ -49,7 +55,41 @@ class AnnualReturn(Analyzer):
       - Returns a dictionary of annual returns (key: year)
     """
 
+    def start(self):
+        super(AnnualReturn, self).start()
+        self._postrun_done = False  # 运行结束之后是否已经计算了收益率
+
+    # 运行结束之后根据数据的时间和broker观察者记录的价值一次计算
+    def postrun(self, record):
+        n = len(self.data)
+        if not n:
+            return
+
+        # Must have stats.broker
+        dts = np.asarray(self.data.datetime.get(size=n), dtype=np.float64)
+        values = np.asarray(self.strategy.stats.broker.value.get(size=n),
+                            dtype=np.float64)
+        if len(dts) != n or len(values) != n:
+            return  # 缓存中没有全部的数据，在stop中计算
+
+        years = num2date_array(dts, tz=self.data.datetime._tz)
+        years = years.astype('M8[Y]').astype(np.int64) + 1970
+        # 年份大于之前所有的年份的时候是新的一年
+        starts = np.flatnonzero(
+            years > np.maximum.accumulate(np.append(-1, years[:-1])))
+        ends = np.append(starts[1:], n) - 1
+        # 新的一年使用上一年最后的价值作为开始的价值
+        value_starts = values[np.append(0, ends[:-1])]
+        annualrets = values[ends] / value_starts - 1.0
+
+        self.rets = annualrets.tolist()
+        self.ret = OrderedDict(zip(years[starts].tolist(), self.rets))
+        self._postrun_done = True
+
     def stop(self):
+        if self._postrun_done:
+            return
+
         # Must have stats.broker
         # 当前年份
         cur_year = -1
@@ -128,16 +168,15 @@ class MyAnnualReturn(Analyzer):
             setattr(self, "ret", OrderedDict())
         # 获取数据的时间，并转化为date
         dt_list = self.data.datetime.get(0, size=len(self.data))
-        dt_list = [num2date(i) for i in dt_list]
+        dt_list = num2date_array(dt_list)
         # 获取账户的资产
         value_list = self.strategy.stats.broker.value.get(0, size=len(self.data))
         # 转化为pandas格式
         import pandas as pd
-        df = pd.DataFrame([dt_list, value_list]).T
-        df.columns = ['datetime', 'value']
+        df = pd.DataFrame({'datetime': dt_list, 'value': value_list})
         df['pre_value'] = df['value'].shift(1)
         # 计算每年的持有获得的简单收益率
-        df['year'] = [i.year for i in df['datetime']]
+        df['year'] = df['datetime'].dt.year
         for year, data in df.groupby("year"):
             begin_value = list(data['pre_value'])[0]
             end_value = list(data['value'])[-1]
@@ -21,6 +21,11 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import backtrader as bt
 import math
 from . import TimeDrawDown
@@ -106,19 +111,38 @@ class Calmar(bt.TimeFrameAnalyzerBase):
             self._values.append(self.strategy.broker.fundvalue)
 
     def on_dt_over(self):
-        # 最大回撤率
-        self._mdd = max(self._mdd, self._maxdd.maxdd)
         # 添加值到self._values中
         if not self._fundmode:
-            self._values.append(self.strategy.broker.getvalue())
+            value = self.strategy.broker.getvalue()
         else:
-            self._values.append(self.strategy.broker.fundvalue)
+            value = self.strategy.broker.fundvalue
+
+        self._update(self._maxdd.maxdd, value, self.dtkey)
+
+    # 运行结束之后根据记录的价值计算每个周期的calmar
+    def postrun(self, record):
+        overs = self._postrun_dtover(record)
+        steps = np.flatnonzero(overs)
+        values = record.fundvalue if self._fundmode else record.value
+        dtkeys = self._get_dtkeys(record.datetime[steps])
+
+        # TimeDrawDown在同一个bar中先于calmar计算
+        ddsteps, maxdds = self._maxdd._postrun_maxdds
+        ddidx = np.searchsorted(ddsteps, steps, side='right')
+        for value, maxdd, dtkey in zip(values[steps].tolist(),
+                                       maxdds[ddidx].tolist(), dtkeys):
+            self._update(maxdd, value, dtkey)
+
+    def _update(self, maxdd, value, dtkey):
+        # 最大回撤率
+        self._mdd = max(self._mdd, maxdd)
+        self._values.append(value)
         # 默认情况下计算得到平均每个月的收益率
         rann = math.log(self._values[-1] / self._values[0]) / len(self._values)
         # 计算calmar指标
         self.calmar = calmar = rann / (self._mdd or float('Inf'))
         # 保存结果
-        self.rets[self.dtkey] = calmar
+        self.rets[dtkey] = calmar
 
     def stop(self):
         self.on_dt_over()  # update last values
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2015-2020 Daniel Rodriguez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import math
+
+import backtrader as bt
+from backtrader.analyzer import _seriesarray
+
+# 编译之后的函数(在analyzers/my_corr中编译)，没有编译的时候使用python计算
+try:
+    from backtrader.analyzers.my_corr.my_corr import rolling_average_corr
+except ImportError:
+    rolling_average_corr = None
+
+
+__all__ = ['RollingCorrelation']
+
+
+# 和C中一样，除以0的时候得到inf或者nan
+def _div(x, y):
+    try:
+        return x / y
+    except ZeroDivisionError:
+        return x * math.copysign(float('inf'), y)
+
+
+def _mean(x):
+    total = 0.0
+    for v in x:
+        total += v
+    return _div(total, len(x))
+
+
+def _covariance(x, y, meanx, meany):
+    total = 0.0
+    for vx, vy in zip(x, y):
+        total += (vx - meanx) * (vy - meany)
+    return _div(total, len(x) - 1)
+
+
+def _rolling_average_corr(rets, period):
+    '''Returns the list of the averages of the pairwise Pearson correlations
+    of the sequences in ``rets`` over each window of ``period`` values
+
+    Pure python version of ``my_corr.rolling_average_corr``, with the same
+    order of operations and therefore the same results'''
+    cols = len(rets)
+    count = cols * (cols - 1) // 2
+    corrs = []
+    for t in range(len(rets[0]) - period + 1 if rets else 0):
+        windows = [ret[t:t + period] for ret in rets]
+        means = [_mean(x) for x in windows]
+        devs = [math.sqrt(_covariance(x, x, m, m))
+                for x, m in zip(windows, means)]
+
+        total = 0.0
+        for i in range(cols):
+            rowsum = 0.0
+            for j in range(i + 1, cols):
+                cov = _covariance(windows[i], windows[j], means[i], means[j])
+                rowsum += _div(cov, devs[i] * devs[j])
+            total += rowsum
+
+        corrs.append(_div(total, count))
+
+    return corrs
+
+
+class RollingCorrelation(bt.TimeFrameAnalyzerBase):
+    '''This analyzer calculates the average of the pairwise (Pearson)
+    correlations of the returns of the datas over a rolling window of
+    timeframe periods
+
+    The return of each data in a period is calculated with the last
+    ``close`` of the period and the last ``close`` of the previous period
+
+    The calculation is done at the end of the run with the compiled
+    ``my_corr`` extension if it has been built (see ``analyzers/my_corr``),
+    or else in pure python, with the same results
+
+    Params:
+
+      - ``timeframe`` (default: ``None``)
+        If ``None`` the ``timeframe`` of the 1st data in the system will be
+        used
+
+      - ``compression`` (default: ``None``)
+
+        Only used for sub-day timeframes to for example work on an hourly
+        timeframe by specifying "TimeFrame.Minutes" and 60 as compression
+
+        If ``None`` then the compression of the 1st data of the system will be
+        used
+
+      - ``period`` (default: ``20``)
+
+        Number of returns (at least 2) for the calculation of each
+        correlation
+
+      - ``datas`` (default: ``None``)
+
+        Datas whose returns are correlated. If ``None`` all the datas of the
+        strategy will be used
+
+    Methods:
+
+      - get_analysis
+
+        Returns a dictionary with the average correlations as values and the
+        datetime points of the last period of each window as keys
+    '''
+    params = (
+        ('period', 20),
+        ('datas', None),
+    )
+
+    def start(self):
+        super(RollingCorrelation, self).start()
+        self._corrdatas = self.p.datas or self.datas
+        # 每个周期的时间和每个data在每个周期最后的收盘价
+        self._times = _seriesarray()
+        self._closes = [_seriesarray() for data in self._corrdatas]
+
+    def on_dt_over(self):
+        self._times.append(self._dtline[0])
+        for closes in self._closes:
+            closes.append(float('NaN'))
+
+    def next(self):
+        for closes, data in zip(self._closes, self._corrdatas):
+            if len(data):
+                closes[-1] = data.close[0]
+
+    def stop(self):
+        super(RollingCorrelation, self).stop()
+        period = self.p.period
+        if len(self._closes) < 2 or len(self._times) <= period:
+            return
+
+        rets = [[_div(close, lastclose) - 1.0
+                 for lastclose, close in zip(closes[:-1], closes[1:])]
+                for closes in self._closes]
+
+        if rolling_average_corr is not None:
+            corrs = rolling_average_corr(rets, period).tolist()
+        else:
+            corrs = _rolling_average_corr(rets, period)
+
+        dtkeys = self._get_dtkeys(self._times[period:])
+        self.rets.update(zip(dtkeys, corrs))
@@ -21,12 +21,34 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import backtrader as bt
 from backtrader.utils import AutoOrderedDict
 
+# 编译之后的函数(在utils/cal_return_sharpe_drawdown中编译)，没有编译的时候使用python计算
+try:
+    from backtrader.utils.cal_return_sharpe_drawdown.cal_return_sharpe_drawdown \
+        import cal_drawdown_stats_cy
+except ImportError:
+    cal_drawdown_stats_cy = None
+
 __all__ = ['DrawDown', 'TimeDrawDown']
 
 
+def _counts(flags, resets, start=0):
+    '''Returns for each position the number of ``True`` values in ``flags``
+    since the last ``True`` value in ``resets`` (included), counting from
+    ``start`` before the first one'''
+    counts = np.cumsum(flags)
+    before = np.append(0, counts[:-1])
+    last = np.maximum.accumulate(np.where(resets, np.arange(len(flags)), -1))
+    return counts - np.where(last >= 0, before[last], -start)
+
+
 # 分析回撤的情况
 class DrawDown(bt.Analyzer):
     """This analyzer calculates trading system drawdowns stats such as drawdown
@@ -115,6 +137,44 @@ class DrawDown(bt.Analyzer):
         r.len = r.len + 1 if drawdown else 0
         r.max.len = max(r.max.len, r.len)
 
+    # 运行结束之后根据记录的价值一次计算
+    def postrun(self, record):
+        values = record.fundvalue if self._fundmode else record.value
+        if not len(values):
+            return
+
+        r = self.rets
+        self._value = float(values[-1])
+        # 有编译之后的函数的时候逐个bar计算
+        if cal_drawdown_stats_cy is not None:
+            (self._maxvalue, r.moneydown, r.drawdown, ddlen, r.max.moneydown,
+             r.max.drawdown, maxlen) = cal_drawdown_stats_cy(
+                 values, (self._maxvalue, r.moneydown, r.drawdown, r.len,
+                          r.max.moneydown, r.max.drawdown, r.max.len))
+            r.len, maxlen = int(ddlen), int(maxlen)
+            if maxlen > r.max.len:
+                r.max.len = maxlen
+            return
+
+        # fmax和max一样忽略NaN
+        maxvalues = np.fmax.accumulate(np.append(self._maxvalue, values))[1:]
+        moneydowns = maxvalues - values
+        drawdowns = 100.0 * moneydowns / maxvalues
+        lens = _counts(drawdowns != 0, drawdowns == 0, r.len)
+
+        self._maxvalue = float(maxvalues[-1])
+        r.moneydown = float(moneydowns[-1])
+        r.drawdown = float(drawdowns[-1])
+        r.len = int(lens[-1])
+
+        r.max.moneydown = float(np.fmax.reduce(moneydowns,
+                                               initial=r.max.moneydown))
+        r.max.drawdown = float(np.fmax.reduce(drawdowns,
+                                              initial=r.max.drawdown))
+        maxlen = int(lens.max())
+        if maxlen > r.max.len:
+            r.max.len = maxlen
+
 
 # 分析时间回撤情况(最大回撤)
 class TimeDrawDown(bt.TimeFrameAnalyzerBase):
@@ -202,6 +262,29 @@ class TimeDrawDown(bt.TimeFrameAnalyzerBase):
         self.maxdd = max(self.maxdd, dd)
         self.maxddlen = max(self.maxddlen, self.ddlen)
 
+    # 运行结束之后根据记录的价值一次计算
+    def postrun(self, record):
+        overs = self._postrun_dtover(record)
+        values = (record.fundvalue if self._fundmode else record.value)[overs]
+        maxdds = np.append(self.maxdd, values[:0])
+        if len(values):
+            # fmax和max一样忽略NaN
+            peaks = np.fmax.accumulate(np.append(self.peak, values))
+            newpeaks = values > peaks[:-1]
+            peaks = peaks[1:]
+            dds = 100.0 * (peaks - values) / peaks
+            ddlens = _counts(dds != 0, newpeaks, self.ddlen)
+            maxdds = np.fmax.accumulate(np.append(self.maxdd, dds))
+
+            self.peak = float(peaks[-1])
+            self.dd = float(dds[-1])
+            self.ddlen = int(ddlens[-1])
+            self.maxdd = float(maxdds[-1])
+            self.maxddlen = max(self.maxddlen, int(ddlens.max()))
+
+        # 每次调用on_dt_over之后的最大回撤(第一个是开始的值)，Calmar会使用
+        self._postrun_maxdds = np.flatnonzero(overs), maxdds
+
     # 停止的时候，把最大回撤和最大回撤长度添加到字典中
     def stop(self):
         self.rets['maxdrawdown'] = self.maxdd
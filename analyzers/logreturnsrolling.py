@@ -24,6 +24,11 @@ from __future__ import (absolute_import, division, print_function,
 import collections
 import math
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import backtrader as bt
 
 
@@ -145,3 +150,45 @@ class LogReturnsRolling(bt.TimeFrameAnalyzerBase):
             self.rets[self.dtkey] = 0
             # print("计算对数收益率的时候,相应的值小于0")
         self._lastvalue = self._value  # keep last value
+
+    # 只有跟踪账户价值的时候才能在运行结束之后计算
+    def _canpostrun(self):
+        return (self.p.data is None and
+                super(LogReturnsRolling, self)._canpostrun())
+
+    # 运行结束之后根据记录的价值一次计算每个周期的对数收益率
+    def postrun(self, record):
+        values = record.fundvalue if self._fundmode else record.value
+        if not len(values):
+            return
+
+        overs = self._postrun_dtover(record)
+        nexts = self._postrun_nexts(record)
+        steps = np.flatnonzero(overs)
+        nextsteps = np.flatnonzero(nexts)
+
+        # 每个周期添加到队列的是之前最后一个调用next的bar的价值
+        idx = np.arange(len(values))
+        lastnexts = np.maximum.accumulate(np.where(nexts, idx, -1))
+        lastvalues = np.append(self._lastvalue, values)
+        vsts = lastvalues[np.append(0, lastnexts[:-1] + 1)[steps]]
+
+        # 第m个周期中队列的第一个值
+        counts = np.cumsum(overs)[nextsteps]
+        firsts = np.append(list(self._values), vsts)[counts]
+        with np.errstate(all='ignore'):
+            ratios = values[nextsteps] / firsts
+
+        # 和next中一样，不能计算对数的时候收益率是0
+        bad = (firsts == 0) | (ratios <= 0)
+        lasts = np.diff(np.append(counts, len(steps) + 1)) != 0
+        dtkeys = self._get_dtkeys(record.datetime[steps[counts[lasts] - 1]])
+        # 使用math.log保证和next中的结果完全一致
+        for dtkey, ratio, isbad in zip(dtkeys, ratios[lasts].tolist(),
+                                       bad[lasts].tolist()):
+            self.rets[dtkey] = 0 if isbad else math.log(ratio)
+
+        self._values.extend(vsts.tolist())
+        self._value = float(values[-1])
+        if len(nextsteps):
+            self._lastvalue = float(values[nextsteps[-1]])
@@ -1,130 +1,98 @@
-// #include <stdio.h>
-// #include <stdlib.h>
-// #include <math.h>
-// #include <vector>
-// //#include <unistd.h> //windows中不存在，使用io.h和process.h替代
-// #include <io.h>
-// #include <process.h>
-// //#include <sys/wait.h>
-// #include <sys/types.h>
-// #include <iostream>
-// #include <windows.h>
-// #include <vector>
-// #include <algorithm>
-// #include <numeric>
-// #include <thread>
-// #include <mutex>
-
-#include <iostream>
+#include <cmath>
 #include <vector>
-#include <algorithm>
-#include <numeric>
-#include <windows.h>
-
 
+// 相关系数的计算使用和python中一样的计算顺序，保证编译之后的结果和python完全一致
+// 多线程使用openmp(没有openmp的时候单线程运行)，每个线程计算的结果按照固定的顺序相加，结果不受线程数影响
 
 
-double mean(const std::vector<double>& data) {
+inline double mean(const double* data, int n) {
     double sum = 0;
-    int n=data.size();
     for (int i = 0; i < n; i++) {
         sum += data[i];
     }
     return sum / n;
 }
 
-double variance(const std::vector<double>& data, double mean) {
+inline double variance(const double* data, int n, double mean) {
     double sum = 0;
-    int n = data.size();
     for (int i = 0; i < n; i++) {
         sum += (data[i] - mean) * (data[i] - mean);
     }
     return sum / (n - 1);
 }
 
-double covariance(
-    const std::vector<double>& data1, 
-    const std::vector<double>& data2, 
-    double mean1, double mean2) {
-    
+inline double covariance(
+    const double* data1,
+    const double* data2,
+    int n, double mean1, double mean2) {
+
     double sum = 0;
-    int n = data1.size();
     for (int i = 0; i < n; i++) {
         sum += (data1[i] - mean1) * (data2[i] - mean2);
     }
     return sum / (n - 1);
 }
 
-double correlation(const std::vector<double>& data1,const std::vector<double>& data2) {
-    double mean1 = mean(data1);
-    double mean2 = mean(data2);
-    double var1 = variance(data1, mean1);
-    double var2 = variance(data2, mean2);
-    double cov = covariance(data1, data2, mean1, mean2);
-    return cov / (sqrt(var1) * sqrt(var2));
+inline double correlation(const std::vector<double>& data1,const std::vector<double>& data2) {
+    int n = data1.size();
+    double mean1 = mean(data1.data(), n);
+    double mean2 = mean(data2.data(), n);
+    double var1 = variance(data1.data(), n, mean1);
+    double var2 = variance(data2.data(), n, mean2);
+    double cov = covariance(data1.data(), data2.data(), n, mean1, mean2);
+    return cov / (std::sqrt(var1) * std::sqrt(var2));
 }
 
-// the struct to pass parameters to the child process
-struct CHILD_PROCESS_PARAMS {
-    int start;
-    int end;
-    const std::vector<std::vector<double>>* data;
-    double* sum;
-    int* count;
-    HANDLE* hMutex;
-};
+// 计算各列之间两两的相关系数的平均值
+inline double calc_corr(const std::vector<std::vector<double>>& mv) {
+    int col = mv.size();
+    std::vector<double> row_sums(col, 0.0);
 
-DWORD WINAPI calc_corr_child(LPVOID lpParam) {
-    CHILD_PROCESS_PARAMS* params = (CHILD_PROCESS_PARAMS*)lpParam;
-    double local_sum = 0.0;
-    int local_count = 0;
-    for (int i = params->start; i <= params->end; i++) {
-        for (int j = i + 1; j < params->data->size(); j++) {
-            local_sum += correlation((*params->data)[i], (*params->data)[j]);
-            local_count++;
+    #pragma omp parallel for schedule(dynamic)
+    for (int i = 0; i < col; i++) {
+        double row_sum = 0.0;
+        for (int j = i + 1; j < col; j++) {
+            row_sum += correlation(mv[i], mv[j]);
         }
+        row_sums[i] = row_sum;
     }
 
-    WaitForSingleObject(*params->hMutex, INFINITE);
-    *params->sum += local_sum;
-    *params->count += local_count;
-    ReleaseMutex(*params->hMutex);
-
-    delete params;
-    return 0;
-}
-
-double calc_corr(const std::vector<std::vector<double>>& mv) {
     double sum_correlation = 0.0;
     int count = 0;
-    int col = mv.size();
-
-    // Create child processes
-    const int NUM_PROCESSES = 10; // change this to the number of processes you want to create
-    HANDLE hProcesses[NUM_PROCESSES];
-    HANDLE hMutex = CreateMutex(NULL, FALSE, NULL);
-    for (int i = 0; i < NUM_PROCESSES; i++) {
-        int start = i * col / NUM_PROCESSES;
-        int end = (i + 1) * col / NUM_PROCESSES - 1;
-        CHILD_PROCESS_PARAMS* params = new CHILD_PROCESS_PARAMS;
-        params->start = start;
-        params->end = end;
-        params->data = &mv;
-        params->sum = &sum_correlation;
-        params->count = &count;
-        params->hMutex = &hMutex;
-        hProcesses[i] = CreateThread(NULL, 0, calc_corr_child, (LPVOID)params, 0, NULL);
+    for (int i = 0; i < col; i++) {
+        sum_correlation += row_sums[i];
+        count += col - 1 - i;
     }
-
-    // Wait for child processes to finish
-    WaitForMultipleObjects(NUM_PROCESSES, hProcesses, TRUE, INFINITE);
-    CloseHandle(hMutex);
-
     // Compute average correlation
-    double average_correlation = sum_correlation / count;
-    return average_correlation;
+    return sum_correlation / count;
 }
 
+// 滚动计算相关系数的平均值，data中按行保存cols个长度是rows的序列，
+// out中保存以每个位置结尾的period个值的平均相关系数，一共rows - period + 1个
+inline void calc_rolling_corr(const double* data, int cols, int rows, int period, double* out) {
+    int nout = rows - period + 1;
+    double count = cols * (cols - 1) / 2;
+
+    #pragma omp parallel for
+    for (int t = 0; t < nout; t++) {
+        std::vector<double> means(cols), devs(cols);
+        for (int i = 0; i < cols; i++) {
+            const double* x = data + (long)i * rows + t;
+            means[i] = mean(x, period);
+            devs[i] = std::sqrt(variance(x, period, means[i]));
+        }
 
-
-
+        double sum_correlation = 0.0;
+        for (int i = 0; i < cols; i++) {
+            const double* x = data + (long)i * rows + t;
+            double row_sum = 0.0;
+            for (int j = i + 1; j < cols; j++) {
+                const double* y = data + (long)j * rows + t;
+                double cov = covariance(x, y, period, means[i], means[j]);
+                row_sum += cov / (devs[i] * devs[j]);
+            }
+            sum_correlation += row_sum;
+        }
+        out[t] = sum_correlation / count;
+    }
+}
@@ -28,6 +28,7 @@ cdef extern from "corr.hh" nogil:
     # double pearson_corr(const vector[vector[double]]& data,Mode mode=Mode.mean)
     # double calc_corr(const vector[vector[double]]& mv)
     double calc_corr(const vector[vector[double]]& mv)
+    void calc_rolling_corr(const double* data, int cols, int rows, int period, double* out)
 
 
 
@@ -94,4 +95,20 @@ def main(df):
     return avgCorr
 #def
 
-
+'''
+@brief 滚动计算平均相关系数
+rets的每一行是一个序列，返回以每个位置结尾的period个值的各个序列两两之间的相关系数的平均值
+'''
+def rolling_average_corr(rets, int period):
+    cdef np.ndarray[np.double_t, ndim=2, mode='c'] arr = np.ascontiguousarray(rets, dtype=np.float64)
+    cdef int cols = arr.shape[0]
+    cdef int rows = arr.shape[1]
+    cdef int n = rows - period + 1 if rows >= period else 0  # Mode中有max，不能使用max函数
+    cdef np.ndarray[np.double_t, ndim=1] out = np.empty(n, dtype=np.float64)
+
+    if n > 0 and cols > 0:
+        with nogil:
+            calc_rolling_corr(&arr[0, 0], cols, rows, period, &out[0])
+    #if
+    return out
+#def
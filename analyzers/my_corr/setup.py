@@ -39,16 +39,20 @@ def set_cpp_version(ver:str) -> str:
     #if
 #def
 
+# 在当前文件夹中运行python setup.py build_ext --inplace进行编译，
+# 或者运行python -m backtrader.utils.build_extensions编译所有的扩展，
+# 编译之后RollingCorrelation分析器会使用编译后的函数，
+# -ffp-contract=off不把乘法和加法合并成fma，保证计算结果和python完全一致
 ext = Extension(
-    "my_corr", sources=["cal_performance.pyx"],
+    "my_corr", sources=["my_corr.pyx"],
     include_dirs=[np.get_include()],
-    language='c',
+    language='c++',
     extra_compile_args=[
                 setg_optimize_option(2),
                 set_compile_args('openmp'),
                 # set_compile_args('lpthread'),
-                # set_cpp_version('c++17')
-    ],
+                set_cpp_version('c++17'),
+    ] + (['-ffp-contract=off'] if sys.platform == 'linux' else []),
     extra_link_args=[
         set_extra_link_args('lgomp'),
     ]
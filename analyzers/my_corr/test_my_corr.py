@@ -0,0 +1,67 @@
+"""测试编译之后的平均相关系数和RollingCorrelation分析器中python的计算结果完全一致，需要先在当前文件夹中编译"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtrader as bt
+import backtrader.analyzers.correlation as correlation_module
+
+my_corr = pytest.importorskip("backtrader.analyzers.my_corr.my_corr")
+
+
+def same(x, y):
+    return len(x) == len(y) and all(
+        a == b or (a != a and b != b) for a, b in zip(x, y))
+
+
+def test_rolling_average_corr():
+    rng = np.random.RandomState(1)
+    for i in range(200):
+        cols = rng.randint(2, 6)
+        n = rng.randint(2, 60)
+        period = rng.randint(2, n + 1)
+        rets = rng.randn(cols, n) * 10.0 ** rng.randint(-5, 5)
+        if i % 10 == 0:
+            rets[0] = 1.0  # 没有波动的时候是nan
+
+        native = my_corr.rolling_average_corr(rets, period).tolist()
+        python = correlation_module._rolling_average_corr(rets.tolist(),
+                                                          period)
+        assert same(native, python)
+
+        if i % 10:
+            corr = np.corrcoef(rets[:, -period:])
+            expected = corr[np.triu_indices(cols, 1)].mean()
+            assert native[-1] == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def run_strategy():
+    cerebro = bt.Cerebro(stdstats=False)
+    for seed in range(4):
+        n = 3000
+        index = pd.date_range('2020-01-01 09:30', periods=n, freq='min')
+        close = 100 + np.cumsum(np.random.RandomState(seed).randn(n) * 0.1)
+        df = pd.DataFrame(dict(open=close, high=close + 0.1,
+                               low=close - 0.1, close=close, volume=1000.0),
+                          index=index)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df,
+                                            timeframe=bt.TimeFrame.Minutes))
+
+    cerebro.addstrategy(bt.Strategy)
+    cerebro.addanalyzer(bt.analyzers.RollingCorrelation, _name='corr',
+                        timeframe=bt.TimeFrame.Minutes, compression=5,
+                        period=30)
+    return cerebro.run()[0].analyzers.corr.get_analysis()
+
+
+def test_analyzer(monkeypatch):
+    native = run_strategy()
+    monkeypatch.setattr(correlation_module, 'rolling_average_corr', None)
+    python = run_strategy()
+    assert len(native) == 570
+    assert list(native) == list(python)
+    assert same(list(native.values()), list(python.values()))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
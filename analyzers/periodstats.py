@@ -89,6 +89,10 @@ class PeriodStats(bt.Analyzer):
                               compression=self.p.compression, fund=self.p.fund)
 
     # 停止
+    # 收益率由子analyzer在运行结束之后计算
+    def postrun(self, record):
+        pass
+
     def stop(self):
         # 获取收益率，默认是每年的
         trets = self._tr.get_analysis()  # dict key = date, value = ret
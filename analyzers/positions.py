@@ -23,6 +23,7 @@ from __future__ import (absolute_import, division, print_function,
 
 
 import backtrader as bt
+from backtrader.analyzer import _num2dates, _seriesarray
 
 # 持仓价值
 class PositionsValue(bt.Analyzer):
@@ -59,6 +60,10 @@ class PositionsValue(bt.Analyzer):
 
         Returns a dictionary with returns as values and the datetime points for
         each return as keys
+
+    The values are kept in arrays indexed by the float datetime of each bar
+    and the dictionary is only created (and updated) when calling
+    ``get_analysis``
     '''
     # 参数
     params = (
@@ -77,17 +82,34 @@ class PositionsValue(bt.Analyzer):
         tf = min(d._timeframe for d in self.datas)
         # 如果时间周期大于等于日，usedate参数设置成True
         self._usedate = tf >= bt.TimeFrame.Days
+        # 每个bar的浮点数时间和价值保存在数组中，调用get_analysis的时候才转换成字典
+        self._dtline = self.strategy.datetime
+        self._vtimes = _seriesarray()
+        self._vcols = [_seriesarray()
+                       for i in range(len(self.datas) + self.p.cash)]
+        self._vdone = 0  # 已经转换到rets中的bar的数目
 
     # 每个bar调用一次
     def next(self):
+        broker = self.strategy.broker
+        self._vtimes.append(self._dtline[0])
         # 获取每个数据的value
-        pvals = [self.strategy.broker.get_value([d]) for d in self.datas]
+        for d, col in zip(self.datas, self._vcols):
+            col.append(broker.get_value([d]))
         # 如果cash是True的话，保存cash
         if self.p.cash:
-            pvals.append(self.strategy.broker.get_cash())
-        # 如果usedate是True,使用date作为key,否则使用datetime作为key
-        if self._usedate:
-            self.rets[self.strategy.datetime.date()] = pvals
-        else:
-            self.rets[self.strategy.datetime.datetime()] = pvals
-    
+            self._vcols[-1].append(broker.get_cash())
+
+    # 把新的bar的价值转换到rets中
+    def get_analysis(self):
+        done, self._vdone = self._vdone, len(self._vtimes)
+        if done < self._vdone:
+            dts = _num2dates(self._vtimes[done:], tz=self._dtline._tz)
+            # 如果usedate是True,使用date作为key,否则使用datetime作为key
+            if self._usedate:
+                dts = [dt.date() for dt in dts]
+
+            cols = [col[done:].tolist() for col in self._vcols]
+            self.rets.update(zip(dts, map(list, zip(*cols))))
+
+        return self.rets
@@ -21,6 +21,11 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import math
 
 import backtrader as bt
@@ -158,3 +163,7 @@ class Returns(TimeFrameAnalyzerBase):
 
     def _on_dt_over(self):
         self._tcount += 1  # count the subperiod
+
+    # 运行结束之后一次统计subperiod
+    def postrun(self, record):
+        self._tcount += int(np.count_nonzero(self._postrun_dtover(record)))
@@ -29,6 +29,13 @@ from backtrader import Analyzer, TimeFrame
 from backtrader.mathsupport import average, standarddev
 from backtrader.analyzers import TimeReturn, AnnualReturn
 
+# 编译之后的函数(在utils/cal_return_sharpe_drawdown中编译)，没有编译的时候使用python计算
+try:
+    from backtrader.utils.cal_return_sharpe_drawdown.cal_return_sharpe_drawdown \
+        import cal_sharpe_stats_cy
+except ImportError:
+    cal_sharpe_stats_cy = None
+
 
 class SharpeRatio(Analyzer):
     # 相对来说，backtrader计算夏普率的方式其实蛮复杂的，考虑了很多的参数
@@ -143,6 +150,10 @@ class SharpeRatio(Analyzer):
                 compression=self.p.compression,
                 fund=self.p.fund)
 
+    # 收益率由子analyzer在运行结束之后计算
+    def postrun(self, record):
+        pass
+
     def stop(self):
         super(SharpeRatio, self).stop()
         # 以年为单位计算收益率和夏普率
@@ -193,11 +204,20 @@ class SharpeRatio(Analyzer):
             if lrets:
                 # Get the excess returns - arithmetic mean - original sharpe
                 # 计算得到每日的超额收益率
-                ret_free = [r - rate for r in returns]
-                # 计算得到每日的超额收益率的平均值
-                ret_free_avg = average(ret_free)
-                # 计算得到每日超额收益率的波动率
-                retdev = standarddev(ret_free, avgx=ret_free_avg, bessel=self.p.stddev_sample)
+                # 有编译之后的函数的时候直接计算平均值和波动率，结果和python一样
+                stats = None
+                if cal_sharpe_stats_cy is not None:
+                    stats = cal_sharpe_stats_cy(returns, rate,
+                                                int(self.p.stddev_sample))
+
+                if stats is not None:
+                    ret_free_avg, retdev = stats
+                else:
+                    ret_free = [r - rate for r in returns]
+                    # 计算得到每日的超额收益率的平均值
+                    ret_free_avg = average(ret_free)
+                    # 计算得到每日超额收益率的波动率
+                    retdev = standarddev(ret_free, avgx=ret_free_avg, bessel=self.p.stddev_sample)
                 # ret_avg = average(returns)
                 # retdev = standarddev(returns, avgx=ret_avg,bessel=self.p.stddev_sample)
 
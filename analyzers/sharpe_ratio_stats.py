@@ -2,7 +2,11 @@
 import numpy as np
 import pandas as pd
 from scipy import stats as scipy_stats
-from backtrader.analyzers import my_corr
+# 编译之后的函数(在analyzers/my_corr中编译)，没有编译的时候使用pandas计算
+try:
+    from backtrader.analyzers.my_corr import my_corr
+except ImportError:
+    my_corr = None
 
 def estimated_sharpe_ratio(returns):
     """
@@ -227,9 +231,11 @@ def num_independent_trials(trials_returns=None, *, m=None, p=None):
         m = trials_returns.shape[1]
         
     if p is None:
-        # corr_matrix = trials_returns.corr()
-        # p = corr_matrix.values[np.triu_indices_from(corr_matrix.values,1)].mean()
-        p = my_corr.main(trials_returns)
+        if my_corr is not None:
+            p = my_corr.main(trials_returns)
+        else:
+            corr_matrix = trials_returns.corr()
+            p = corr_matrix.values[np.triu_indices_from(corr_matrix.values,1)].mean()
         
     n = p + (1 - p) * m
     
@@ -74,6 +74,11 @@ class SQN(Analyzer):
             self.pnl.append(trade.pnlcomm)
             self.count += 1
 
+    # 运行结束之后按顺序处理记录的交易
+    def postrun(self, record):
+        for cycle, trade in record.trades:
+            self.notify_trade(trade)
+
     # 停止，计算sqn指标，如果交易次数大于0，sqn等于交易盈利的平均值*交易次数的平方根/交易盈利的标准差
     def stop(self):
         if self.count > 1:
@@ -21,7 +21,13 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from backtrader import TimeFrameAnalyzerBase
+from backtrader.analyzer import _seriesarray
 
 
 class TimeReturn(TimeFrameAnalyzerBase):
@@ -86,6 +92,15 @@ class TimeReturn(TimeFrameAnalyzerBase):
 
         Returns a dictionary with returns as values and the datetime points for
         each return as keys
+
+      - getret(dtkey=None)
+
+        Returns the return of the period ``dtkey`` (the current period if
+        ``None``) or ``NaN`` if not available
+
+    The returns are kept in arrays indexed by the float datetime of the
+    beginning of each period and the dictionary is only created (and updated)
+    when calling ``get_analysis``
     '''
     # 参数
     params = (
@@ -112,6 +127,14 @@ class TimeReturn(TimeFrameAnalyzerBase):
             else:
                 self._lastvalue = self.strategy.broker.fundvalue
 
+        # 每个周期的收益率保存在数组中，时间是每个周期第一个bar的浮点数时间，
+        # 调用get_analysis的时候才转换成以dtkey为key的字典
+        self._rettimes = _seriesarray()
+        self._retvalues = _seriesarray()
+        self._retdt = None  # 当前周期开始的时间
+        self._ret = None  # 当前周期的收益率
+        self._retsdone = 0  # 已经转换到rets中的周期的数目
+
     # 通知fund信息
     def notify_fund(self, cash, value, fundvalue, shares):
         if not self._fundmode:
@@ -127,6 +150,14 @@ class TimeReturn(TimeFrameAnalyzerBase):
                 self._value = self.p.data[0]  # the data value if tracking data
     # on_dt_over
     def on_dt_over(self):
+        # 保存上个周期的收益率
+        if self._ret is not None:
+            self._rettimes.append(self._retdt)
+            self._retvalues.append(self._ret)
+            self._ret = None
+
+        self._retdt = self._dtline[0]
+
         # next is called in a new timeframe period
         # if self.p.data is None or len(self.p.data) > 1:
         if self.p.data is None or self._lastvalue is not None:
@@ -142,7 +173,67 @@ class TimeReturn(TimeFrameAnalyzerBase):
     def next(self):
         # Calculate the return
         super(TimeReturn, self).next()
-        # self.dtkey是analyzer中设置的属性值，一般是一个period结束的日期
-        self.rets[self.dtkey] = (self._value / self._value_start) - 1.0
-        # self.rets[self.dtkey] = (float(self._value) / float(self._value_start)) - 1.0
+        # 当前周期(self.dtkey)的收益率
+        self._ret = (self._value / self._value_start) - 1.0
         self._lastvalue = self._value  # keep last value
+
+    # 只有跟踪账户价值的时候才能在运行结束之后计算
+    def _canpostrun(self):
+        return (self.p.data is None and
+                super(TimeReturn, self)._canpostrun())
+
+    # 运行结束之后根据记录的价值一次计算每个周期的收益率
+    def postrun(self, record):
+        values = record.fundvalue if self._fundmode else record.value
+        if not len(values):
+            return
+
+        overs = self._postrun_dtover(record)
+        nexts = self._postrun_nexts(record)
+        steps = np.flatnonzero(overs)
+        nextsteps = np.flatnonzero(nexts)
+
+        # 每个周期开始的价值是之前最后一个调用next的bar的价值
+        idx = np.arange(len(values))
+        lastnexts = np.maximum.accumulate(np.where(nexts, idx, -1))
+        lastvalues = np.append(self._lastvalue, values)
+        value_starts = lastvalues[np.append(0, lastnexts[:-1] + 1)[steps]]
+
+        # 计算每个next的收益率，每个周期保留最后一个
+        periods = np.cumsum(overs)[nextsteps] - 1
+        rets = values[nextsteps] / value_starts[periods] - 1.0
+        lasts = np.diff(np.append(periods, len(steps))) != 0
+        periods, rets = periods[lasts], rets[lasts]
+
+        # 最后一个周期还没有结束
+        closed = periods < len(steps) - 1
+        self._rettimes.extend(record.datetime[steps[periods[closed]]])
+        self._retvalues.extend(rets[closed])
+        if len(periods) and not closed[-1]:
+            self._ret = float(rets[-1])
+
+        self._retdt = float(record.datetime[steps[-1]])
+        self._value_start = float(value_starts[-1])
+        self._value = float(values[-1])
+        if len(nextsteps):
+            self._lastvalue = float(values[nextsteps[-1]])
+
+    # 获取某个周期的收益率
+    def getret(self, dtkey=None):
+        if dtkey is None or dtkey == self.dtkey:
+            return self._ret if self._ret is not None else float('NaN')
+
+        return self.get_analysis().get(dtkey, float('NaN'))
+
+    # 把新的周期的收益率转换到rets中
+    def get_analysis(self):
+        rets = self.rets
+        done, self._retsdone = self._retsdone, len(self._rettimes)
+        if done < self._retsdone:
+            dtkeys = self._get_dtkeys(self._rettimes[done:])
+            rets.update(zip(dtkeys, self._retvalues[done:].tolist()))
+
+        if self._ret is not None:
+            rets[self.dtkey] = self._ret
+
+        return rets
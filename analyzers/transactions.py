@@ -25,6 +25,7 @@ from __future__ import (absolute_import, division, print_function,
 import collections
 
 import backtrader as bt
+from backtrader.analyzer import _num2dates, _seriesarray
 from backtrader import Order, Position
 
 # 交易
@@ -56,6 +57,10 @@ class Transactions(bt.Analyzer):
 
         Returns a dictionary with returns as values and the datetime points for
         each return as keys
+
+    The transactions are kept indexed by the float datetime of the bars in
+    which they happened and the dictionary is only created (and updated) when
+    calling ``get_analysis``
     '''
     # 参数
     params = (
@@ -72,6 +77,11 @@ class Transactions(bt.Analyzer):
         self._positions = collections.defaultdict(Position)
         # index和数据名字
         self._idnames = list(enumerate(self.strategy.getdatanames()))
+        # 有交易的bar的浮点数时间和交易记录，调用get_analysis的时候才转换成字典
+        self._dtline = self.strategy.datetime
+        self._ttimes = _seriesarray()
+        self._tentries = []
+        self._tdone = 0  # 已经转换到rets中的交易记录的数目
 
     # 订单信息处理
     def notify_order(self, order):
@@ -96,6 +106,9 @@ class Transactions(bt.Analyzer):
     # 每个bar调用一次
     def next(self):
         # super(Transactions, self).next()  # let dtkey update
+        # 这个bar没有成交
+        if not self._positions:
+            return
         # 入场
         entries = []
         # 对于index和数据名称
@@ -107,8 +120,18 @@ class Transactions(bt.Analyzer):
                 size, price = pos.size, pos.price
                 if size:
                     entries.append([size, price, i, dname, -size * price])
-        # 如果持仓不是0的话，更新当前bar的持仓数据
+        # 如果持仓不是0的话，保存当前bar的持仓数据
         if entries:
-            self.rets[self.strategy.datetime.datetime()] = entries
+            self._ttimes.append(self._dtline[0])
+            self._tentries.append(entries)
         # 清空self._positions
         self._positions.clear()
+
+    # 把新的交易记录转换到rets中
+    def get_analysis(self):
+        done, self._tdone = self._tdone, len(self._ttimes)
+        if done < self._tdone:
+            dts = _num2dates(self._ttimes[done:], tz=self._dtline._tz)
+            self.rets.update(zip(dts, self._tentries[done:]))
+
+        return self.rets
@@ -21,6 +21,11 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import math
 
 import backtrader as bt
@@ -178,5 +183,22 @@ class VWR(TimeFrameAnalyzerBase):
         self._pis.append(self._pns[-1])  # last pn is pi in next period
         self._pns.append(None)  # placeholder for [-1] operation
 
+    # 运行结束之后根据记录的价值一次得到每个period的开始和结束的值
+    def postrun(self, record):
+        steps = np.flatnonzero(self._postrun_dtover(record))
+        values = record.fundvalue if self._fundmode else record.value
+        if not len(values):
+            return
+
+        pns = values[steps].tolist()
+        self._pis.extend(pns)  # last pn is pi in next period
+        # 最后一个period如果没有值的话是None
+        if len(steps) and steps[-1] == len(values) - 1:
+            pns.append(None)
+        else:
+            pns.append(float(values[-1]))
+
+        self._pns[-1:] = pns
+
 
 VariabilityWeightedReturn = VWR
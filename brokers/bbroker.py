@@ -21,18 +21,160 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import bisect
 import collections
 import datetime
+import itertools
 
 import backtrader as bt
-# from backtrader.comminfo import CommInfoBase
-from backtrader.order import Order, BuyOrder, SellOrder
+from backtrader.comminfo import CommInfoBase
+from backtrader.order import (Order, BuyOrder, SellOrder, LightBuyOrder,
+                              LightSellOrder)
 from backtrader.position import Position
 from backtrader.utils.py3 import string_types, integer_types
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 __all__ = ['BackBroker', 'BrokerBack']
 
 
+# 用数组计算全部持仓的价值时使用的持仓的数据
+class _ValueBook(object):
+    '''
+    Parallel arrays with the size, price, multiplier, margin, leverage and
+    stock-like flag of the open positions of a broker
+
+      - ``datas``: the datas of the open positions (same order as the arrays)
+
+      - ``custom``: index of the positions whose commission scheme
+        overrides the valuation methods and is valued by the scheme itself
+
+    The arrays are valid as long as no execution happens (the broker drops
+    the book) and neither the commission schemes nor their parameters change
+    '''
+
+    _methods = ('getvalue', 'getvaluesize', 'profitandloss', 'get_leverage',
+                'get_margin')
+
+    def __init__(self, broker, opened):
+        self.datas = [data for data, pos in opened]
+        self.custom = list()
+        self.comminfo = dict(broker.comminfo)
+        cstates = dict()
+        rows = list()
+        for i, (data, pos) in enumerate(opened):
+            comminfo = broker.getcommissioninfo(data)
+            cstates[id(comminfo)] = (comminfo, dict(comminfo.__dict__),
+                                     dict(comminfo.p.__dict__))
+            if not self.vectorizable(comminfo):
+                self.custom.append(i)
+                rows.append((0.0, 0.0, 1.0, 0.0, 1.0, True))
+                continue
+
+            rows.append((pos.size, pos.price, comminfo.p.mult,
+                         comminfo.p.margin or 0.0, comminfo.get_leverage(),
+                         comminfo._stocklike))
+
+        self.cstates = list(cstates.values())
+        size, price, mult, margin, lev, stocklike = zip(*rows)
+        self.size = np.array(size, dtype=np.float64)
+        self.price = np.array(price, dtype=np.float64)
+        self.mult = np.array(mult, dtype=np.float64)
+        self.margin = np.array(margin, dtype=np.float64)
+        self.lev = np.array(lev, dtype=np.float64)
+        self.stocklike = np.array(stocklike, dtype=bool)
+
+    @classmethod
+    def vectorizable(cls, comminfo):
+        # 佣金类计算持仓价值的方法都是CommInfoBase中的方法
+        ccls = type(comminfo)
+        return (not comminfo.p.automargin and
+                all(getattr(ccls, name) is getattr(CommInfoBase, name)
+                    for name in cls._methods))
+
+    def valid(self, broker):
+        # 佣金类和佣金类的参数都没有变化
+        return (self.comminfo == broker.comminfo and
+                all(c.__dict__ == cdict and c.p.__dict__ == pdict
+                    for c, cdict, pdict in self.cstates))
+
+
+# 一个数据上待成交的订单，按照触发价格和到期时间排序
+class _OrderBook(object):
+    '''
+    Pending orders of a data indexed by trigger price and expiration
+
+      - ``below``: ``(price, seq, order)`` of the orders which can execute
+        when the bar reaches down to ``price`` (buy limit, sell stop)
+
+      - ``above``: ``(price, seq, order)`` of the orders which can execute
+        when the bar reaches up to ``price`` (sell limit, buy stop)
+
+      - ``expiring``: ``(valid, seq, order)`` of the orders with a validity
+
+      - ``always``: orders which have to be checked on each bar (market,
+        close, trailing, ...) indexed by ``seq``
+
+    ``seq`` is the position of the order in the pending queue
+    '''
+
+    def __init__(self):
+        self.below = list()
+        self.above = list()
+        self.expiring = list()
+        self.always = dict()
+
+    def __bool__(self):
+        return bool(self.below or self.above or self.expiring or self.always)
+
+    __nonzero__ = __bool__
+
+    def candidates(self, data, cands):
+        '''Adds to ``cands`` (``seq: order``) the orders which may expire or
+        execute with the current bar of ``data``'''
+        cands.update(self.always)
+
+        if self.expiring:
+            # order.expire: data.datetime[0] > valid
+            i = bisect.bisect_left(self.expiring, (data.datetime[0],))
+            for valid, seq, order in self.expiring[:i]:
+                cands[seq] = order
+
+        if not (self.below or self.above):
+            return
+
+        # 和_try_exec中使用一样的价格
+        popen = getattr(data, 'tick_open', None)
+        if popen is None:
+            popen = data.open[0]
+        phigh = getattr(data, 'tick_high', None)
+        if phigh is None:
+            phigh = data.high[0]
+        plow = getattr(data, 'tick_low', None)
+        if plow is None:
+            plow = data.low[0]
+
+        # price >= popen or price >= plow (NaN never executes)
+        if self.below:
+            lows = [p for p in (popen, plow) if p == p]
+            if lows:
+                i = bisect.bisect_left(self.below, (min(lows),))
+                for price, seq, order in self.below[i:]:
+                    cands[seq] = order
+
+        # price <= popen or price <= phigh
+        if self.above:
+            highs = [p for p in (popen, phigh) if p == p]
+            if highs:
+                i = bisect.bisect_right(self.above,
+                                        (max(highs), float('inf')))
+                for price, seq, order in self.above[:i]:
+                    cands[seq] = order
+
+
 # 这个是回测的时候使用的类
 class BackBroker(bt.BrokerBase):
     """Broker Simulator
@@ -259,6 +401,21 @@ class BackBroker(bt.BrokerBase):
           the total net asset value
           # 如果fundmode设置成True的话，一些analyzers，比如TimeReturn将会使用fund value计算收益
 
+        - ``lightorders`` (default: ``False``)
+
+          If ``True`` the orders are created as ``LightBuyOrder`` and
+          ``LightSellOrder``, which keep the same attributes and methods as
+          ``Order`` in ``__slots__`` and are much cheaper to create. They are
+          not instances of ``Order``
+          # 高频策略会创建大量订单，使用轻量级订单可以减少创建订单的时间
+
+        - ``histretain`` (default: ``None``)
+
+          Which of the submitted orders are kept in ``orders``. ``None`` keeps
+          all of them, ``'open'`` keeps only the orders which are alive and an
+          ``int`` keeps the last ``histretain`` orders
+          # 长时间的回测中，保存所有的订单会占用大量的内存
+
     """
     # 参数
     params = (
@@ -279,6 +436,8 @@ class BackBroker(bt.BrokerBase):
         ('shortcash', True),
         ('fundstartval', 100.0),
         ('fundmode', False),
+        ('lightorders', False),
+        ('histretain', None),
     )
 
     # 创建实例的时候初始化
@@ -313,11 +472,19 @@ class BackBroker(bt.BrokerBase):
         self.orders = list()  # will only be appending
         # 双向队列
         self.pending = collections.deque()  # popleft and append(right)
+        # 按照数据索引的待成交订单，只检查可能会成交或者到期的订单
+        self._books = dict()  # data -> _OrderBook
+        self._booked = dict()  # order.ref -> (seq, data, entries in books)
+        self._bookseq = itertools.count()
+        self._execseq = None  # seq of the order being processed in next
         self._toactivate = collections.deque()  # to activate in next cycle
         # 持仓
         self.positions = collections.defaultdict(Position)
         # 利息率
         self.d_credit = collections.defaultdict(float)  # credit per data
+        # 有持仓的数据和计算持仓价值的数组，持仓或者佣金类变化之后重新生成
+        self._posopen = None  # [(data, position)] with an open position
+        self._valbook = None  # arrays to value the open positions
         # 通知信息的双向队列
         self.notifs = collections.deque()
         # 提交的双向队列
@@ -388,6 +555,16 @@ class BackBroker(bt.BrokerBase):
         # Configure the shortcash parameters
         self.p.shortcash = shortcash
 
+    # 设置保存哪些提交过的订单
+    def set_histretain(self, histretain):
+        '''Sets the retention of the submitted orders kept in ``orders``'''
+        self.p.histretain = histretain
+
+    # 设置是否使用轻量级订单
+    def set_lightorders(self, lightorders):
+        '''Use ``LightOrder`` instances for the orders if ``True``'''
+        self.p.lightorders = lightorders
+
     # 设置百分比滑点相关的信息
     def set_slippage_perc(self, perc,
                           slip_open=True, slip_limit=True,
@@ -465,12 +642,18 @@ class BackBroker(bt.BrokerBase):
 
     # 取消订单
     def cancel(self, order, bracket=False):
+        # an order which is no longer alive is not pending (it may still be in
+        # the queue while being processed in next)
+        if not order.alive():
+            return False
+
         try:
             self.pending.remove(order)
         except ValueError:
             # If the list didn't have the element we didn't cancel anything
             return False
 
+        self._unbook(order)
         order.cancel()
         self.notify(order)
         self._ococheck(order)
@@ -512,8 +695,13 @@ class BackBroker(bt.BrokerBase):
             self._fundshares += c / self._fundval
             self.cash += c
 
+        # 计算全部持仓的价值的时候，只重新计算价格或者持仓变化了的数据
+        if not datas:
+            pos_value, pos_value_unlever, unrealized = self._get_posvalues()
+            datas = ()  # skip the loop below
+
         # 如果datas是None的话，循环self.positions，如果datas不是None的话，循环datas
-        for data in datas or self.positions:
+        for data in datas:
             # 获取佣金相关信息
             comminfo = self.getcommissioninfo(data)
             # 获取data的持仓
@@ -591,6 +779,147 @@ class BackBroker(bt.BrokerBase):
 
         return self._value if not lever else self._valuelever
 
+    # 有持仓的数据和持仓，按照self.positions的顺序
+    def _openpositions(self):
+        '''
+        Returns a list of ``(data, position)`` with the open positions, in
+        the order of ``self.positions``. The list is only rebuilt after an
+        execution
+        '''
+        if self._posopen is None:
+            self._posopen = [(data, pos)
+                             for data, pos in self.positions.items() if pos]
+
+        return self._posopen
+
+    # 使用佣金类的方法计算一个持仓的价值，未实现的利润和未加杠杆的价值
+    def _posterms(self, data, position):
+        comminfo = self.getcommissioninfo(data)
+        close = data.close[0]
+        # use valuesize:  returns raw value, rather than negative adj val
+        if not self.p.shortcash:
+            dvalue = comminfo.getvalue(position, close)
+        else:
+            dvalue = comminfo.getvaluesize(position.size, close)
+
+        dunrealized = comminfo.profitandloss(position.size, position.price,
+                                             close)
+        if not self.p.shortcash:
+            dvalue = abs(dvalue)  # short selling adds value in this case
+
+        # 多头的时候，分两次累加未加杠杆的价值
+        if dvalue > 0:  # long position - unlever
+            unlever = (dvalue - dunrealized) / comminfo.get_leverage()
+            return dvalue, dunrealized, unlever, dunrealized
+
+        return dvalue, dunrealized, dvalue, None
+
+    # 持仓个数达到这个值的时候，使用数组计算持仓的价值
+    _valarraymin = 16
+
+    # 计算全部持仓的价值
+    def _get_posvalues(self):
+        '''
+        Returns the sums of the value, unlevered value and unrealized profit
+        of the open positions (closed positions add nothing)
+
+        With many open positions the terms are calculated on arrays holding
+        the size, price, multiplier, margin and leverage of the positions,
+        which are only rebuilt after an execution or a change in the
+        commission schemes. The sums are accumulated in the order of the
+        positions, to deliver exactly the values of evaluating each data
+        '''
+        opened = self._openpositions()
+        if np is None or len(opened) < self._valarraymin:
+            pos_value = pos_value_unlever = unrealized = 0.0
+            for data, position in opened:
+                dvalue, dunrealized, unlever, unlever2 = \
+                    self._posterms(data, position)
+                pos_value += dvalue
+                unrealized += dunrealized
+                pos_value_unlever += unlever
+                if unlever2 is not None:
+                    pos_value_unlever += unlever2
+
+            return pos_value, pos_value_unlever, unrealized
+
+        book = self._valuebook(opened)
+        close = np.array([data.close[0] for data in book.datas],
+                         dtype=np.float64)
+        size, price = book.size, book.price
+        with np.errstate(all='ignore'):
+            if self.p.shortcash:
+                stockvalue = size * close
+            else:
+                # 空头的价值是开仓的价值加上价格下跌增加的价值
+                stockvalue = np.where(size >= 0, size * close,
+                                      price * size + (price - close) * size)
+
+            dvalue = np.where(book.stocklike, stockvalue,
+                              np.abs(size) * book.margin)
+            dunrealized = size * (close - price) * book.mult
+            if not self.p.shortcash:
+                dvalue = np.abs(dvalue)  # short selling adds value
+
+            # 两列依次累加：多头是未加杠杆的价值和未实现的利润，否则是价值和0
+            long_ = dvalue > 0
+            unlever = np.empty((len(size), 2))
+            unlever[:, 0] = np.where(long_, (dvalue - dunrealized) / book.lev,
+                                     dvalue)
+            unlever[:, 1] = np.where(long_, dunrealized, 0.0)
+
+        # 佣金类重写了计算方法的持仓，使用佣金类计算
+        for i in book.custom:
+            data, position = opened[i]
+            terms = self._posterms(data, position)
+            dvalue[i], dunrealized[i], unlever[i, 0] = terms[:3]
+            unlever[i, 1] = 0.0 if terms[3] is None else terms[3]
+
+        # 按照顺序累加(np.sum的成对求和会有不同的舍入)，加0.0去掉负0
+        return (float(np.add.accumulate(dvalue)[-1]) + 0.0,
+                float(np.add.accumulate(unlever.ravel())[-1]) + 0.0,
+                float(np.add.accumulate(dunrealized)[-1]) + 0.0)
+
+    # 计算持仓价值的数组，持仓或者佣金类没有变化的时候重复使用
+    def _valuebook(self, opened):
+        book = self._valbook
+        if book is None or not book.valid(self):
+            book = self._valbook = _ValueBook(self, opened)
+
+        return book
+
+    # 判断佣金类是否会产生利息
+    @staticmethod
+    def _chargescredit(comminfo):
+        # 没有重写利息的计算方法，并且利率是0的时候，利息一定是0
+        cls = type(comminfo)
+        return (comminfo._creditrate or
+                cls.get_credit_interest is not
+                CommInfoBase.get_credit_interest or
+                cls._get_credit_interest is not
+                CommInfoBase._get_credit_interest)
+
+    # 判断next是否只会重新计算持仓的价值，用于跳过没有事件的bar
+    def _isidle(self):
+        '''
+        Returns ``True`` if ``next`` would do nothing but revaluing the
+        positions and marking their datetime: no order is submitted, pending or to be activated, no
+        order/fund history or cash addition has to be processed and no open
+        position is charged credit interest or adjusted in cash every bar
+        '''
+        if (self.submitted or self.pending or self._toactivate or
+                self.notifs or self._userhist or self._fundhist or
+                self._cash_addition):
+            return False
+
+        for data, pos in self._openpositions():
+            comminfo = self.getcommissioninfo(data)
+            if (self._chargescredit(comminfo) or not comminfo._stocklike or
+                    type(comminfo).cashadjust is not CommInfoBase.cashadjust):
+                return False
+
+        return True
+
     # 获取杠杆
     def get_leverage(self):
         return self._leverage
@@ -719,9 +1048,81 @@ class BackBroker(bt.BrokerBase):
         order.accept()
         # 把订单添加到待成交订单里
         self.pending.append(order)
+        self._book(order)
         # 通知订单状态
         self.notify(order)
 
+    # 获取订单的触发价格，和订单是在价格向下还是向上达到触发价格的时候成交
+    def _booktrigger(self, order):
+        exectype = order.exectype
+        if exectype == Order.Limit:
+            price, below = order.created.price, order.isbuy()
+        elif exectype == Order.Stop:
+            price, below = order.created.price, not order.isbuy()
+        elif exectype == Order.StopLimit:
+            if order.triggered:  # executes as a limit order
+                price, below = order.created.pricelimit, order.isbuy()
+            else:
+                price, below = order.created.price, not order.isbuy()
+        else:
+            return None, None  # checked on each bar
+
+        if price is None or price != price:  # can never execute
+            return None, None
+
+        return price, below
+
+    # 把订单加入到订单所属数据的订单簿中
+    def _book(self, order, seq=None):
+        if seq is None:
+            seq = next(self._bookseq)
+
+        book = self._books.get(order.data)
+        if book is None:
+            book = self._books[order.data] = _OrderBook()
+
+        entries = list()
+        if order.valid and order.exectype != Order.Market:
+            entry = (order.valid, seq, order)
+            bisect.insort(book.expiring, entry)
+            entries.append((book.expiring, entry))
+
+        # 没有激活的订单只可能到期
+        if order.active():
+            price, below = self._booktrigger(order)
+            if price is None:
+                book.always[seq] = order
+                entries.append((book.always, seq))
+            else:
+                entry = (price, seq, order)
+                lst = book.below if below else book.above
+                bisect.insort(lst, entry)
+                entries.append((lst, entry))
+
+        self._booked[order.ref] = (seq, order.data, entries)
+
+    # 把订单从订单簿中删除，返回订单的seq
+    def _unbook(self, order):
+        # order may be a clone (get_orders_open), use the booked data
+        seq, data, entries = self._booked.pop(order.ref, (None, None, ()))
+        for lst, entry in entries:
+            if isinstance(lst, dict):
+                del lst[entry]
+            else:
+                del lst[bisect.bisect_left(lst, entry)]
+
+        # inactive orders without validity are not in the book
+        if data in self._books and not self._books[data]:
+            del self._books[data]
+
+        return seq
+
+    # 订单的触发价格或者激活状态变化之后，重新加入订单簿
+    def _rebook(self, order):
+        seq = self._unbook(order)
+        if seq is not None:
+            self._book(order, seq)
+
     # 删除订单或者把订单活跃状态变成不活跃
     def _bracketize(self, order, cancel=False):
         # 订单id
@@ -753,12 +1154,24 @@ class BackBroker(bt.BrokerBase):
         ocoref = self._ocos.get(parentref, None)
         ocol = self._ocol.pop(ocoref, None)
         if ocol:
-            for i in range(len(self.pending) - 1, -1, -1):
-                o = self.pending[i]
-                if o is not None and o.ref in ocol:
-                    del self.pending[i]
-                    o.cancel()
-                    self.notify(o)
+            idxs = [i for i, o in enumerate(self.pending)
+                    if o is not order and o.ref in ocol and o.alive()]
+            ocos = [self.pending[i] for i in idxs]
+            for i in reversed(idxs):
+                del self.pending[i]
+
+            # 取消的顺序和按照顺序轮流处理待成交订单的时候一样：先取消已经处理过
+            # 的订单，再取消还没有处理的订单，都是从后往前
+            if self._execseq is not None:
+                done = [o for o in ocos
+                        if self._booked[o.ref][0] < self._execseq]
+                ocos = [o for o in ocos
+                        if self._booked[o.ref][0] > self._execseq] + done
+
+            for o in reversed(ocos):
+                self._unbook(o)
+                o.cancel()
+                self.notify(o)
 
     # oco订单的操作
     def _ocoize(self, order, oco):
@@ -797,12 +1210,13 @@ class BackBroker(bt.BrokerBase):
             histnotify=False, _checksubmit=True,
             **kwargs):
 
-        order = BuyOrder(owner=owner, data=data,
-                         size=size, price=price, pricelimit=plimit,
-                         exectype=exectype, valid=valid, tradeid=tradeid,
-                         trailamount=trailamount, trailpercent=trailpercent,
-                         parent=parent, transmit=transmit,
-                         histnotify=histnotify)
+        ocls = LightBuyOrder if self.p.lightorders else BuyOrder
+        order = ocls(owner=owner, data=data,
+                     size=size, price=price, pricelimit=plimit,
+                     exectype=exectype, valid=valid, tradeid=tradeid,
+                     trailamount=trailamount, trailpercent=trailpercent,
+                     parent=parent, transmit=transmit,
+                     histnotify=histnotify)
 
         order.addinfo(**kwargs)
         self._ocoize(order, oco)
@@ -818,12 +1232,13 @@ class BackBroker(bt.BrokerBase):
              histnotify=False, _checksubmit=True,
              **kwargs):
 
-        order = SellOrder(owner=owner, data=data,
-                          size=size, price=price, pricelimit=plimit,
-                          exectype=exectype, valid=valid, tradeid=tradeid,
-                          trailamount=trailamount, trailpercent=trailpercent,
-                          parent=parent, transmit=transmit,
-                          histnotify=histnotify)
+        ocls = LightSellOrder if self.p.lightorders else SellOrder
+        order = ocls(owner=owner, data=data,
+                     size=size, price=price, pricelimit=plimit,
+                     exectype=exectype, valid=valid, tradeid=tradeid,
+                     trailamount=trailamount, trailpercent=trailpercent,
+                     parent=parent, transmit=transmit,
+                     histnotify=histnotify)
 
         order.addinfo(**kwargs)
         self._ocoize(order, oco)
@@ -1003,6 +1418,7 @@ class BackBroker(bt.BrokerBase):
             # do a real position update if something was executed
             # 更新position
             position.update(execsize, price, data.datetime.datetime())
+            self._posopen = self._valbook = None  # rebuild on next valuation
             # 如果是closed并且把利息转成pnl的话，平仓的时候佣金要加上利息费用
             if closed and self.p.int2pnl:  # Assign accumulated interest data
                 closedcomm += self.d_credit.pop(data, 0.0)
@@ -1037,6 +1453,24 @@ class BackBroker(bt.BrokerBase):
     def _try_exec_historical(self, order):
         self._execute(order, ago=0, price=order.created.price)
 
+    # 不处理新的bar，立即执行待成交的历史订单，cerebro在运行结束的时候用于平掉退出的数据的持仓
+    def _exechistorical(self):
+        '''
+        Executes the pending ``Historical`` orders without processing a new
+        bar and without touching the other pending orders
+        '''
+        orders = [o for o in self.pending
+                  if o.exectype == Order.Historical and o.alive()]
+        for order in orders:
+            self._try_exec_historical(order)
+            self._unbook(order)
+
+        if orders:
+            pending = [o for o in self.pending if o.alive()]
+            self.pending.clear()
+            self.pending.extend(pending)
+            self._get_value()  # update value
+
     # 尝试执行市价单
     def _try_exec_market(self, order, popen, phigh, plow):
         # ago = 0
@@ -1408,7 +1842,9 @@ class BackBroker(bt.BrokerBase):
     # next
     def next(self):
         while self._toactivate:
-            self._toactivate.popleft().activate()
+            order = self._toactivate.popleft()
+            order.activate()
+            self._rebook(order)
 
         if self.p.checksubmit:
             self.check_submitted()
@@ -1416,56 +1852,82 @@ class BackBroker(bt.BrokerBase):
         # Discount any cash for positions hold
         # 利息费用
         credit = 0.0
-        for data, pos in self.positions.items():
-            if pos:
+        # 所有的佣金类都不会产生利息的时候，只需要记录计算利息的时间
+        chargescredit = any(self._chargescredit(c)
+                            for c in self.comminfo.values())
+        for data, pos in self._openpositions():
+            dt0 = data.datetime.datetime()
+            if chargescredit:
                 comminfo = self.getcommissioninfo(data)
-                dt0 = data.datetime.datetime()
                 dcredit = comminfo.get_credit_interest(data, pos, dt0)
                 self.d_credit[data] += dcredit
                 credit += dcredit
-                pos.datetime = dt0  # mark last credit operation
+            pos.datetime = dt0  # mark last credit operation
 
         self.cash -= credit
         # 处理order历史
         self._process_order_history()
 
         # Iterate once over all elements of the pending queue
-        # 给待成交的订单增加一个None
-        self.pending.append(None)
-        # 循环待成交的订单一遍，到None的时候，会break跳出
-        while True:
-            order = self.pending.popleft()
-            if order is None:
-                break
-
+        # 按照待成交订单的顺序，只处理可能到期或者成交的订单，其他订单的处理不会
+        # 有任何效果
+        cands = dict()
+        for data, book in self._books.items():
+            book.candidates(data, cands)
+
+        ended = False
+        for seq in sorted(cands):
+            order = cands[seq]
+            if not order.alive():
+                continue  # cancelled by a previous order (oco/bracket)
+
+            self._execseq = seq
             if order.expire():
+                ended = True
+                self._unbook(order)
                 self.notify(order)
                 self._ococheck(order)
                 self._bracketize(order, cancel=True)
 
             elif not order.active():
-                self.pending.append(order)  # cannot yet be processed
+                pass  # cannot yet be processed
 
             else:
                 self._try_exec(order)
                 if order.alive():
-                    self.pending.append(order)
+                    self._rebook(order)  # trigger may have changed
 
-                elif order.status == Order.Completed:
-                    # a bracket parent order may have been executed
-                    self._bracketize(order)
+                else:
+                    ended = True
+                    self._unbook(order)
+                    if order.status == Order.Completed:
+                        # a bracket parent order may have been executed
+                        self._bracketize(order)
+
+        self._execseq = None
+        if ended:  # remove the orders which are no longer pending
+            orders = [o for o in self.pending if o.alive()]
+            self.pending.clear()
+            self.pending.extend(orders)
+
+        retain = self.p.histretain
+        if retain == 'open':
+            self.orders = [o for o in self.orders if o.alive()]
+        elif retain is not None and len(self.orders) > retain:
+            del self.orders[:len(self.orders) - retain]
 
         # Operations have been executed ... adjust cash end of bar
         # 在bar结束的时候，根据持仓信息调整cash
-        for data, pos in self.positions.items():
+        for data, pos in self._openpositions():
             # futures change cash every bar
-            if pos:
-                comminfo = self.getcommissioninfo(data)
-                self.cash += comminfo.cashadjust(pos.size,
-                                                 pos.adjbase,
-                                                 data.close[0])
-                # record the last adjustment price
-                pos.adjbase = data.close[0]
+            close = data.close[0]
+            comminfo = self.getcommissioninfo(data)
+            # 股票类的资产调整的现金一定是0
+            if (not comminfo._stocklike or type(comminfo).cashadjust is
+                    not CommInfoBase.cashadjust):
+                self.cash += comminfo.cashadjust(pos.size, pos.adjbase, close)
+            # record the last adjustment price
+            pos.adjbase = close
 
         self._get_value()  # update value
 
@@ -23,13 +23,21 @@ from __future__ import (absolute_import, division, print_function,
 
 import datetime
 import collections
+import heapq
 import itertools
 import multiprocessing
+import os
+import tempfile
+import warnings
 try:  # For new Python versions
     collectionsAbc = collections.abc  # collections.Iterable -> collections.abc.Iterable
 except AttributeError:  # For old Python versions
     collectionsAbc = collections  # Используем collections.Iterable
 import backtrader as bt
+try:
+    import numpy as np
+except ImportError:
+    np = None
 from .utils.py3 import (map, range, zip, with_metaclass, string_types,
                         integer_types)
 
@@ -38,8 +46,9 @@ from . import indicator
 from .brokers import BackBroker
 from .metabase import MetaParams
 from . import observers
-from .writer import WriterFile
+from .writer import WriterFile, HistorySpill
 from .utils import OrderedDict, tzparse, num2date, date2num
+from .lineiterator import LineIterator
 from .strategy import Strategy, SignalStrategy
 from .tradingcal import (TradingCalendarBase, TradingCalendar,
                          PandasMarketCalendar)
@@ -54,6 +63,382 @@ class OptReturn(object):
             setattr(self, k, v)
 
 
+# 在_runnext中使用堆安排数据，每次循环只处理在最小的时间上有bar或者需要加载bar的数据
+class _DataHeap(object):
+    '''
+    Schedules the datas of ``Cerebro._runnext`` with a heap keyed on the
+    datetime of the next bar of each data. Each cycle only touches the datas
+    which deliver a bar or have to load one
+
+    Only usable if no data is live, a clone or has filters, because the next
+    bar of the datas can then be loaded and put back without side effects
+    '''
+
+    def __init__(self, datas):
+        self.datas = datas
+        self.heap = list()  # (datetime, index) of the datas with a next bar
+        self.polls = list()  # index of the datas which have to load a bar
+        for i, d in enumerate(datas):
+            if not d._retired:
+                self._schedule(i, d)
+
+    @staticmethod
+    def usable(datas):
+        return not any(d.islive() or d._clone or d._filters or d._ffilters
+                       for d in datas)
+
+    def _schedule(self, i, d):
+        # 数据中已经有下一个bar(预加载或者放回)的时候放到堆中，否则需要加载
+        if len(d) < d.buflen():
+            heapq.heappush(self.heap, (d.advance_peek(), i))
+        else:
+            self.polls.append(i)
+
+    def step(self):
+        '''
+        Moves the datas with a bar at the next datetime and returns
+        ``(ret, dt0, dmaster)``. ``ret`` has the meaning it has in the loop
+        of ``_runnext``: ``True`` for a bar, ``None`` if no bar is available
+        yet and ``False`` if no more bars are available
+        '''
+        datas, heap = self.datas, self.heap
+        polls, self.polls = self.polls, list()
+        loaded = list()
+        nones = list()
+        for i in polls:
+            d = datas[i]
+            if d._retired:
+                continue
+
+            ret = d.next(ticks=False)
+            if ret:
+                loaded.append((d.datetime[0], i))
+            elif ret is None:
+                nones.append(i)
+            else:
+                d.retire()  # no more bars
+
+        # 去掉已经退出事件循环的数据
+        while heap and datas[heap[0][1]]._retired:
+            heapq.heappop(heap)
+
+        if not heap and not loaded:
+            self.polls.extend(nones)
+            return (None if nones else False), None, None
+
+        dt0 = min(loaded)[0] if loaded else heap[0][0]
+        if heap and heap[0][0] < dt0:
+            dt0 = heap[0][0]
+
+        # 时间大于dt0的bar放回去，等于dt0的数据向前移动
+        delivered = list()
+        for dt, i in loaded:
+            if dt > dt0:
+                datas[i].rewind()  # cannot deliver yet
+                self._schedule(i, datas[i])
+            else:
+                delivered.append(i)
+
+        while heap and heap[0][0] <= dt0:
+            dt, i = heapq.heappop(heap)
+            d = datas[i]
+            if not d._retired:
+                d.next(ticks=False)
+                delivered.append(i)
+
+        dmaster = datas[min(delivered)]
+
+        # 没有bar的数据，使用主数据再尝试一次
+        for i in nones:
+            d = datas[i]
+            d._check(forcedata=dmaster)
+            if d.next(datamaster=dmaster, ticks=False):
+                delivered.append(i)
+            else:
+                self._schedule(i, d)
+
+        for i in delivered:
+            d = datas[i]
+            d._tick_fill(force=True)
+            self._schedule(i, d)
+
+        return True, dt0, dmaster
+
+
+# SignalStrategy中可能被用户重写的方法，重写之后不能跳过bar
+_SIGNALRUN_METHODS = ('prenext', 'nextstart', 'next', '_next_catch',
+                      '_next_signal', '_notify', '_oncepost', 'clear',
+                      'notify_order', 'notify_trade', 'notify_cashvalue',
+                      'notify_fund')
+
+
+# signalskipidle模式下运行只使用信号的SignalStrategy,跳过不会发生任何事情的bar，
+# 订单仍然通过sizer和broker处理
+class _SignalIdleRun(object):
+    '''
+    Runs a ``SignalStrategy`` which only operates with its signals (added
+    with ``cerebro.add_signal``) in ``runonce`` mode, processing only the
+    bars in which something can happen
+
+    The signals calculated by ``runonce`` are evaluated for all bars in a
+    single pass. A bar is processed by the broker and the strategy as usual
+    if the broker has something to do (pending orders, cash adjustments,
+    ...) or if the signals issue orders for the current side of the
+    position. In the other bars the datas, indicators and strategy are only
+    moved forward and the value of the broker is calculated for all of them
+    at once, with the same formulas used by the broker. The orders, trades
+    and final state are therefore the same as in a regular run
+
+    The results are kept as attributes (arrays with one entry per bar):
+
+      - ``datetime``, ``value``, ``cash`` and ``position`` (size)
+
+      - ``fills``: list of ``(datetime, ref, size, price, commission)`` with
+        the executions of the orders
+
+      - ``processed``: number of bars processed by the broker and strategy
+    '''
+
+    def __init__(self, cerebro, strategy):
+        self.cerebro = cerebro
+        self.strategy = strategy
+        self.data = data = cerebro.datas[0]
+        self.n = n = data.buflen()
+        self.datetime = np.asarray(data.lines.datetime.array)[:n].copy()
+        self.close = np.asarray(data.lines.close.array)[:n]
+        self.value = np.empty(n)
+        self.cash = np.empty(n)
+        self.position = np.empty(n)
+        self.fills = list()
+        self.processed = 0
+
+    @staticmethod
+    def unusable(cerebro, runstrats):
+        '''
+        Returns the reason why the system cannot be run by ``_SignalIdleRun``
+        or ``None`` if it can
+        '''
+        if np is None:
+            return 'numpy is not installed'
+
+        if len(runstrats) != 1 or len(cerebro.datas) != 1:
+            return 'only a strategy on a single data is supported'
+
+        strat, data = runstrats[0], cerebro.datas[0]
+        if not isinstance(strat, SignalStrategy):
+            return 'the strategy is not a SignalStrategy'
+
+        if hasattr(strat, '_next_custom') or strat._dtarget is not data:
+            return 'the strategy has its own next or another target data'
+
+        cls = type(strat)
+        if any(getattr(cls, name) is not getattr(SignalStrategy, name)
+               for name in _SIGNALRUN_METHODS):
+            return 'the strategy overrides methods of SignalStrategy'
+
+        if strat.analyzers or strat._slave_analyzers:
+            return 'analyzers are added'
+
+        if strat._lineiterators[LineIterator.ObsType]:
+            return 'observers are added (stdstats=True or addobserver)'
+
+        if cerebro.runwriters or cerebro._pretimers:
+            return 'writers or timers are added'
+
+        if data.islive() or cerebro._doreplay or cerebro.p.cheat_on_open:
+            return 'the data is live or replayed or cheat_on_open is set'
+
+        if not hasattr(cerebro._broker, '_isidle'):
+            return 'the broker is not a BackBroker'
+
+        return None
+
+    def _actions(self):
+        # 对应_next_signal的逻辑，计算在空仓、多头和空头的情况下下单的bar
+        strat, n = self.strategy, self.n
+        sigs = strat._signals
+        nosig = np.zeros(n, dtype=bool)
+
+        def allsigs(sigtype, cmp):
+            vals = [np.asarray(x.lines[0].array, dtype=np.float64)[:n]
+                    for x in sigs[sigtype]]
+            if not vals:
+                return nosig  # nosig [[0.0]] is never True
+
+            with np.errstate(invalid='ignore'):
+                return np.logical_and.reduce([cmp(v) for v in vals])
+
+        gt = lambda v: v > 0.0
+        lt = lambda v: v < 0.0
+        truth = lambda v: v != 0.0  # NaN is True
+
+        ls_long = allsigs(bt.SIGNAL_LONGSHORT, gt)
+        ls_short = allsigs(bt.SIGNAL_LONGSHORT, lt)
+        l_enter = (allsigs(bt.SIGNAL_LONG, gt) |
+                   allsigs(bt.SIGNAL_LONG_INV, lt) |
+                   allsigs(bt.SIGNAL_LONG_ANY, truth))
+        s_enter = (allsigs(bt.SIGNAL_SHORT, lt) |
+                   allsigs(bt.SIGNAL_SHORT_INV, gt) |
+                   allsigs(bt.SIGNAL_SHORT_ANY, truth))
+        l_exit = (allsigs(bt.SIGNAL_LONGEXIT, lt) |
+                  allsigs(bt.SIGNAL_LONGEXIT_INV, gt) |
+                  allsigs(bt.SIGNAL_LONGEXIT_ANY, truth))
+        s_exit = (allsigs(bt.SIGNAL_SHORTEXIT, gt) |
+                  allsigs(bt.SIGNAL_SHORTEXIT_INV, lt) |
+                  allsigs(bt.SIGNAL_SHORTEXIT_ANY, truth))
+
+        l_rev = s_enter & (not strat._longexit)
+        s_rev = l_enter & (not strat._shortexit)
+
+        l_leave = (allsigs(bt.SIGNAL_LONG, lt) |
+                   allsigs(bt.SIGNAL_LONG_INV, gt) |
+                   allsigs(bt.SIGNAL_LONG_ANY, truth))
+        s_leave = (allsigs(bt.SIGNAL_SHORT, gt) |
+                   allsigs(bt.SIGNAL_SHORT_INV, lt) |
+                   allsigs(bt.SIGNAL_SHORT_ANY, truth))
+        l_leave = l_leave & (not strat._longexit)
+        s_leave = s_leave & (not strat._shortexit)
+
+        accumulate = bool(strat.p._accumulate)
+        flat = ls_long | l_enter | ls_short | s_enter
+        inlong = ls_short | l_exit | l_rev | l_leave
+        inshort = ls_long | s_exit | s_rev | s_leave
+        if accumulate:
+            inlong = inlong | ls_long | l_enter
+            inshort = inshort | ls_short | s_enter
+
+        # next/nextstart只在达到最小周期之后调用
+        i0 = strat._minperiods[0] - 1
+        actions = dict()
+        for side, acts in ((0, flat), (1, inlong), (-1, inshort)):
+            idx = np.flatnonzero(acts)
+            actions[side] = idx[idx >= i0]
+
+        return actions
+
+    def _posvalues(self, pos, closes):
+        # 和BackBroker._get_posvalues相同的计算，一次计算所有的收盘价
+        broker = self.cerebro._broker
+        comminfo = broker.getcommissioninfo(self.data)
+        shortcash = broker.p.shortcash
+        with np.errstate(all='ignore'):
+            if not shortcash:
+                dvalue = comminfo.getvalue(pos, closes)
+            else:
+                dvalue = comminfo.getvaluesize(pos.size, closes)
+
+            dunrealized = comminfo.profitandloss(pos.size, pos.price, closes)
+            if not shortcash:
+                dvalue = abs(dvalue)
+
+            dvalue = np.broadcast_to(dvalue, closes.shape)
+            dunrealized = np.broadcast_to(dunrealized, closes.shape)
+            islong = dvalue > 0
+            unlever = np.where(islong,
+                               (dvalue - dunrealized) / comminfo.get_leverage(),
+                               dvalue)
+
+            return np.where(islong, (0.0 + unlever) + dunrealized,
+                            0.0 + unlever)
+
+    def _skip(self, a, b):
+        # bar a到b-1没有事件，只移动数据、指标和策略，一次计算broker的价值
+        k = b - a
+        data, strat = self.data, self.strategy
+        data.advance(size=k)
+        for ind in strat._lineiterators[LineIterator.IndType]:
+            size = len(ind._clock) - len(ind)
+            if size > 0:
+                ind.advance(size=size)
+
+        dtline = strat.lines.datetime
+        for line in strat.lines:
+            if line is dtline:
+                line.forwardarray(self.datetime[a:b])
+            else:
+                line.forward(size=k)
+
+        broker = self.cerebro._broker
+        cash = broker.cash
+        pos = broker.positions.get(data)
+        self.cash[a:b] = cash
+        self.position[a:b] = pos.size if pos is not None else 0
+        if pos:
+            self.value[a:b] = cash + self._posvalues(pos, self.close[a:b])
+            pos.adjbase = float(self.close[b - 1])
+        else:
+            self.value[a:b] = cash + 0.0
+
+    def _process(self, i):
+        # 和_runonce中一样处理一个bar
+        cerebro, data, strat = self.cerebro, self.data, self.strategy
+        broker = cerebro._broker
+        data.advance()
+        dt0 = data.lines.datetime[0]
+        broker.next()
+        while True:
+            order = broker.get_notification()
+            if order is None:
+                break
+
+            for exbit in order.executed.iterpending():
+                self.fills.append((dt0, order.ref, exbit.size, exbit.price,
+                                   exbit.comm))
+
+            owner = order.owner
+            if owner is None:
+                owner = cerebro.runningstrats[0]  # default
+
+            owner._addnotification(order, quicknotify=cerebro.p.quicknotify)
+
+        pos = broker.positions.get(data)
+        self.value[i] = broker.getvalue()
+        self.cash[i] = broker.getcash()
+        self.position[i] = pos.size if pos is not None else 0
+        self.processed += 1
+        if cerebro._event_stop:
+            return False
+
+        strat._oncepost(dt0)
+        return not cerebro._event_stop
+
+    def run(self):
+        cerebro, data, strat = self.cerebro, self.data, self.strategy
+        broker = cerebro._broker
+        actions = self._actions()
+        n = self.n
+        i = -1  # last bar moved over
+        while i < n - 1:
+            j = i + 1
+            if broker._isidle():
+                j = n  # nothing will happen
+                if strat._sentinel is None or strat.p._concurrent:
+                    pos = broker.positions.get(data)
+                    size = pos.size if pos is not None else 0
+                    acts = actions[(size > 0) - (size < 0)]
+                    k = np.searchsorted(acts, i + 1)
+                    if k < len(acts):
+                        j = int(acts[k])
+
+                if j > i + 1:
+                    self._skip(i + 1, j)
+                    if j == n:
+                        # 跳过的bar中broker没有记录计算利息的时间
+                        pos = broker.positions.get(data)
+                        if pos:
+                            pos.datetime = data.datetime.datetime()
+                        broker._get_value()  # value at the last bar
+                        strat._getminperstatus()
+                        break
+
+            if not self._process(j):
+                return  # stop requested
+
+            i = j
+
+        data.retire()
+
+
 class Cerebro(with_metaclass(MetaParams, object)):
     """Params:
 
@@ -149,7 +534,8 @@ class Cerebro(with_metaclass(MetaParams, object)):
             will have always a running buffer of 30 bars to allow the
             calculation of the Simple Moving Average
 
-            - This setting will deactivate ``preload`` and ``runonce``
+            - This setting will deactivate ``preload`` and ``runonce`` (see
+              ``oncechunk`` to keep ``runonce``)
             - Using this setting also deactivates **plotting**
 
           - ``-1``: datafeeds and indicators/operations at strategy level will
@@ -325,6 +711,179 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # quicknotify，控制broker发送通知的时间，如果设置成False，那么，只有在next的时候才会发送
         # 设置成True的时候，产生就会立刻发送。
 
+      - ``linestorage`` (default: ``array``)
+
+        Storage used by the *lines* which keep all values in memory
+
+          - ``array``: each line is an ``array.array('d')``
+
+          - ``numpy``: each line is a growable preallocated
+            ``numpy.ndarray`` (see ``linebuffer.NumpyLineArray``). Slices
+            of the storage (``line.array[start:end]``) are views instead of
+            copies and ``numpy.asarray(line.array)`` does not copy the data,
+            which allows indicators to work on whole arrays. ``line.get``
+            returns a read-only view
+
+        The storage is set on the lines of each run, other runs and lines
+        created outside of ``run`` keep their own storage
+
+        Lines in memory saving mode (see ``exactbars``) are not affected
+        # 设置line保存数据的方式，默认使用array.array,设置成numpy的时候使用numpy.ndarray保存，
+        # 切片的时候返回视图，不会复制数据，方便指标进行向量化计算
+
+      - ``optshared`` (default: ``False``)
+
+        If ``True`` and the datas are preloaded only once for an optimization
+        (see ``optdatas``), the preloaded lines are moved to a memory mapped
+        file (in ``/dev/shm`` if available) before the worker processes are
+        started. Instead of a full copy of every line, the workers receive
+        the name of the file and map it read-only, sharing a single copy of
+        the data.
+
+        Modifications of the data in a worker (if any) are done in a private
+        copy of the affected line (copy-on-write) and are not seen by other
+        workers
+
+        ``numpy`` is needed and ``ImportError`` is raised if it is missing
+        # 参数优化的时候，把预加载的数据保存到内存映射文件中，子进程只接收文件名，然后映射这个文件，
+        # 所有的进程共享同一份数据，避免每个进程都复制一份数据，导致内存不足
+
+      - ``optchunksize`` (default: ``1``)
+
+        Number of parameter combinations sent together to a worker process
+        during an optimization. Larger values reduce the inter-process
+        communication for large optimizations with short runs
+        # 参数优化的时候，每次发送给子进程的参数组合的数量，参数组合很多，每次运行时间很短的时候，
+        # 可以设置的大一些，减少进程间通信的消耗
+
+      - ``optordered`` (default: ``True``)
+
+        If ``True`` the results of an optimization with several processes
+        are delivered in the order of the parameter combinations. If
+        ``False`` they are delivered as soon as they are finished (a slow
+        combination does not hold back the others)
+        # 参数优化的时候，是否按照参数组合的顺序返回结果，设置成False的时候，按照完成的顺序返回结果
+
+      - ``retireclose`` (default: ``False``)
+
+        Datas which cannot deliver more bars (or which have been retired
+        with ``data.retire()``, for example when a future or an option
+        expires) are removed from the event loop. If ``True`` an open
+        position in a retired data is closed with the backtesting broker at
+        the last closing price of the data
+        # 数据退出事件循环的时候，是否使用数据的最后一个收盘价平掉这个数据的持仓
+
+      - ``histretain`` (default: ``None``)
+
+        Which of the notified orders and trades are kept by the strategies
+        (and of the submitted orders kept by the broker) during the run:
+
+          - ``None``: keep everything
+
+          - ``'open'``: keep only the orders which are alive and the trades
+            which are open
+
+          - ``int``: keep only the last ``histretain`` orders, trades (for
+            each data/tradeid) and entries of the history of each trade
+            (``tradehistory``)
+
+        The notifications to the strategies, analyzers and observers are
+        not affected. See ``Strategy.set_histretain``
+        # 长时间的回测（例如tick数据）中保存所有的订单和交易会耗尽内存
+
+      - ``histspill`` (default: ``None``)
+
+        Name of a file to which the orders and trades dropped by
+        ``histretain`` are appended (one JSON object per line, see
+        ``HistorySpill``). If ``histretain`` is ``None`` only the open
+        orders and trades are kept (``'open'``)
+
+        When optimizing each process appends to its own file, named after
+        ``histspill`` with the process id before the extension
+        # 不再保存在内存中的订单和交易追加写入到这个文件中
+
+      - ``oncechunk`` (default: ``0``)
+
+        Number of bars of the chunks used to keep ``runonce`` (and
+        ``preload``) active with ``exactbars`` set to ``True`` or ``1``
+
+        The bars of the data are loaded ``oncechunk`` bars at a time and the
+        indicators are calculated in ``once`` mode for the chunk, carrying
+        over the last bars of the previous chunk needed by the minimum
+        periods. Once the bars of the chunk have been processed the older
+        bars are discarded from all lines, which keeps the memory bounded
+
+        Only used with a single (non-live) data, without replaying and with
+        the modern synchronization (``oldsync=False``) and if no line looks
+        into the future (like the ``chikou_span`` of ``Ichimoku``). With
+        ``0`` or if the system does not qualify ``exactbars`` disables
+        ``runonce``
+        # exactbars模式下分块预加载数据，在每一块数据上使用once计算指标
+
+      - ``signalskipidle`` (default: ``False``)
+
+        If ``True`` and the system only consists of a ``SignalStrategy``
+        operating with the signals added with ``add_signal`` on a single
+        (non-live) data, run in ``runonce`` mode with no analyzers,
+        observers, writers or timers, only the bars in which orders are
+        pending or the signals issue orders are processed by the broker and
+        the strategy. The results are the same as in a regular run
+
+        Only the idle bars are skipped: the orders still go through the
+        sizer and the broker as usual, so the gain depends on how many bars
+        have no pending orders and no signals for the current position
+
+        The equity curve is available after the run in the attribute
+        ``signalrun`` of the strategy (``datetime``, ``value``, ``cash``,
+        ``position`` and ``fills``). If the system does not qualify the
+        regular mode is used and a ``RuntimeWarning`` tells why
+        # 只使用信号的策略跳过没有事件的bar，信号和持仓价值按照数组一次计算
+
+      - ``bulkresample`` (default: ``False``)
+
+        If ``True`` resampling datas (added with ``resampledata``) no longer
+        disable ``preload`` (unless a data is replayed) and the bars of the
+        (non-live) source are preloaded and then resampled in bulk with
+        array operations instead of bar by bar. The resampled bars are the
+        same (including ``bar2edge``, ``adjbartime`` and ``rightedge``)
+
+        Datas using a trading calendar are preloaded resampling bar by bar
+        # 抽样的数据也预加载，先加载原始数据，然后使用数组一次性完成抽样
+
+      - ``bulkreplay`` (default: ``False``)
+
+        If ``True`` replaying datas (added with ``replaydata``) no longer
+        disable ``preload``: the bars of the (non-live) source are preloaded
+        and the partial bars seen after each bar of the source are
+        precomputed with array operations. During the run the replayed data
+        delivers the precomputed bars one at a time without going through
+        the replay filter. The strategies see the same bars as when
+        replaying bar by bar and ``runonce`` is not used
+
+        Only used if all replayed datas are not clones (i.e.: the data was
+        not also added with ``adddata``) and no data is only resampled.
+        Datas using a trading calendar, with late bars or ``NaN`` opening
+        prices are precomputed replaying bar by bar
+        # 回放的数据也预加载，预先计算每个原始的bar之后交付的bar
+
+      - ``postanalyzers`` (default: ``False``)
+
+        If ``True`` the analyzers which are a function of the values of the
+        broker and of the trades (``DrawDown``, ``TimeDrawDown``, ``SQN``,
+        ``Returns``, ``VWR``, ``Calmar``, ``AnnualReturn``, ``SharpeRatio``,
+        ``PeriodStats``, ``TimeReturn`` and ``LogReturnsRolling`` when they
+        do not track a ``data``) receive no notifications and no ``next``
+        calls during the run. The strategy records the datetime, cash, value
+        and fund values of each cycle and the notified trades in compact
+        arrays and the analyzers calculate their results from them in
+        vectorized form at the end of the run (see ``Analyzer.postrun``).
+        The results are the same as in a regular run
+
+        Analyzers used by observers, tracking a ``data``, subclassed
+        overriding the notification or ``next`` methods or working on
+        ``Ticks``/``MicroSeconds`` keep running during the run
+        # analyzer在运行结束之后根据记录的数据一次性计算，运行的时候不再调用
+
     """
     # 参数
     params = (
@@ -347,6 +906,18 @@ class Cerebro(with_metaclass(MetaParams, object)):
         ('cheat_on_open', False),
         ('broker_coo', True),
         ('quicknotify', False),
+        ('linestorage', 'array'),
+        ('optshared', False),
+        ('optchunksize', 1),
+        ('optordered', True),
+        ('retireclose', False),
+        ('histretain', None),
+        ('histspill', None),
+        ('signalskipidle', False),
+        ('oncechunk', 0),
+        ('bulkresample', False),
+        ('bulkreplay', False),
+        ('postanalyzers', False),
     )
 
     # 初始化
@@ -365,6 +936,8 @@ class Cerebro(with_metaclass(MetaParams, object)):
         self.datas = list()
         # 默认有序字典，根据名字保存数据
         self.datasbyname = collections.OrderedDict()
+        # 退出了事件循环，还没有处理的数据
+        self._retiring = list()
         # 保存策略
         self.strats = list()
         # 保存待优化的策略
@@ -405,6 +978,8 @@ class Cerebro(with_metaclass(MetaParams, object)):
         self._ohistory = list()
         # fund历史默认是None
         self._fhistory = None
+        # 参数优化的时候保存共享数据的内存映射文件
+        self._sharedfile = None
 
     # 这个函数会把可迭代对象中的每个元素变成都是可迭代的
     @staticmethod
@@ -1149,6 +1724,8 @@ class Cerebro(with_metaclass(MetaParams, object)):
         rv = vars(self).copy()
         if 'runstrats' in rv:
             del (rv['runstrats'])
+        # the original values of shared lines must not travel to the workers
+        rv.pop('_sharedlines', None)
         return rv
 
     # 当在策略内部或者其他地方调用这个函数的时候，将会很快停止执行
@@ -1174,10 +1751,46 @@ class Cerebro(with_metaclass(MetaParams, object)):
           - For Optimization: a list of lists which contain instances of the
             Strategy classes added with ``addstrategy``
         """
-        self._event_stop = False  # Stop is requested
         # 如果没有数据，直接返回空的列表
         if not self.datas:
             return []  # nothing can be run
+
+        # 运行的策略列表
+        self.runstrats = list()
+        for runstrat in self.run_iter(**kwargs):
+            # 把运行的策略添加到运行策略的列表中
+            self.runstrats.append(runstrat)
+
+        # 如果不是参数优化
+        if not self._dooptimize:
+            # avoid a list of list for regular cases
+            return self.runstrats[0]
+
+        return self.runstrats
+
+    # 和run一样运行回测，但是每运行完一组策略就返回这组策略的结果，不会保存全部的结果
+    def run_iter(self, **kwargs):
+        """Generator version of ``run``. The ``kwargs`` are handled as in
+        ``run``
+
+        Instead of collecting the results, each one is yielded as soon as it
+        is available and is not kept by ``cerebro``. Each yielded element is
+        the list with the instances of the Strategy classes (or ``OptReturn``
+        instances if ``optreturn`` is ``True``) for a combination of the
+        strategies/parameters added with ``addstrategy``/``optstrategy``
+
+        During an optimization with several processes, the order in which the
+        results are yielded is controlled by ``optordered`` (see the
+        parameters) and the callbacks added with ``optcallback`` are invoked
+        before each result is yielded
+
+        Closing the generator before it is exhausted terminates the worker
+        processes of an optimization
+        """
+        self._event_stop = False  # Stop is requested
+        # 如果没有数据，直接返回
+        if not self.datas:
+            return  # nothing can be run
         # 用传递过来的关键字参数覆盖标准参数
         pkeys = self.params._getkeys()
         for key, val in kwargs.items():
@@ -1192,6 +1805,13 @@ class Cerebro(with_metaclass(MetaParams, object)):
         linebuffer.LineActions.usecache(self.p.objcache)
         indicator.Indicator.usecache(self.p.objcache)
 
+        # 检查line保存数据的方式，每个line在运行的时候单独设置
+        linebuffer.LineBuffer.checkstorage(self.p.linestorage)
+
+        # 共享数据使用numpy的内存映射文件
+        if self.p.optshared and np is None:
+            raise ImportError('numpy is needed for optshared=True')
+
         # 是否是_dorunonce,_dopreload,_exactbars
         self._dorunonce = self.p.runonce
         self._dopreload = self.p.preload
@@ -1201,9 +1821,13 @@ class Cerebro(with_metaclass(MetaParams, object)):
             self._dorunonce = False  # something is saving memory, no runonce
             self._dopreload = self._dopreload and self._exactbars < 1
         # 如果_doreplay是True或者数据中有任何一个具有replaying属性值是True的话，就把_doreplay设置成True
-        self._doreplay = self._doreplay or any(x.replaying for x in self.datas)
-        # 如果_doreplay,需要把_dopreload设置成False
-        if self._doreplay:
+        replaying = any(x.replaying for x in self.datas)
+        self._doreplay = self._doreplay or replaying
+        # 如果_doreplay,需要把_dopreload设置成False(批量抽样和预先计算的回放除外)
+        if self._doreplay and self._canpreloadreplay(replaying):
+            self._dorunonce = False  # partial bars are seen by strategies
+        elif self._doreplay and (replaying or not self.p.bulkresample or
+                                 not self._dorunonce):
             # preloading is not supported with replay. full timeframe bars
             # are constructed in realtime
             self._dopreload = False
@@ -1213,6 +1837,14 @@ class Cerebro(with_metaclass(MetaParams, object)):
             self._dorunonce = False
             self._dopreload = False
 
+        # exactbars模式下分块使用runonce
+        self._oncechunk = 0
+        if (self._exactbars > 0 and self.p.oncechunk > 0 and
+                self.p.runonce and self.p.preload and not self.p.oldsync and
+                not self._doreplay and not (self._dolive or self.p.live) and
+                len(self.datas) == 1):
+            self._oncechunk = int(self.p.oncechunk)
+
         # writer的列表
         self.runwriters = list()
 
@@ -1232,8 +1864,6 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # 如果那个writer需要全部的csv的输出，把结果保存到文件中
         self.writers_csv = any(map(lambda x: x.p.csv, self.runwriters))
 
-        # 运行的策略列表
-        self.runstrats = list()
         # 如果signals不是None等，处理signalstrategy相关的问题
         if self.signals:  # allow processing of signals
             signalst, sargs, skwargs = self._signal_strat
@@ -1273,21 +1903,23 @@ class Cerebro(with_metaclass(MetaParams, object)):
             for iterstrat in iterstrats:
                 # 运行策略
                 runstrat = self.runstrategies(iterstrat)
-                # 把运行的策略添加到运行策略的列表中
-                self.runstrats.append(runstrat)
                 # 如果是优化参数
                 if self._dooptimize:
                     # 遍历所有的optcbs，以便返回停止策略的结果
                     for cb in self.optcbs:
                         cb(runstrat)  # callback receives finished strategy
+
+                yield runstrat
         # 如果是优化参数
         else:
+            predata = self.p.optdatas and self._dopreload and self._dorunonce
             # 如果optdatas是True,并且_dopreload，并且_dorunonce
-            if self.p.optdatas and self._dopreload and self._dorunonce:
+            if predata:
                 # 遍历每个data,进行reset,如果_exactbars小于1，对数据进行extend处理
                 # 开始数据
                 # 如果数据_dopreload的话，对数据调用preload
                 for data in self.datas:
+                    self._setlinestorage(data)
                     data.reset()
                     if self._exactbars < 1:  # datas can be full length
                         data.extend(size=self.params.lookahead)
@@ -1295,25 +1927,93 @@ class Cerebro(with_metaclass(MetaParams, object)):
                     # todo 这个里面重新判断self._dopreload好像是没有什么道理，因为前面已经保证self._dopreload是True了，尝试注释掉，提高效率
                     # if self._dopreload:
                     #     data.preload()
-                    data.preload()
+                    self._preloaddata(data)
+                # 把预加载的数据放到共享的内存映射文件中
+                if self.p.optshared:
+                    self._sharedatas()
             # 开启进程池
             pool = multiprocessing.Pool(self.p.maxcpus or None)
-            for r in pool.imap(self, iterstrats):
-                self.runstrats.append(r)
-                for cb in self.optcbs:
-                    cb(r)  # callback receives finished strategy
-            # 关闭进程词
-            pool.close()
-            # 如果optdatas是True,并且_dopreload，并且_dorunonce，遍历数据，并停止数据
-            if self.p.optdatas and self._dopreload and self._dorunonce:
-                for data in self.datas:
-                    data.stop()
-        # 如果不是参数优化
-        if not self._dooptimize:
-            # avoid a list of list for regular cases
-            return self.runstrats[0]
+            # 按照提交的顺序返回结果，或者按照完成的顺序返回结果
+            if self.p.optordered:
+                imap = pool.imap
+            else:
+                imap = pool.imap_unordered
 
-        return self.runstrats
+            completed = False
+            try:
+                for r in imap(self, iterstrats,
+                              chunksize=max(1, self.p.optchunksize)):
+                    for cb in self.optcbs:
+                        cb(r)  # callback receives finished strategy
+
+                    yield r
+
+                completed = True
+            finally:
+                # 关闭进程池，如果没有运行完(出错或者生成器被关闭)，直接终止子进程
+                if completed:
+                    pool.close()
+                else:
+                    pool.terminate()
+                pool.join()
+                self._unsharedatas()
+                # 如果optdatas是True,并且_dopreload，并且_dorunonce，遍历数据，并停止数据
+                if predata:
+                    for data in self.datas:
+                        data.stop()
+
+    # 把预加载的数据保存到内存映射文件中，在参数优化的时候子进程共享这份数据
+    def _sharedatas(self):
+        """
+        Moves the values of the preloaded lines of the datas to a memory
+        mapped file, which the optimization workers map instead of receiving
+        a copy of the values
+        """
+        lines = [line for data in self.datas for line in data.lines]
+        total = sum(len(line.array) for line in lines)
+
+        # /dev/shm是基于内存的文件系统，如果存在的话优先使用
+        shmdir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, fname = tempfile.mkstemp(prefix='backtrader-', suffix='.lines',
+                                     dir=shmdir)
+        os.close(fd)
+
+        mm = np.memmap(fname, dtype=np.float64, mode='w+',
+                       shape=(max(total, 1),))
+        offset = 0
+        self._sharedlines = list()
+        for line in lines:
+            size = len(line.array)
+            mm[offset:offset + size] = np.asarray(line.array,
+                                                  dtype=np.float64)
+            self._sharedlines.append((line, line.array))
+            line.array = linebuffer.MMapLineArray(fname, offset, size)
+            offset += size
+
+        mm.flush()
+        del mm
+        self._sharedfile = fname
+
+    # 恢复原来的数据，删除内存映射文件
+    def _unsharedatas(self):
+        """
+        Restores the original values of the lines moved to a memory mapped
+        file by ``_sharedatas`` and removes the file
+        """
+        fname = self._sharedfile
+        if fname is None:
+            return
+
+        for line, larray in self._sharedlines:
+            line.array = larray
+
+        self._sharedlines = list()
+        self._sharedfile = None
+        linebuffer.MMapLineArray.release(fname)
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
 
     # 初始化计数
     def _init_stcount(self):
@@ -1323,11 +2023,54 @@ class Cerebro(with_metaclass(MetaParams, object)):
     def _next_stid(self):
         return next(self.stcount)
 
+    # 判断回放的数据是否都可以预先计算回放的过程
+    def _canpreloadreplay(self, replaying):
+        '''Returns ``True`` if ``bulkreplay`` is set and the replayed datas
+        can be preloaded (no data is only resampled)'''
+        if not (replaying and self.p.bulkreplay):
+            return False
+
+        for data in self.datas:
+            if data.replaying:
+                if not data._canpreloadreplay():
+                    return False
+            elif data.resampling:
+                return False
+
+        return True
+
+    # 预加载数据，如果可以的话批量抽样或者预先计算回放的过程
+    def _preloaddata(self, data):
+        '''Preloads ``data`` resampling in bulk if ``bulkresample`` is set
+        and precomputing the replay if ``bulkreplay`` is set'''
+        if data.replaying and self.p.bulkreplay:
+            data._replaypreload()
+        elif self.p.bulkresample:
+            data._bulkpreload()
+        else:
+            data.preload()
+
     # 运行策略
     def runstrategies(self, iterstrat, predata=False):
         """
         Internal method invoked by ``run``` to run a set of strategies
         """
+        # 订单和交易的历史只保存一部分，不再保存的可以写入到文件中，运行出错
+        # 的时候也需要关闭文件
+        histspill = None
+        if self.p.histspill:
+            # 参数优化的时候每个进程写入自己的文件
+            histspill = HistorySpill(self.p.histspill,
+                                     perprocess=self._dooptimize)
+            histspill.start()
+
+        try:
+            return self._runstrategies(iterstrat, predata, histspill)
+        finally:
+            if histspill is not None:
+                histspill.stop()
+
+    def _runstrategies(self, iterstrat, predata, histspill):
         # 初始化计数
         self._init_stcount()
         # 初始化运行的策略为空列表
@@ -1346,6 +2089,12 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # 遍历order的历史
         for orders, onotify in self._ohistory:
             self._broker.add_order_history(orders, onotify)
+        # 订单和交易的历史只保存一部分
+        histretain = self.p.histretain
+        if histspill is not None and histretain is None:
+            histretain = 'open'
+        if histretain is not None and hasattr(self._broker, 'set_histretain'):
+            self._broker.set_histretain(histretain)
         # broker开始
         self._broker.start()
         # feed开始
@@ -1369,12 +2118,18 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # 如果没有predata的话，需要提前预处理数据，和run中预处理数据的方法很相似
         if not predata:
             for data in self.datas:
+                self._setlinestorage(data)
                 data.reset()
                 if self._exactbars < 1:  # datas can be full length
                     data.extend(size=self.params.lookahead)
                 data._start()
                 if self._dopreload:
-                    data.preload()
+                    self._preloaddata(data)
+        # 数据在上一次运行的时候可能已经退出了事件循环
+        for data in self.datas:
+            data._retired = False
+
+        self._retiring = list()
         # 循环策略
         for stratcls, sargs, skwargs in iterstrat:
             # 把数据添加到策略参数
@@ -1390,6 +2145,8 @@ class Cerebro(with_metaclass(MetaParams, object)):
             # 是否保存交易历史数据
             if self.p.tradehistory:
                 strat.set_tradehistory()
+            if histretain is not None:
+                strat.set_histretain(histretain, spill=histspill)
             # 添加策略
             runstrats.append(strat)
         # 获取时区信息，如果时区信息是整数，那么就获取该整数对应的index的时区，如果不是整数，就使用tzparse解析时区
@@ -1433,6 +2190,8 @@ class Cerebro(with_metaclass(MetaParams, object)):
                 sizer, sargs, skwargs = self.sizers.get(idx, defaultsizer)
                 if sizer is not None:
                     strat._addsizer(sizer, *sargs, **skwargs)
+                # 策略、指标和observer的line使用linestorage保存数据
+                self._setlinestorage(strat)
                 # 设置时区
                 strat._settz(tz)
                 # 策略开始
@@ -1442,10 +2201,16 @@ class Cerebro(with_metaclass(MetaParams, object)):
                     if writer.p.csv:
                         writer.addheaders(strat.getwriterheaders())
             # 如果predata是False，没有提前加载数据
+            # 分块计算的时候不能有向前看的line,使用exactbars的标准模式
+            if self._oncechunk and self._oncechunklines(runstrats)[2]:
+                self._disable_runonce()
+
             if not predata:
                 # 循环每个策略，调用qbuffer缓存数据
                 for strat in runstrats:
-                    strat.qbuffer(self._exactbars, replaying=self._doreplay)
+                    if not self._oncechunk:  # chunks discard old values
+                        strat.qbuffer(self._exactbars,
+                                      replaying=self._doreplay)
             # 循环每个writer,开始writer
             for writer in self.runwriters:
                 writer.start()
@@ -1464,11 +2229,20 @@ class Cerebro(with_metaclass(MetaParams, object)):
                     self._timerscheat.append(timer)
                 else:
                     self._timers.append(timer)
+            # signalskipidle只能在runonce模式下使用
+            if self.p.signalskipidle and (
+                    self._oncechunk or self.p.oldsync or
+                    not (self._dopreload and self._dorunonce)):
+                self._signalskipidlewarn('runonce/preload are not active')
             # 如果_dopreload 和 _dorunonce是True的话
-            if self._dopreload and self._dorunonce:
+            if self._oncechunk:
+                self._runonce_chunks(runstrats)
+            elif self._dopreload and self._dorunonce:
                 # 如果是旧的数据对齐和同步方式，使用_runonce_old，否则使用_runonce
                 if self.p.oldsync:
                     self._runonce_old(runstrats)
+                elif self._signalskipidle(runstrats):
+                    self._runsignals(runstrats)
                 else:
                     self._runonce(runstrats)
             # 如果_dopreload 和 _dorunonce并不都是True的话
@@ -1677,10 +2451,21 @@ class Cerebro(with_metaclass(MetaParams, object)):
 
                     writer.next()
 
+    # 设置obj和它的lineiterators的line保存数据的方式
+    def _setlinestorage(self, obj):
+        for line in obj.lines:
+            line.setstorage(self.p.linestorage)
+
+        # 数据没有lineiterators
+        for lineiterators in getattr(obj, '_lineiterators', {}).values():
+            for lineiterator in lineiterators:
+                self._setlinestorage(lineiterator)
+
     # 禁止runonce
     def _disable_runonce(self):
         """API for lineiterators to disable runonce (see HeikinAshi)"""
         self._dorunonce = False
+        self._oncechunk = 0
 
     # runnext方法
     def _runnext(self, runstrats):
@@ -1691,8 +2476,6 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # 对数据的时间周期进行排序
         datas = sorted(self.datas,
                        key=lambda x: (x._timeframe, x._compression))
-        # 其他数据
-        datas1 = datas[1:]
         # 主数据
         data0 = datas[0]
         d0ret = True
@@ -1701,35 +2484,51 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # rs = [i for i, x in enumerate(datas) if x.resampling]
         # replaying的index
         # rp = [i for i, x in enumerate(datas) if x.replaying]
-        # 仅仅只做resample,不做replay得index
-        rsonly = [i for i, x in enumerate(datas) if x.resampling and not x.replaying]
-        # 判断是否仅仅做resample
-        onlyresample = len(datas) == len(rsonly)
-        # 判断是否没有需要resample的数据
-        noresample = not rsonly
-        # 克隆的数据量
-        clonecount = sum(d._clone for d in datas)
-        # 数据的数量
-        ldatas = len(datas)
-        # 没有克隆的数据量
-        ldatas_noclones = ldatas - clonecount
         # todo lastqcheck 没有使用到，注释掉
         # lastqcheck = False
         # 默认dt0在最大时间
         dt0 = date2num(datetime.datetime.max) - 2  # default at max
+        # 没有退出事件循环的数据，每次循环只处理这些数据
+        active = None
+        # 没有实盘数据、克隆数据和过滤器的时候，使用堆只处理有bar的数据
+        heap = None
+        if _DataHeap.usable(datas):
+            heap = _DataHeap(datas)
         # while循环
         while d0ret or d0ret is None:
-            # if any has live data in the buffer, no data will wait anything
-            # 如果有任何实时数据的话，newqcheck是False
-            newqcheck = not any(d.haslivedata() for d in datas)
-            # 如果存在实时数据
-            if not newqcheck:
-                # If no data has reached the live status or all, wait for
-                # the next incoming data
-                # livecount是实时数据的量
-                livecount = sum(d._laststatus == d.LIVE for d in datas)
-                # todo 这个判断没有任何意义
-                newqcheck = not livecount or livecount == ldatas_noclones
+            # 有数据退出了事件循环的时候，重新计算需要处理的数据
+            if self._retiring:
+                self._retirepending(runstrats)
+                active = None
+
+            if active is None:
+                active = [d for d in datas if not d._retired]
+                # 仅仅只做resample,不做replay得index
+                rsonly = [i for i, x in enumerate(active)
+                          if x.resampling and not x.replaying]
+                # 判断是否仅仅做resample
+                onlyresample = len(active) == len(rsonly)
+                # 判断是否没有需要resample的数据
+                noresample = not rsonly
+                # 克隆的数据量
+                clonecount = sum(d._clone for d in active)
+                # 没有克隆的数据量
+                ldatas_noclones = len(active) - clonecount
+
+            # 使用堆的时候没有实时数据，不需要等待
+            if heap is None:
+                # if any has live data in the buffer, no data will wait
+                # anything
+                # 如果有任何实时数据的话，newqcheck是False
+                newqcheck = not any(d.haslivedata() for d in active)
+                # 如果存在实时数据
+                if not newqcheck:
+                    # If no data has reached the live status or all, wait for
+                    # the next incoming data
+                    # livecount是实时数据的量
+                    livecount = sum(d._laststatus == d.LIVE for d in active)
+                    # todo 这个判断没有任何意义
+                    newqcheck = not livecount or livecount == ldatas_noclones
 
             lastret = False
             # Notify anything from the store even before moving datas
@@ -1743,89 +2542,117 @@ class Cerebro(with_metaclass(MetaParams, object)):
             if self._event_stop:  # stop if requested
                 return
 
-            # record starting time and tell feeds to discount the elapsed time
-            # from the qcheck value
-            # 记录开始的时间，并且通知feed从qcheck中减去qlapse的时间
-            drets = []
-            qstart = datetime.datetime.utcnow()
-            for d in datas:
-                qlapse = datetime.datetime.utcnow() - qstart
-                d.do_qcheck(newqcheck, qlapse.total_seconds())
-                drets.append(d.next(ticks=False))
-            # 遍历drets,如果d0ret是False,并且存在dret是None的话，d0ret是None
-            d0ret = any((dret for dret in drets))
-            if not d0ret and any((dret is None for dret in drets)):
-                d0ret = None
-            # 如果d0ret不是None的话
-            if d0ret:
-                # 获取时间
-                dts = []
-                for i, ret in enumerate(drets):
-                    dts.append(datas[i].datetime[0] if ret else None)
-
-                # Get index to minimum datetime
-                # 获取最小的时间
-                if onlyresample or noresample:
-                    dt0 = min((d for d in dts if d is not None))
-                else:
-                    dt0 = min((d for i, d in enumerate(dts)
-                               if d is not None and i not in rsonly))
-                # 获取主数据，及时间
-                dmaster = datas[dts.index(dt0)]  # and timemaster
-                self._dtmaster = dmaster.num2date(dt0)
-                self._udtmaster = num2date(dt0)
-
-                # slen = len(runstrats[0])
-                # Try to get something for those that didn't return
-                # 循环drets
-                for i, ret in enumerate(drets):
-                    # 如果ret不是None的话，继续下一个ret
-                    if ret:  # dts already contains a valid datetime for this i
-                        continue
-
-                    # try to get a data by checking with a master
-                    # 获取数据，并尝试给dts设置时间
-                    d = datas[i]
-                    d._check(forcedata=dmaster)  # check to force output
-                    if d.next(datamaster=dmaster, ticks=False):  # retry
-                        dts[i] = d.datetime[0]  # good -> store
-                        # self._plotfillers2[i].append(slen)  # mark as fill
+            if heap is not None:
+                # 只移动在最小的时间上有bar的数据
+                d0ret, dt, dmaster = heap.step()
+                if d0ret:
+                    dt0 = dt
+                    self._dtmaster = dmaster.num2date(dt0)
+                    self._udtmaster = num2date(dt0)
+            else:
+                # record starting time and tell feeds to discount the elapsed
+                # time from the qcheck value
+                # 记录开始的时间，并且通知feed从qcheck中减去qlapse的时间
+                drets = []
+                qstart = datetime.datetime.utcnow()
+                for d in active:
+                    qlapse = datetime.datetime.utcnow() - qstart
+                    d.do_qcheck(newqcheck, qlapse.total_seconds())
+                    dret = d.next(ticks=False)
+                    # False代表数据不会再产生bar了，如果也没有过滤器可以产生bar，
+                    # 退出事件循环
+                    if dret is False and d._canretire():
+                        d.retire()
+                    drets.append(dret)
+                # 遍历drets,如果d0ret是False,并且存在dret是None的话，d0ret是None
+                d0ret = any((dret for dret in drets))
+                if not d0ret and any((dret is None for dret in drets)):
+                    d0ret = None
+                # 如果d0ret不是None的话
+                if d0ret:
+                    # 获取时间
+                    dts = []
+                    for i, ret in enumerate(drets):
+                        dts.append(active[i].datetime[0] if ret else None)
+
+                    # Get index to minimum datetime
+                    # 获取最小的时间
+                    rsmaster = True  # time of resampled bars only
+                    if onlyresample or noresample:
+                        dt0 = min((d for d in dts if d is not None))
                     else:
-                        # self._plotfillers[i].append(slen)  # mark as empty
-                        pass
-
-                # make sure only those at dmaster level end up delivering
-                # 遍历dts
-                for i, dti in enumerate(dts):
-                    # 如果dti不是None
-                    if dti is not None:
-                        # 获取数据
-                        di = datas[i]
-                        # todo 代码写的很多余，rpi一定是返回的False,可以考虑注销
-                        # rpi = False and di.replaying   # to check behavior
-                        if dti > dt0:
-                            # todo 此处rpi是False,not rpi是True,考虑注销，直接运行
-                            # if not rpi:  # must see all ticks ...
-                            di.rewind()  # cannot deliver yet
-                            # self._plotfillers[i].append(slen)
-                        # 如果不是replay
-                        elif not di.replaying:
-                            # Replay forces tick fill, else force here
-                            di._tick_fill(force=True)
+                        dt0 = [d for i, d in enumerate(dts)
+                               if d is not None and i not in rsonly]
+                        # 预加载的抽样数据在最后可能是唯一有bar的数据
+                        rsmaster = not dt0
+                        dt0 = min(dt0 or (d for d in dts if d is not None))
+                    # 获取主数据，及时间
+                    dmaster = active[dts.index(dt0)]  # and timemaster
+                    self._dtmaster = dmaster.num2date(dt0)
+                    self._udtmaster = num2date(dt0)
+
+                    # slen = len(runstrats[0])
+                    # Try to get something for those that didn't return
+                    # 循环drets
+                    for i, ret in enumerate(drets):
+                        # 如果ret不是None的话，继续下一个ret
+                        if ret:  # dts already contains a valid datetime for i
+                            continue
+
+                        # try to get a data by checking with a master
+                        # 获取数据，并尝试给dts设置时间
+                        d = active[i]
+                        if d._retired:  # cannot deliver anything
+                            continue
+
+                        d._check(forcedata=dmaster)  # check to force output
+                        if d.next(datamaster=dmaster, ticks=False):  # retry
+                            dts[i] = d.datetime[0]  # good -> store
+                            # self._plotfillers2[i].append(slen)  # mark as fill
+                        else:
+                            # self._plotfillers[i].append(slen)  # mark as empty
+                            pass
+
+                    # make sure only those at dmaster level end up delivering
+                    # 遍历dts
+                    for i, dti in enumerate(dts):
+                        # 如果dti不是None
+                        if dti is not None:
+                            # 获取数据
+                            di = active[i]
+                            # todo 代码写的很多余，rpi一定是返回的False,可以考虑注销
+                            # rpi = False and di.replaying   # to check behavior
+                            if dti > dt0 or (
+                                    not rsmaster and
+                                    di._deliverdts is not None and
+                                    di._deliverdts[len(di) - 1] > dt0):
+                                # todo 此处rpi是False,not rpi是True,考虑注销，直接运行
+                                # if not rpi:  # must see all ticks ...
+                                di.rewind()  # cannot deliver yet
+                                # self._plotfillers[i].append(slen)
+                            # 如果不是replay
+                            elif not di.replaying:
+                                # Replay forces tick fill, else force here
+                                di._tick_fill(force=True)
+
+                            # self._plotfillers2[i].append(slen)  # mark as fill
 
-                        # self._plotfillers2[i].append(slen)  # mark as fill
             # 如果d0ret是None的话，遍历每个数据，调用_check()
-            elif d0ret is None:
+            if d0ret is None:
                 # meant for things like live feeds which may not produce a bar
                 # at the moment but need the loop to run for notifications and
                 # getting resample and others to produce timely bars
-                for data in datas:
+                for data in active:
                     data._check()
             # 如果是其他情况
-            else:
-                lastret = data0._last()
-                for data in datas1:
-                    lastret += data._last(datamaster=data0)
+            elif not d0ret:
+                # 退出事件循环的数据不会再产生bar
+                lastret = 0
+                for data in active:
+                    if data is data0:
+                        lastret += data0._last()
+                    else:
+                        lastret += data._last(datamaster=data0)
 
                 if not lastret:
                     # Only go extra round if something was changed by "lasts"
@@ -1858,6 +2685,9 @@ class Cerebro(with_metaclass(MetaParams, object)):
 
                     self._next_writers(runstrats)
 
+        # 运行结束，剩下的数据退出事件循环
+        self._retireend(runstrats)
+
         # Last notification chance before stopping
         # 通知数据信息
         self._datanotify()
@@ -1888,50 +2718,310 @@ class Cerebro(with_metaclass(MetaParams, object)):
         # 对数据进行排序，从小周期开始到大周期
         datas = sorted(self.datas,
                        key=lambda x: (x._timeframe, x._compression))
+        # 堆中保存每个数据下一个bar的时间，每次只移动在最小的时间上有bar的数据
+        # 只做抽样的数据(批量抽样之后预加载)放在另一个堆中，和_runnext一样，
+        # 它们的时间只有在其他数据没有bar的时候才决定移动的时间，并且按照
+        # 逐个bar抽样的时候交付的时间排序
+        self._retirepending(runstrats)
+        heap, rsheap = list(), list()
+        heaps = (heap, rsheap)
+        rsplain = False  # only resampled datas left: use the time of the bars
+        exhausted = list()  # datas without more bars
+        for i, d in enumerate(datas):
+            if not d._retired:
+                dtn = d.advance_peek()
+                if dtn == float('inf'):
+                    exhausted.append(d)
+                elif d.resampling and not d.replaying:
+                    rsheap.append((d._delivery(len(d)), i))
+                else:
+                    heap.append((dtn, i))
+
+        heapq.heapify(heap)
+        heapq.heapify(rsheap)
 
         while True:
-            # Check next incoming date in the datas
-            # 对于每个数据调用advance_peek(),取得最小的一个时间作为第一个
-            dts = [d.advance_peek() for d in datas]
-            dt0 = min(dts)
-            if dt0 == float('inf'):
+            # 有数据退出了事件循环
+            if self._retiring:
+                self._retirepending(runstrats)
+
+            # 预加载的数据已经全部使用完了，退出事件循环
+            for d in exhausted:
+                d.retire()
+
+            exhausted = list()
+            # 去掉已经退出事件循环的数据
+            for h in heaps:
+                while h and datas[h[0][1]]._retired:
+                    heapq.heappop(h)
+
+            if not heap and not rsheap:
+                self._retireend(runstrats)
                 break  # no data delivers anything
 
+            if not heap and not rsplain:
+                rsplain = True
+                rsheap[:] = [(datas[i].advance_peek(), i) for dti, i in rsheap]
+                heapq.heapify(rsheap)
+
+            # Check next incoming date in the datas
+            # 堆顶的时间就是即将到来的最小的时间
+            dt0 = (heap or rsheap)[0][0]
+
             # Timemaster if needed be
             # dmaster = datas[dts.index(dt0)]  # and timemaster
             # 第一个策略现在的长度slen
             # todo 变量slen没有使用到，进行注释掉
             # slen = len(runstrats[0])
-            # 对于每个数据的时间，如果时间小于即将到来的最小的时间，数据向前一位，否则，忽略
-            for i, dti in enumerate(dts):
-                if dti <= dt0:
-                    datas[i].advance()
-                    # self._plotfillers2[i].append(slen)  # mark as fill
+            # 在最小的时间上有bar的数据向前一位，然后把下个bar的时间放回到堆中
+            delivered = list()
+            for h in heaps:
+                while h and h[0][0] <= dt0:
+                    dti, i = heapq.heappop(h)
+                    d = datas[i]
+                    if not d._retired:
+                        d.advance()
+                        delivered.append((d.advance_peek(), i, h))
+                        # self._plotfillers2[i].append(slen)  # mark as fill
+
+            for dtn, i, h in delivered:
+                if dtn == float('inf'):
+                    exhausted.append(datas[i])
+                elif h is heap or rsplain:
+                    heapq.heappush(h, (dtn, i))
                 else:
-                    # self._plotfillers[i].append(slen)
-                    pass
-            # 检查timer
-            self._check_timers(runstrats, dt0, cheat=True)
-            # 如果是cheat_on_open，对于每个策略调用_oncepost_open()
-            if self.p.cheat_on_open:
-                for strat in runstrats:
-                    strat._oncepost_open()
-                    # 如果调用了stop，就停止
-                    if self._event_stop:  # stop if requested
-                        return
-            # 调用_brokernotify()
-            self._brokernotify()
-            # 如果调用了stop，就停止
-            if self._event_stop:  # stop if requested
-                return
-            # 检查timer
-            self._check_timers(runstrats, dt0, cheat=False)
+                    heapq.heappush(h, (datas[i]._delivery(len(datas[i])), i))
+
+            if not self._oncestep(runstrats, dt0):
+                return  # stop requested
+
+    def _runonce_chunks(self, runstrats):
+        '''
+        Implementation of ``runonce`` with bounded memory (see the parameter
+        ``oncechunk``). The bars are loaded and the indicators calculated
+        in chunks and the values which are no longer needed are discarded
+        after processing each chunk
+        '''
+        data = self.datas[0]
+        chunk = self._oncechunk
+        lines, keep = self._oncechunklines(runstrats)[:2]
+        keep += 1  # the value before the oldest one needed in the bar
+        self._retirepending(runstrats)
+        more = True
+        while not data._retired:
+            # 在最后加载一块数据，然后回到当前位置
+            start = len(data)
+            data.lines.advance(data.buflen() - start)
+            loaded = 0
+            while more and loaded < chunk:
+                if data.load():
+                    loaded += 1
+                else:
+                    more = False
+                    data._last()  # filters may deliver a last bar
+
+            data.lines.rewind(len(data) - start)
+
+            for strat in runstrats:
+                for indicator in strat._lineiterators[strat.IndType]:
+                    indicator._oncechunk()
+
+                strat._oncechunkseek(start)
+
+            # 保留最后一个bar直到加载下一块数据，和预加载的时候一样，处理的bar之后
+            # 总是有下一个bar(除了最后一个bar)
+            todo = data.buflen() - start - more
+            if not todo and not more:
+                break
+
+            for i in range(todo):
+                if self._retiring:
+                    self._retirepending(runstrats)
+
+                if data._retired:
+                    break
 
+                data.advance()
+                if not self._oncestep(runstrats, data.lines.datetime[0]):
+                    return  # stop requested
+
+            # 删除已经处理并且不再需要的数据
+            size = data.lines[0].idx + 1 - keep
+            if size > 0:
+                buflen = data.buflen()
+                discarded = data.lines[0].discarded
+                for line in lines:
+                    if (line.buflen() == buflen and
+                            line.discarded == discarded):
+                        line.discard(size)  # calculated along the data
+                    elif line.idx + 1 > keep:  # moved forward bar by bar
+                        line.discard(line.idx + 1 - keep)
+
+        self._retireend(runstrats)
+
+    def _oncechunklines(self, runstrats):
+        '''
+        Returns the lines of the data and of the strategies (and their
+        indicators) for ``_runonce_chunks``, the number of bars to keep (the
+        largest minimum period) and whether a line looks into the future
+        '''
+        lines, seen = list(), set()
+        keep = 1
+        lookahead = False
+        objs = [self.datas[0]] + list(runstrats)
+        while objs:
+            obj = objs.pop()
+            keep = max(keep, getattr(obj, '_minperiod', 1))
+            # 向前看的line(ago大于0)会修改之前的bar的值
+            lookahead = lookahead or isinstance(obj, linebuffer._LineForward)
+            for line in obj.lines:
+                if id(line) not in seen:
+                    seen.add(id(line))
+                    lines.append(line)
+
+            lineiterators = getattr(obj, '_lineiterators', None)
+            if lineiterators:
+                for its in lineiterators.values():
+                    objs.extend(its)
+
+        return lines, keep, lookahead
+
+    def _oncestep(self, runstrats, dt0):
+        '''
+        Processes in ``runonce`` mode the bar at ``dt0`` of the datas which
+        have already been moved forward. Returns ``False`` if a stop has
+        been requested
+        '''
+        # 检查timer
+        self._check_timers(runstrats, dt0, cheat=True)
+        # 如果是cheat_on_open，对于每个策略调用_oncepost_open()
+        if self.p.cheat_on_open:
             for strat in runstrats:
-                strat._oncepost(dt0)
+                strat._oncepost_open()
+                # 如果调用了stop，就停止
                 if self._event_stop:  # stop if requested
-                    return
-                self._next_writers(runstrats)
+                    return False
+        # 调用_brokernotify()
+        self._brokernotify()
+        # 如果调用了stop，就停止
+        if self._event_stop:  # stop if requested
+            return False
+        # 检查timer
+        self._check_timers(runstrats, dt0, cheat=False)
+
+        for strat in runstrats:
+            strat._oncepost(dt0)
+            if self._event_stop:  # stop if requested
+                return False
+            self._next_writers(runstrats)
+
+        return True
+
+    def _runsignals(self, runstrats):
+        '''
+        Implementation of ``runonce`` for a system with only signals (see the
+        parameter ``signalskipidle``) which skips the bars without events
+        '''
+        strat = runstrats[0]
+        strat._once()
+        strat.reset()  # strat called next by next - reset lines
+        self._retirepending(runstrats)
+        strat.signalrun = _SignalIdleRun(self, strat)
+        strat.signalrun.run()
+        self._retireend(runstrats)
+
+    # 判断是否使用signalskipidle模式运行，不能使用的时候给出警告
+    def _signalskipidle(self, runstrats):
+        if not self.p.signalskipidle:
+            return False
+
+        reason = _SignalIdleRun.unusable(self, runstrats)
+        if reason is not None:
+            self._signalskipidlewarn(reason)
+            return False
+
+        return True
+
+    @staticmethod
+    def _signalskipidlewarn(reason):
+        warnings.warn('signalskipidle is set but cannot be used (%s), '
+                      'running the regular loop' % reason, RuntimeWarning,
+                      stacklevel=2)
+
+    # 数据退出事件循环的时候，由数据进行通知
+    def _retiredata(self, data):
+        self._retiring.append(data)
+
+    # 处理退出事件循环的数据
+    def _retirepending(self, runstrats):
+        '''
+        Processes the datas retired since the last call, closing the open
+        positions in them if ``retireclose`` is ``True``
+        '''
+        retiring, self._retiring = self._retiring, list()
+        if self.p.retireclose:
+            for d in retiring:
+                self._retireclose(d, runstrats)
+
+    # 运行结束的时候，所有的数据退出事件循环，如果retireclose是True，立即平掉这些数据的持仓
+    def _retireend(self, runstrats):
+        '''
+        Retires the datas still in the event loop when the run ends (the
+        last ones to deliver bars). If ``retireclose`` is ``True`` the open
+        positions are closed at once and the notifications are delivered to
+        the strategies, because there is no next bar in which the broker
+        could execute the closing orders
+        '''
+        for data in self.datas:
+            data.retire()
+
+        if self._event_stop:
+            return  # 策略要求停止，不再平仓
+
+        self._retirepending(runstrats)
+        exechistorical = getattr(self._broker, '_exechistorical', None)
+        if not self.p.retireclose or exechistorical is None:
+            return
+
+        exechistorical()
+        while True:
+            order = self._broker.get_notification()
+            if order is None:
+                break
+
+            owner = order.owner
+            if owner is None:
+                owner = self.runningstrats[0]  # default
+
+            owner._addnotification(order, quicknotify=self.p.quicknotify)
+
+        if not self.p.quicknotify:
+            # 只通知订单和交易，没有新的bar，不再通知现金和价值
+            for strat in runstrats:
+                if strat._orderspending:
+                    strat._notify(qorders=strat._orderspending)
+                    strat.clear()
+
+    # 使用数据的最后一个收盘价平掉退出事件循环的数据的持仓
+    def _retireclose(self, data, runstrats):
+        if not runstrats:
+            return
+
+        size = self._broker.getposition(data).size
+        if not size:
+            return
+
+        # 和订单历史一样，使用Historical订单在给定的价格上立即成交
+        owner = runstrats[0]
+        price = data.close[0]
+        if size > 0:
+            self._broker.sell(owner=owner, data=data, size=size, price=price,
+                              exectype=bt.Order.Historical,
+                              histnotify=True, _checksubmit=False)
+        else:
+            self._broker.buy(owner=owner, data=data, size=-size, price=price,
+                             exectype=bt.Order.Historical,
+                             histnotify=True, _checksubmit=False)
 
     # 检查timer
     def _check_timers(self, runstrats, dt0, cheat=False):
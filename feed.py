@@ -21,22 +21,31 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import codecs
 import collections
 import datetime
+import hashlib
 import inspect
 import io
 import os.path
+import tempfile
 
 import backtrader as bt
 from backtrader import (date2num, num2date, time2num, TimeFrame, dataseries,
                         metabase)
 
-from backtrader.utils.py3 import with_metaclass, zip, range, string_types
-from backtrader.utils import tzparse
+from backtrader.utils.py3 import (with_metaclass, zip, range, string_types,
+                                  integer_types)
+from backtrader.utils import tzparse, date2num_array, num2date_array
 from .dataseries import SimpleFilterWrapper
 from .resamplerfilter import Resampler, Replayer
 from .tradingcal import PandasMarketCalendar
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # 这个元抽象类主要继承OHLCDateTime，然后在初始化的时候对数据的名称、时间、过滤器等进行一定的处理
 class MetaAbstractDataBase(dataseries.OHLCDateTime.__class__):
     # _indcol的属性设置为一个空的字典
@@ -180,6 +189,9 @@ class AbstractDataBase(with_metaclass(MetaAbstractDataBase,
     # 是否已经开始
     _started = False
 
+    # 是否已经退出了cerebro的事件循环
+    _retired = False
+
     def _start_finish(self):
         # A live feed (for example) may have learnt something about the
         # timezones after the start and that's why the date/time related
@@ -304,6 +316,33 @@ class AbstractDataBase(with_metaclass(MetaAbstractDataBase,
         bar by bar)'''
         return False
 
+    # 让数据退出cerebro的事件循环，比如期货或者期权到期之后，不再需要处理这个数据
+    def retire(self):
+        '''Removes the data from the event loop of ``Cerebro``, which will no
+        longer fetch, advance or check it. It can be invoked for example from
+        a strategy when a future or an option expires
+
+        The data keeps its last values. The open position in it is closed if
+        the ``Cerebro`` parameter ``retireclose`` is ``True``
+
+        Datas which cannot deliver any more bars are retired automatically
+        '''
+        if not self._retired:
+            self._retired = True
+            # 通知cerebro在下一次循环的时候处理
+            if getattr(self, '_env', None) is not None:
+                self._env._retiredata(self)
+
+    def retired(self):
+        '''Returns ``True`` if the data has been removed from the event loop'''
+        return self._retired
+
+    def _canretire(self):
+        # 没有bar的时候，如果不是实盘数据，并且没有过滤器或者保存的bar可以在后面产生新的bar，
+        # 这个数据就不会再产生bar了，可以自动退出事件循环
+        return not (self.islive() or self._filters or self._ffilters or
+                    self._barstack or self._barstash)
+
     # 如果最新的状态不等于当前状态，需要把信息添加到notifs中以便更新最新状态
     def put_notification(self, status, *args, **kwargs):
         '''Add arguments to notification queue'''
@@ -342,6 +381,8 @@ class AbstractDataBase(with_metaclass(MetaAbstractDataBase,
         self._barstack = collections.deque()
         self._barstash = collections.deque()
         self._laststatus = self.CONNECTED
+        self._deliverdts = None  # see _bulkpreload
+        self._replaytape = None  # see _replaypreload
 
     # 结束
     def stop(self):
@@ -501,6 +542,260 @@ class AbstractDataBase(with_metaclass(MetaAbstractDataBase,
         self._last()
         self.home()
 
+    # 唯一的过滤器是cls的实例的时候，返回这个过滤器
+    def _solofilter(self, cls):
+        '''Returns the only filter of the data if it is an instance of
+        ``cls`` (added with no arguments) and no bars are in the stacks, else
+        ``None``'''
+        if len(self._filters) != 1 or self._barstack or self._barstash:
+            return None
+
+        ff, fargs, fkwargs = self._filters[0]
+        if not isinstance(ff, cls) or fargs or fkwargs:
+            return None
+
+        if self._ffilters and self._ffilters != self._filters:
+            return None
+
+        return ff
+
+    # 去掉过滤器预加载原始数据，返回数据之后清空line
+    def _preloadsource(self):
+        '''Preloads the bars of the source without the filters, resets the
+        lines and returns the values (one array per line) and the extension
+        of the lines'''
+        filters, ffilters = self._filters, self._ffilters
+        self._filters, self._ffilters = list(), list()
+        try:
+            self.preload()  # the bars of the source
+        finally:
+            self._filters, self._ffilters = filters, ffilters
+
+        size = self.buflen()
+        extension = self.lines[0].extension
+        values = [np.array(line.array[0:size], dtype=np.float64)
+                  for line in self.lines]
+
+        for line in self.lines:
+            line.reset()
+
+        return values, extension
+
+    # 预加载数据，如果只有一个抽样的过滤器，使用数组一次性完成抽样
+    def _bulkpreload(self):
+        '''Preloads the data like ``preload`` does, but if the only filter is
+        a ``Resampler`` the bars of the source are preloaded first and then
+        resampled in bulk (see the parameter ``bulkresample`` of ``Cerebro``)
+        '''
+        resampler = self._solofilter(Resampler)
+        if resampler is None:
+            self.preload()
+            return
+
+        values, extension = self._preloadsource()
+
+        bars = None
+        if resampler._canbulk(self):
+            bars = resampler._bulkresample(self, values)
+
+        for line in self.lines:
+            if bars is not None:
+                line.forwardarray(bars[0].pop(0))
+
+            line.extend(size=extension)
+
+        if bars is not None:
+            delivers = bars[1].tolist()
+        else:
+            # 逐个bar抽样，和load中调用过滤器一样
+            delivers = list()
+            dtidx = [line is self.lines.datetime for line in self.lines]
+            dtidx = dtidx.index(True)
+            for bar in zip(*[x.tolist() for x in values]):
+                self.forward()
+                for line, value in zip(self.lines, bar):
+                    line[0] = value
+
+                resampler(self)
+                while self._fromstack(forward=True):
+                    delivers.append(bar[dtidx])
+
+            self._last()
+            delivers.extend([float('inf')] * (self.buflen() - len(delivers)))
+
+        # 克隆的数据只有在主数据到达的时候才能交付抽样的bar
+        if self._clone:
+            self._deliverdts = delivers
+
+        self.home()
+
+    # 判断回放的数据是否可以预先计算回放的过程
+    def _canpreloadreplay(self):
+        '''Returns ``True`` if the data is replayed (not from a clone) and
+        the deliveries of the replay can be precomputed with
+        ``_replaypreload``'''
+        return (np is not None and not self._clone and
+                self._solofilter(Replayer) is not None)
+
+    # 预加载回放的数据，预先计算每次交付的bar，运行的时候按照顺序交付
+    def _replaypreload(self):
+        '''Preloads the bars of the source of a replayed data and
+        precomputes the (partial) bars delivered by the replay, which
+        ``load`` then delivers one at a time without going through the
+        filter. The lines remain empty as for a data which is not preloaded
+        (see the parameter ``bulkreplay`` of ``Cerebro``)
+
+        Only to be used if ``_canpreloadreplay`` returns ``True``
+        '''
+        replayer = self._solofilter(Replayer)
+        values, extension = self._preloadsource()
+
+        tape = None
+        if replayer._canbulk(self):
+            tape = replayer._bulkreplay(self, values)
+
+        if tape is not None:
+            forwards, bars, ticks = tape
+            tape = [forwards.astype(np.float64)] + bars + ticks
+        else:
+            # 逐个bar回放，和load中调用过滤器一样，记录每次交付的bar
+            rows, lens = list(), [0]
+            aliases = self.getlinealiases()
+
+            def record():
+                rows.append([len(self) > lens[-1]] +
+                            [line[0] for line in self.lines] +
+                            [getattr(self, 'tick_' + alias)
+                             if alias != 'datetime' else float('NaN')
+                             for alias in aliases])
+                lens.append(len(self))
+
+            for bar in zip(*[x.tolist() for x in values]):
+                self.forward()
+                for line, value in zip(self.lines, bar):
+                    line[0] = value
+
+                if not replayer(self):  # bar not removed
+                    record()
+                while self._fromstack(forward=True):
+                    record()
+
+            for line in self.lines:
+                line.reset()
+
+            tape = list(np.array(rows, dtype=np.float64).reshape(
+                len(rows), 1 + 2 * len(aliases)).T)
+
+        for line in self.lines:
+            line.extend(size=extension)
+
+        self._tick_nullify()
+        self._replaytape = np.column_stack(tape) if len(tape[0]) else None
+        self._replayidx = 0
+        self._replayticks = [None if alias == 'datetime' else 'tick_' + alias
+                             for alias in self.getlinealiases()]
+
+    # 按照预先计算的结果交付回放的bar
+    def _replayload(self):
+        '''Delivers the next precomputed bar of the replay (as ``load``
+        does after passing the bar of the source through the replayer)'''
+        if self._replayidx >= len(self._replaytape):
+            self._replaytape = None  # all delivered
+            return False
+
+        row = self._replaytape[self._replayidx].tolist()
+        self._replayidx += 1
+        if row[0]:
+            self.forward()
+
+        ticks = self._replayticks
+        for line, value in zip(self.lines, row[1:]):
+            line[0] = value
+
+        for attr, value in zip(ticks, row[len(ticks) + 1:]):
+            if attr is not None:
+                setattr(self, attr, value)
+
+        self.tick_last = getattr(self, ticks[0])
+        return True
+
+    # 预加载的抽样数据交付bar的时间
+    def _delivery(self, idx):
+        '''Returns the datetime at which the resampled bar at position
+        ``idx`` is delivered: the time of the bar or, for the clones
+        preloaded with ``_bulkpreload``, the later time of the bar of the
+        source which delivers it when resampling bar by bar
+        '''
+        dt = self.lines.datetime.array[idx]
+        if self._deliverdts is not None:
+            dt = max(dt, self._deliverdts[idx])
+
+        return dt
+
+    # 通过seek跳过数据的时候，可以跳过的时间
+    def _seektarget(self):
+        '''Returns the datetime before which sorted bars can be skipped
+        unread when seeking in a source, or ``None`` if ``fromdate`` is not
+        set. Bars after it still go through the ``fromdate`` check
+        '''
+        if self.fromdate == float('-inf'):
+            return None
+
+        # the input timezone moves the datetime by less than a day
+        return self.fromdate - (1.0 if self._tzinput else 0.0)
+
+    # 判断是否可以使用_preloadarrays一次性加载全部数据
+    def _canpreloadarrays(self):
+        '''Returns ``True`` if the bars can be preloaded in a single pass with
+        ``_preloadarrays``, i.e.: no filters, no bars in the stacks and lines
+        in unbounded mode
+        '''
+        if np is None or self._filters or self._ffilters:
+            return False
+
+        if self._barstack or self._barstash:
+            return False
+
+        return all(line.mode == line.UnBounded for line in self.lines)
+
+    # 一次性加载全部数据，和逐个bar调用load的结果一致
+    def _preloadarrays(self, values):
+        '''Preloads the bars given in ``values`` (one array per line, in the
+        order of the lines) in a single pass
+
+        As ``load`` does, the input timezone is applied to the datetime and
+        bars before ``fromdate`` are discarded and loading stops at the first
+        bar after ``todate``
+
+        Only to be used if ``_canpreloadarrays`` returns ``True``
+        '''
+        dtline = self.lines.datetime
+        dtidx = [line is dtline for line in self.lines].index(True)
+        dts = np.asarray(values[dtidx], dtype=np.float64)
+        if self._tzinput:
+            # Input has been converted at face value but it's not UTC
+            dts = date2num_array(num2date_array(dts), tz=self._tzinput)
+
+        count = len(dts)
+        late = np.flatnonzero(dts > self.todate)
+        if len(late):
+            count = late[0]
+
+        keep = dts[:count] >= self.fromdate
+        if keep.all():
+            keep = slice(0, count)
+        else:
+            keep = np.flatnonzero(keep)
+
+        for i, line in enumerate(self.lines):
+            if i == dtidx:
+                line.forwardarray(dts[keep])
+            else:
+                line.forwardarray(np.asarray(values[i], dtype=np.float64)[keep])
+
+        self._last()
+        self.home()
+
     # 使用过滤器的最后一个机会
     def _last(self, datamaster=None):
         # Last chance for filters to deliver something
@@ -532,7 +827,11 @@ class AbstractDataBase(with_metaclass(MetaAbstractDataBase,
 
     # 加载数据
     def load(self):
-        
+        # 回放的bar已经预先计算
+        if self._replaytape is not None and not (self._barstack or
+                                                 self._barstash):
+            return self._replayload()
+
         while True:
             # move data pointer forward for new bar
             # 把数据指针向前移动一位
@@ -756,15 +1055,63 @@ class CSVDataBase(with_metaclass(MetaCSVDataBase, DataBase)):
 
     The return value of ``_loadline`` (True/False) will be the return value
     of ``_load`` which has been overriden by this base class
+
+    Params:
+
+      - ``cache`` (default: ``False``)
+
+        If ``True`` the parsed values are cached in a binary file inside a
+        ``__btcache__`` directory next to the CSV file. A string gives the
+        directory to use. The cache is keyed by the path, modification time
+        and size of the file and the parsing parameters, and later loads map
+        the values directly into the lines without parsing the text
+
+        Parsing parameters which are callables (like a ``dtformat``
+        function) or other objects without a stable representation disable
+        the cache, because a change in them cannot be detected
+
+        Only the latest cache of each file is kept: writing a new one (after
+        the file or the parsing parameters change) deletes the previous one.
+        Loading the same file with different parsing parameters therefore
+        parses it again each time. The cache directory can also be deleted
+        at any time
+
+      - ``seek`` (default: ``False``)
+
+        If ``True`` and ``fromdate`` is set, the lines before it are skipped
+        without parsing them by means of a binary search on the file, which
+        requires the lines to be sorted by datetime in ascending order.
+
+        The datetimes read during the search are checked to be in ascending
+        order. If they are not or a line cannot be parsed, the file is read
+        from the beginning as usual. The check cannot detect all unsorted
+        files: use it only with files known to be sorted
     '''
     # 数据默认是None
     f = None
     # 设置具体的参数
-    params = (('headers', True), ('separator', ','),)
+    params = (('headers', True), ('separator', ','), ('cache', False),
+              ('seek', False),)
+
+    # 可以直接按照字节位置定位的编码
+    _seekencodings = ('utf-8', 'ascii', 'iso8859-1', 'cp1252', 'gbk',
+                      'gb18030')
+    # 二分查找结束时剩余的字节数，剩余的数据逐行读取
+    _seekblock = 4096
+
+    # 不影响解析结果的参数，不作为缓存的key，filters在读取缓存之后才使用
+    _cacheignore = ('fromdate', 'todate', 'name', 'cache', 'filters', 'seek')
 
     # 获取数据并简单处理
     def start(self):
         super(CSVDataBase, self).start()
+        # 如果有缓存的数据，直接从缓存中加载，不需要打开文件
+        self._cachevalues = None
+        self._cacheidx = 0
+        self._cachefile = self._getcachefile()
+        if self._cachefile is not None and os.path.exists(self._cachefile):
+            self._cachevalues = np.load(self._cachefile, mmap_mode='r')
+            return
         # 如果数据是None的话
         if self.f is None:
             # 如果参数中dataname具有readline属性，那么就说明dataname是一个数据，直接f等于参数中的数据
@@ -779,6 +1126,8 @@ class CSVDataBase(with_metaclass(MetaCSVDataBase, DataBase)):
             self.f.readline()  # skip the headers
         # 每一行数据的分隔符
         self.separator = self.p.separator
+        # 第一次加载数据的时候，跳过fromdate之前的数据
+        self._seekpending = self.p.seek and self._cachefile is None
 
     # 停止
     def stop(self):
@@ -788,26 +1137,148 @@ class CSVDataBase(with_metaclass(MetaCSVDataBase, DataBase)):
             self.f.close()
             self.f = None
 
+        self._cachevalues = None
+
+    # 获取缓存文件的地址，如果不使用缓存，返回None
+    def _getcachefile(self):
+        if not self.p.cache or np is None:
+            return None
+
+        if not isinstance(self.p.dataname, string_types):
+            return None  # only files can be cached
+
+        path = os.path.abspath(self.p.dataname)
+        if self.p.cache is True:
+            cachedir = os.path.join(os.path.dirname(path), '__btcache__')
+        else:
+            cachedir = self.p.cache
+
+        # 参数中有函数或者其他没有稳定表示的对象的时候，无法判断缓存是否有效，不使用缓存
+        try:
+            params = [(k, self._cachevalue(v))
+                      for k, v in self.p._getkwargs().items()
+                      if k not in self._cacheignore]
+        except TypeError:
+            return None
+
+        stat = os.stat(path)
+        key = repr((path, stat.st_mtime_ns, stat.st_size,
+                    self.__class__.__module__, self.__class__.__name__,
+                    self.getlinealiases(), params))
+
+        # 文件名包括路径的hash，同一个文件新的缓存会替换之前的缓存
+        pathdigest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        filename = '%s.%s.%s.npy' % (os.path.basename(path), pathdigest,
+                                     digest)
+        return os.path.join(cachedir, filename)
+
+    # 把参数的值转换成稳定的表示，用于生成缓存的key，不能转换的时候抛出TypeError
+    @classmethod
+    def _cachevalue(cls, value):
+        if value is None or isinstance(value, (bool, float, string_types) +
+                                       integer_types):
+            return value
+
+        if isinstance(value, (datetime.datetime, datetime.date,
+                              datetime.time, datetime.timedelta)):
+            return value
+
+        if isinstance(value, (list, tuple)):
+            return tuple(cls._cachevalue(v) for v in value)
+
+        # pytz的时区使用时区的名称
+        zone = getattr(value, 'zone', None)
+        if isinstance(value, datetime.tzinfo) and \
+                isinstance(zone, string_types):
+            return ('tzinfo', zone)
+
+        raise TypeError('No stable representation for %r' % (value,))
+
+    # 解析全部数据并保存到缓存文件中
+    def _writecache(self):
+        # 每个bar使用lines解析之后马上回退，lines的状态(包括lookahead扩展的位置)
+        # 和解析之前一样
+        bars = []
+        while True:
+            self.forward()
+            if not self._load():
+                self.backwards(force=True)
+                break
+
+            bars.append([line[0] for line in self.lines])
+            self.backwards()
+
+        values = np.array(bars, dtype=np.float64).reshape(
+            -1, self.lines.fullsize())
+        values = np.ascontiguousarray(values.T)
+
+        cachedir = os.path.dirname(self._cachefile)
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+        # 先写入临时文件，再重命名，避免其他进程读取到不完整的缓存
+        fd, tmpname = tempfile.mkstemp(suffix='.npy', dir=cachedir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, values)
+
+        os.replace(tmpname, self._cachefile)
+        self._dropcache()
+        return values
+
+    # 删除同一个文件之前的缓存(文件或者参数变化之后留下的)
+    def _dropcache(self):
+        cachedir, filename = os.path.split(self._cachefile)
+        prefix = filename.rsplit('.', 2)[0] + '.'
+        for name in os.listdir(cachedir):
+            if name != filename and name.startswith(prefix) and \
+                    name.endswith('.npy') and name.count('.') == \
+                    filename.count('.'):
+                try:
+                    os.remove(os.path.join(cachedir, name))
+                except OSError:
+                    pass  # removed by another process or still in use
+
     # 提前load数据
     def preload(self):
-        # load数据
-        while self.load():
-            pass
-        # 结束load之后的设置
-        self._last()
-        self.home()
+        # 使用缓存的时候，如果还没有缓存，先解析全部数据并进行缓存
+        if self._cachefile is not None and self._cachevalues is None and \
+                all(line.mode == line.UnBounded for line in self.lines):
+            self._cachevalues = self._writecache()
+
+        if self._cachevalues is not None and self._canpreloadarrays():
+            self._preloadarrays(self._cachevalues)
+            self._cacheidx = self._cachevalues.shape[1]
+        else:
+            # load数据
+            while self.load():
+                pass
+            # 结束load之后的设置
+            self._last()
+            self.home()
 
         # preloaded - no need to keep the object around - breaks multip in 3.x
         # 关闭数据文件，并设置成None
-        self.f.close()
-        self.f = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+        self._cachevalues = None
 
     # 加载一行数据
     def _load(self):
+        # 如果有缓存的数据，从缓存中加载
+        if self._cachevalues is not None:
+            return self._loadcache()
+
         # 如果数据文件是None，返回False,如果读取不到line了，返回False,对line进行处理，调用_loadline进行加载
         if self.f is None:
             return False
 
+        if self._seekpending:
+            self._seekpending = False
+            self._seekfromdate()
+
         # Let an exception propagate to let the caller know
         line = self.f.readline()
 
@@ -818,6 +1289,92 @@ class CSVDataBase(with_metaclass(MetaCSVDataBase, DataBase)):
         linetokens = line.split(self.separator)
         return self._loadline(linetokens)
 
+    # 通过二分查找，跳过fromdate之前的数据
+    def _seekfromdate(self):
+        '''Moves the file forward to a line which is before the first one
+        with a datetime greater or equal than ``fromdate`` without parsing
+        the lines in between. The remaining lines are filtered by ``load``
+        '''
+        target = self._seektarget()
+        if target is None:
+            return
+
+        # 只处理打开的文件，不处理传入的文件对象
+        f = self.f
+        if getattr(f, 'name', None) != self.p.dataname or not f.seekable():
+            return
+
+        if codecs.lookup(f.encoding).name not in self._seekencodings:
+            return
+
+        with io.open(self.p.dataname, 'rb') as bf:
+            if self.p.headers:
+                bf.readline()
+
+            lo = begin = bf.tell()
+            hi = end = bf.seek(0, io.SEEK_END)
+            # 读取的行的位置和时间，用于检查数据是否是按照时间递增的顺序排列
+            probes = list()
+            try:
+                # 第一行和最后一个数据块中的行
+                probes.append((begin, self._seekdatetime(bf, begin, False)))
+                last = max(begin, end - self._seekblock)
+                probes.append((last, self._seekdatetime(bf, last)))
+
+                while hi - lo > self._seekblock:
+                    mid = (lo + hi) // 2
+                    dt = self._seekdatetime(bf, mid)
+                    probes.append((mid, dt))
+                    if dt is None or not dt < target:
+                        hi = mid
+                    else:
+                        lo = mid
+            except (ValueError, IndexError, TypeError, OverflowError):
+                return  # line cannot be parsed: read the file from the start
+
+            # 时间不是递增的时候，从头开始逐行读取
+            dts = [dt for pos, dt in sorted(probes) if dt is not None]
+            if any(dt1 < dt0 for dt0, dt1 in zip(dts, dts[1:])):
+                return
+
+            if lo > begin:
+                # the line after lo is before target: start with it
+                bf.seek(lo)
+                bf.readline()
+                f.seek(bf.tell())
+
+    # 获取pos之后第一个完整的行的时间，如果无法获取，返回None
+    # skip是True的时候，先跳过pos所在的行(可能不完整)
+    def _seekdatetime(self, bf, pos, skip=True):
+        bf.seek(pos)
+        if skip:
+            bf.readline()  # skip the (maybe partial) line
+
+        line = bf.readline().decode(self.f.encoding).rstrip('\r\n')
+        if not line:
+            return None
+
+        linetokens = line.split(self.separator)
+        self.forward()
+        try:
+            if not self._loadline(linetokens):
+                return None
+
+            return self.lines.datetime[0]
+        finally:
+            self.backwards()
+
+    # 从缓存中加载一个bar
+    def _loadcache(self):
+        if self._cacheidx >= self._cachevalues.shape[1]:
+            return False
+
+        for line, value in zip(self.lines, self._cachevalues[:, self._cacheidx]):
+            line[0] = value
+
+        self._cacheidx += 1
+        return True
+
     # 获取下一行数据
     def _getnextline(self):
         # 这个函数和上一个很类似，只是上一个函数获取了linetokens多了一个_loadline的调用
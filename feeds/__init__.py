@@ -32,6 +32,11 @@ from .sierrachart import *
 from .mt4csv import *
 from .pandafeed import *
 from .influxfeed import *
+try:
+    from .mmapdata import *
+except ImportError:
+    pass  # The user may not have numpy installed
+
 try:
     from .ibdata import *
 except ImportError:
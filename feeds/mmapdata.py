@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Copyright (C) 2015-2020 Daniel Rodriguez
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import array
+import os
+
+import numpy as np
+
+import backtrader as bt
+from .. import feed
+from ..linebuffer import MMapLineArray
+
+__all__ = ['MMapData', 'MMapDataWriter']
+
+
+# 内存映射的数据格式：一个目录，每条line保存为一个文件，文件名是line的名字加上.f8
+# 文件中是按照时间顺序排列的float64数据，datetime需要是递增的
+def _linefile(path, alias):
+    return os.path.join(path, alias + '.f8')
+
+
+class MMapData(feed.DataBase):
+    '''
+    Maps the columnar on-disk format written by ``MMapDataWriter`` with
+    ``numpy.memmap``, which allows backtesting histories larger than the
+    available memory
+
+    The format is a directory with one file per line (``datetime.f8``,
+    ``open.f8``, ...) holding the values as native ``float64`` with the
+    datetime in ascending order. Lines without a file are ``NaN``
+
+    ``fromdate`` and ``todate`` are resolved with a binary search on the
+    datetime and ``preload`` maps the selected range into the lines without
+    copying it (the values are copied only if they are modified)
+
+    Specific parameters:
+
+      - ``dataname``: the directory holding the files
+    '''
+
+    def start(self):
+        super(MMapData, self).start()
+        path = self.p.dataname
+        self._files = dict()
+        self._mms = dict()
+        for alias in self.getlinealiases():
+            filename = _linefile(path, alias)
+            if os.path.exists(filename):
+                self._files[alias] = filename
+                self._mms[alias] = np.memmap(filename, dtype=np.float64,
+                                             mode='r')
+
+        if 'datetime' not in self._mms:
+            raise ValueError('No datetime found in %s' % path)
+
+        self._size = len(self._mms['datetime'])
+        self._begin = None  # range to be delivered is resolved on first use
+
+    def stop(self):
+        super(MMapData, self).stop()
+        self._mms = dict()
+
+    def _getrange(self):
+        # 通过二分查找确定fromdate和todate对应的位置
+        if self._begin is None:
+            self._begin, self._end = 0, self._size
+            if not self._tzinput:  # input times are the stored ones
+                dts = self._mms['datetime']
+                self._begin = int(np.searchsorted(dts, self.fromdate, 'left'))
+                self._end = int(np.searchsorted(dts, self.todate, 'right'))
+
+            self._idx = self._begin
+
+        return self._begin, self._end
+
+    def preload(self):
+        begin, end = self._getrange()
+        if not self._canpreloadarrays():
+            super(MMapData, self).preload()
+            return
+
+        # 如果需要转换时区或者lines中已经有数据，复制数据之后加载
+        if self._tzinput or any(len(line.array) for line in self.lines):
+            values = list()
+            for alias in self.getlinealiases():
+                if alias in self._mms:
+                    values.append(self._mms[alias][begin:end])
+                else:
+                    values.append(np.full(end - begin, float('NaN')))
+
+            self._preloadarrays(values)
+            self._idx = end
+            return
+
+        # 不复制数据，直接把文件映射到lines中
+        size = end - begin
+        for alias in self.getlinealiases():
+            line = getattr(self.lines, alias)
+            if alias in self._files:
+                line.array = MMapLineArray(self._files[alias], begin, size)
+                line.advance(size)
+            else:
+                line.forwardarray(np.full(size, float('NaN')))
+
+        self._idx = end
+        self._last()
+        self.home()
+
+    def _load(self):
+        begin, end = self._getrange()
+        if self._idx >= end:
+            return False
+
+        i = self._idx
+        for alias in self.getlinealiases():
+            mm = self._mms.get(alias)
+            if mm is not None:
+                getattr(self.lines, alias)[0] = mm[i]
+
+        self._idx += 1
+        return True
+
+
+class MMapDataWriter(object):
+    '''
+    Writes the bars delivered by a data feed in the on-disk format read by
+    ``MMapData``
+
+    The bars are read one at a time keeping only the minimum in memory and
+    are written in chunks of ``chunksize`` bars, which allows converting
+    histories larger than the available memory
+
+    Args:
+
+      - ``path``: directory in which the line files are written. Existing
+        files are overwritten
+
+      - ``chunksize`` (default: ``65536``): bars kept in memory before
+        writing them
+    '''
+
+    def __init__(self, path, chunksize=65536):
+        self.path = path
+        self.chunksize = chunksize
+
+    def write(self, data):
+        '''Writes all bars of ``data`` and returns the number of bars'''
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        if getattr(data, '_env', None) is None:
+            data.setenvironment(bt.Cerebro())
+
+        data.qbuffer(savemem=1)
+        data._start()
+
+        aliases = data.getlinealiases()
+        lines = [getattr(data.lines, alias) for alias in aliases]
+        files = [open(_linefile(self.path, alias), 'wb') for alias in aliases]
+        chunks = [array.array(str('d')) for alias in aliases]
+
+        count = 0
+        try:
+            while data.load():
+                for line, chunk in zip(lines, chunks):
+                    chunk.append(line[0])
+
+                count += 1
+                if not count % self.chunksize:
+                    for chunk, f in zip(chunks, files):
+                        chunk.tofile(f)
+                        del chunk[:]
+
+            if data._last():  # filters may deliver a last bar
+                for line, chunk in zip(lines, chunks):
+                    chunk.append(line[0])
+
+                count += 1
+
+            for chunk, f in zip(chunks, files):
+                chunk.tofile(f)
+        finally:
+            for f in files:
+                f.close()
+
+            data.stop()
+
+        return count
@@ -24,8 +24,14 @@ from __future__ import (absolute_import, division, print_function,
 from backtrader.utils.py3 import filter, string_types, integer_types
 
 from backtrader import date2num
+from backtrader.utils import date2num_array
 import backtrader.feed as feed
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # backtrader通过pandas加载数据
 class PandasDirectData(feed.DataBase):
     '''
@@ -254,6 +260,60 @@ class PandasData(feed.DataBase):
             # 如果不是字符串，用户自定义了具体的整数，直接使用用户自定义的
             self._colmapping[k] = v
 
+    def preload(self):
+        # 满足条件的时候，按列一次性加载全部数据，否则逐行加载
+        if not self._preload_columns():
+            super(PandasData, self).preload()
+
+    def _preload_columns(self):
+        '''Loads all rows in a single pass by converting the columns of the
+        DataFrame to float arrays and extending the lines with them
+
+        Returns ``False`` (and loads nothing) if the standard row by row
+        loading has to be used: filters, not unbounded lines or a datetime
+        column that cannot be converted
+        '''
+        if not self._canpreloadarrays():
+            return False
+
+        df = self.p.dataname
+        coldtime = self._colmapping['datetime']
+        if coldtime is None:
+            tstamps = df.index
+        else:
+            tstamps = df.iloc[:, coldtime]
+
+        try:
+            dts = date2num_array(tstamps)
+        except (TypeError, ValueError):
+            return False
+
+        if np.isnan(dts).any():  # NaT cannot be loaded
+            return False
+
+        values = list()
+        for datafield in self.getlinealiases():
+            if datafield == 'datetime':
+                values.append(dts)
+                continue
+
+            colindex = self._colmapping[datafield]
+            if colindex is None:
+                values.append(np.full(len(dts), float('NaN')))
+                continue
+
+            try:
+                values.append(np.asarray(df.iloc[:, colindex],
+                                         dtype=np.float64))
+            except (TypeError, ValueError):
+                return False
+
+        self._preloadarrays(values)
+
+        # 所有的行都已经加载，后续调用_load的时候返回False
+        self._idx = len(df) - 1
+        return True
+
     def _load(self):
         # 每次load一行，_idx每次加1
         self._idx += 1
@@ -300,3 +360,4 @@ class PandasData(feed.DataBase):
 
         # Done ... return
         return True
+
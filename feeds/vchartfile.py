@@ -49,7 +49,12 @@ class VChartFile(bt.with_metaclass(MetaVChartFile, bt.DataBase)):
 
       - ``dataname``: Market code displayed by Visual Chart. Example: 015ES for
         EuroStoxx 50 continuous future
+
+      - ``seek`` (default: ``False``): if ``True`` and ``fromdate`` is set,
+        the bars before it are skipped by means of a binary search on the
+        file, which requires the bars to be sorted by datetime
     '''
+    params = (('seek', False),)
 
     def start(self):
         super(VChartFile, self).start()
@@ -89,15 +94,59 @@ class VChartFile(bt.with_metaclass(MetaVChartFile, bt.DataBase)):
         except IOError:
             self.f = None
 
+        self._seekpending = self.p.seek and self.f is not None
+
     def stop(self):
         if self.f is not None:
             self.f.close()
             self.f = None
 
+    def _seekfromdate(self):
+        # Bars have a fixed size and are sorted: binary search fromdate
+        target = self._seektarget()
+        if target is None:
+            return
+
+        lo, hi = 0, self.f.seek(0, os.SEEK_END) // self._barsize
+        try:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                self.f.seek(mid * self._barsize)
+                bdata = unpack(self._barfmt, self.f.read(self._barsize))
+                if date2num(self._bardatetime(bdata)) < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        except ValueError:
+            lo = 0  # invalid bar: read the file from the start
+
+        self.f.seek(lo * self._barsize)
+
+    def _bardatetime(self, bdata):
+        # First Date
+        y, md = divmod(bdata[0], 500)  # Years stored as if they had 500 days
+        m, d = divmod(md, 32)  # Months stored as if they had 32 days
+        dt = datetime(y, m, d)
+
+        # Time
+        if self._dtsize > 1:  # Minute Bars
+            # Daily Time is stored in seconds
+            hhmm, ss = divmod(bdata[1], 60)
+            hh, mm = divmod(hhmm, 60)
+            dt = dt.replace(hour=hh, minute=mm, second=ss)
+        else:  # Daily Bars
+            dt = datetime.combine(dt, self.p.sessionend)
+
+        return dt
+
     def _load(self):
         if self.f is None:
             return False  # cannot load more
 
+        if self._seekpending:
+            self._seekpending = False
+            self._seekfromdate()
+
         try:
             bardata = self.f.read(self._barsize)
         except IOError:
@@ -114,20 +163,7 @@ class VChartFile(bt.with_metaclass(MetaVChartFile, bt.DataBase)):
             self.f = None
             return False
 
-        # First Date
-        y, md = divmod(bdata[0], 500)  # Years stored as if they had 500 days
-        m, d = divmod(md, 32)  # Months stored as if they had 32 days
-        dt = datetime(y, m, d)
-
-        # Time
-        if self._dtsize > 1:  # Minute Bars
-            # Daily Time is stored in seconds
-            hhmm, ss = divmod(bdata[1], 60)
-            hh, mm = divmod(hhmm, 60)
-            dt = dt.replace(hour=hh, minute=mm, second=ss)
-        else:  # Daily Bars
-            dt = datetime.combine(dt, self.p.sessionend)
-
+        dt = self._bardatetime(bdata)
         self.lines.datetime[0] = date2num(dt)  # Store time
 
         # Get the rest of the fields
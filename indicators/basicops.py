@@ -26,6 +26,7 @@ import math
 import operator
 
 from ..utils.py3 import map, range
+from .. import mathsupport
 
 from . import Indicator
 
@@ -59,7 +60,19 @@ class OperationN(PeriodN):
     Formula:
       - line = func(data, period)
     '''
+    # 增量计算滚动窗口的对象，在nextstart的时候根据func进行创建
+    _rolling = None
+
+    def nextstart(self):
+        # max, min, math.fsum可以增量计算，每个bar的计算量是O(1)
+        self._rolling = mathsupport.rollingkernel(self.func, self.p.period)
+        self.next()
+
     def next(self):
+        if self._rolling is not None:
+            self.line[0] = self._rolling.update(self.data)
+            return
+
         self.line[0] = self.func(self.data.get(size=self.p.period))
 
     def once(self, start, end):
@@ -68,6 +81,13 @@ class OperationN(PeriodN):
         period = self.p.period
         func = self.func
 
+        # 数据使用numpy保存的时候，尝试对整个窗口进行向量化计算
+        if mathsupport.isvectorizable(dst, src):
+            vals = mathsupport.rolling_reduce(func, src, period, start, end)
+            if vals is not None:
+                dst[start:end] = vals
+                return
+
         for i in range(start, end):
             dst[i] = func(src[i - period + 1: i + 1])
 
@@ -359,7 +379,18 @@ class Average(PeriodN):
     alias = ('ArithmeticMean', 'Mean',)
     lines = ('av',)
 
+    # 增量计算过去period个值的和的对象，在nextstart的时候创建
+    _rolling = None
+
+    def nextstart(self):
+        self._rolling = mathsupport.RollingSum(self.p.period)
+        self.next()
+
     def next(self):
+        if self._rolling is not None:
+            self.line[0] = self._rolling.update(self.data) / self.p.period
+            return
+
         self.line[0] = \
             math.fsum(self.data.get(size=self.p.period)) / self.p.period
 
@@ -368,6 +399,13 @@ class Average(PeriodN):
         dst = self.line.array
         period = self.p.period
 
+        if mathsupport.isvectorizable(dst, src):
+            vals = mathsupport.rolling_reduce(math.fsum, src, period,
+                                              start, end)
+            if vals is not None:
+                dst[start:end] = vals / period
+                return
+
         for i in range(start, end):
             dst[i] = math.fsum(src[i - period + 1:i + 1]) / period
 
@@ -416,6 +454,14 @@ class ExponentialSmoothing(Average):
 
         # Seed value from SMA calculated with the call to oncestart
         prev = larray[start - 1]
+
+        if mathsupport.isvectorizable(darray, larray):
+            vals = mathsupport.exp_smoothing(darray, start, end, prev,
+                                             alpha, alpha1)
+            if vals is not None:
+                larray[start:end] = vals
+                return
+
         for i in range(start, end):
             larray[i] = prev = prev * alpha1 + darray[i] * alpha
 
@@ -497,6 +543,13 @@ class WeightedAverage(PeriodN):
         coef = self.p.coef
         weights = self.p.weights
 
+        if len(weights) == period and \
+                mathsupport.isvectorizable(darray, larray):
+            window = mathsupport.rolling_window(darray, period, start, end)
+            if window is not None:
+                larray[start:end] = coef * window.dot(weights)
+                return
+
         for i in range(start, end):
             data = darray[i - period + 1: i + 1]
             larray[i] = coef * math.fsum(map(operator.mul, data, weights))
@@ -41,12 +41,218 @@ from .utils.py3 import range, with_metaclass, string_types
 
 from .lineroot import LineRoot, LineSingle, LineMultiple
 from . import metabase
+from . import mathsupport
 from .utils import num2date, time2num
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 NAN = float('NaN')
 
 
+class NumpyLineArray(object):
+    '''
+    Growable storage for a *line* backed by a preallocated
+    ``numpy.ndarray`` of ``float64``.
+
+    It mimics the subset of the ``array.array`` interface used by
+    ``LineBuffer`` (``append``, ``extend``, ``pop``, indexing and slicing)
+    with one important difference: slices are returned as ``numpy`` views of
+    the underlying storage and not as copies, which allows indicators to
+    operate on whole arrays in vectorized form
+
+    ``numpy.asarray(linearray)`` also returns a (zero-copy) view over the
+    valid part of the buffer
+    '''
+    # 使用预先分配内存的numpy.ndarray保存line的数据，空间不够的时候按照倍数扩容
+    # 单个值的访问返回python的float,切片的访问返回numpy的视图，不会复制数据
+    __slots__ = ('_buf', '_len')
+
+    # 初始分配的容量
+    _mincapacity = 1024
+
+    def __init__(self, values=None, capacity=0):
+        if np is None:
+            raise ImportError('numpy is needed for linestorage="numpy"')
+
+        self._len = 0
+        self._buf = np.empty(max(capacity, self._mincapacity),
+                             dtype=np.float64)
+        if values is not None:
+            self.extend(values)
+
+    def _reserve(self, size):
+        # 保证至少有size个位置可以使用，不够的时候容量翻倍
+        if size <= len(self._buf):
+            return
+
+        capacity = max(size, 2 * len(self._buf))
+        buf = np.empty(capacity, dtype=np.float64)
+        buf[:self._len] = self._buf[:self._len]
+        self._buf = buf
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self._buf[:self._len].tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        view = self._buf[:self._len]
+        if dtype is not None:
+            return view.astype(dtype, copy=False)
+        return view
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._buf[:self._len][key]
+
+        # same semantics as array.array for negative and out of range indices
+        if key < 0:
+            key += self._len
+        if 0 <= key < self._len:
+            return float(self._buf[key])
+
+        raise IndexError('array index out of range')
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._len)
+            if key.step is None and key.stop is not None and \
+                    key.stop > self._len:
+                # array.array grows when assigning beyond the end
+                self._reserve(key.stop)
+                self._buf[self._len:key.stop] = NAN
+                self._len = key.stop
+                stop = key.stop
+            self._buf[start:stop:step] = value
+            return
+
+        if key < 0:
+            key += self._len
+        if not 0 <= key < self._len:
+            raise IndexError('array assignment index out of range')
+
+        self._buf[key] = value
+
+    def __delitem__(self, key):
+        values = np.delete(self._buf[:self._len], np.arange(self._len)[key])
+        self._len = len(values)
+        self._buf[:self._len] = values
+
+    def append(self, value):
+        if self._len == len(self._buf):
+            self._reserve(self._len + 1)
+
+        self._buf[self._len] = value
+        self._len += 1
+
+    def extend(self, values):
+        values = np.asarray(
+            values if hasattr(values, '__len__') else list(values),
+            dtype=np.float64)
+        size = self._len + len(values)
+        self._reserve(size)
+        self._buf[self._len:size] = values
+        self._len = size
+
+    def fill(self, value, size):
+        '''Appends ``size`` times ``value`` in a single operation'''
+        newlen = self._len + size
+        self._reserve(newlen)
+        self._buf[self._len:newlen] = value
+        self._len = newlen
+
+    def pop(self):
+        if not self._len:
+            raise IndexError('pop from empty array')
+
+        self._len -= 1
+        return float(self._buf[self._len])
+
+
+class MMapLineArray(NumpyLineArray):
+    '''
+    ``NumpyLineArray`` whose values live in a memory mapped file, which is
+    shared (read-only) by all processes mapping the file.
+
+    Pickling only transfers the name of the file and the position of the
+    values in it. The receiving process maps the file (once per process) and
+    uses a view of it, which is used to hand over the preloaded data to the
+    workers of an optimization without copying it to each process
+
+    Writing to the values (or enlarging the buffer) makes a private copy
+    first (copy-on-write) and the shared values remain untouched
+    '''
+    # 使用内存映射文件保存line的数据，多个进程映射同一个文件的时候，共享同一份内存
+    # pickle的时候只传递文件名和位置，修改数据的时候会先复制一份私有的数据
+    __slots__ = ('_filename', '_offset')
+
+    # 每个进程中每个文件只映射一次
+    _mmaps = dict()
+
+    def __init__(self, filename, offset, length):
+        if np is None:
+            raise ImportError('numpy is needed for MMapLineArray')
+
+        self._filename = filename
+        self._offset = offset
+        self._len = length
+
+        try:
+            mm = self._mmaps[filename]
+        except KeyError:
+            mm = self._mmaps[filename] = np.memmap(
+                filename, dtype=np.float64, mode='r')
+
+        self._buf = mm[offset:offset + length]
+
+    @classmethod
+    def release(cls, filename):
+        '''Removes the mapping of ``filename`` from the cache'''
+        cls._mmaps.pop(filename, None)
+
+    def _private(self):
+        # 第一次修改数据的时候，复制一份私有的数据，不再使用共享的数据
+        if self._filename is not None:
+            self._buf = np.array(self._buf)
+            self._filename = None
+
+    def _reserve(self, size):
+        self._private()
+        super(MMapLineArray, self)._reserve(size)
+
+    def __setitem__(self, key, value):
+        self._private()
+        super(MMapLineArray, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._private()
+        super(MMapLineArray, self).__delitem__(key)
+
+    def pop(self):
+        self._private()
+        return super(MMapLineArray, self).pop()
+
+    def __getstate__(self):
+        if self._filename is None:  # private copy, transfer the values
+            return (None, None, np.array(self._buf[:self._len]))
+
+        return (self._filename, self._offset, self._len)
+
+    def __setstate__(self, state):
+        filename, offset, length = state
+        if filename is not None:
+            self.__init__(filename, offset, length)
+        else:
+            self._filename = self._offset = None
+            self._buf = length
+            self._len = len(length)
+
+
 class LineBuffer(LineSingle):
     '''
     LineBuffer defines an interface to an "array.array" (or list) in which
@@ -74,6 +280,39 @@ class LineBuffer(LineSingle):
     # 给LineBuffer定义了属性，他们的值分别为0和1
     UnBounded, QBuffer = (0, 1)
 
+    # 非缓存模式下保存数据使用的结构，'array'使用array.array,'numpy'使用NumpyLineArray
+    # 每个line单独设置，Cerebro运行的时候根据linestorage参数进行设置
+    _storage = 'array'
+
+    @staticmethod
+    def checkstorage(storage):
+        '''Raises an exception if ``storage`` is not a valid line storage'''
+        if storage not in ('array', 'numpy'):
+            raise ValueError('Unknown line storage: %s' % storage)
+
+        if storage == 'numpy' and np is None:
+            raise ImportError('numpy is needed for linestorage="numpy"')
+
+    # 设置这个line保存数据的方式，已经保存的数据会保留
+    def setstorage(self, storage):
+        '''
+        Sets the storage used by this line when unbounded, keeping the values
+        already stored
+
+          - ``array``: ``array.array('d')`` (default)
+          - ``numpy``: ``NumpyLineArray`` (growable ``numpy.ndarray``)
+        '''
+        self.checkstorage(storage)
+        self._storage = storage
+        if self.mode == self.QBuffer:
+            return
+
+        if storage == 'numpy':
+            if not isinstance(self.array, NumpyLineArray):
+                self.array = NumpyLineArray(self.array)
+        elif type(self.array) is NumpyLineArray:  # keep shared MMapLineArray
+            self.array = array.array(str('d'), self.array)
+
     # 初始化操作
     def __init__(self):
         self.lines = [self]                     # lines是一个包含自身的列表
@@ -118,6 +357,9 @@ class LineBuffer(LineSingle):
             # allows the forward without removing that bar
             self.array = collections.deque(maxlen=self.maxlen + self.extrasize)
             self.useislice = True
+        elif self._storage == 'numpy':
+            self.array = NumpyLineArray()
+            self.useislice = False
         else:
             self.array = array.array(str('d'))
             self.useislice = False
@@ -125,6 +367,7 @@ class LineBuffer(LineSingle):
         self.lencount = 0
         self.idx = -1
         self.extension = 0
+        self.discarded = 0  # values removed from the start of the buffer
 
     # 设置缓存相关的变量
     def qbuffer(self, savemem=0, extrasize=0):
@@ -172,8 +415,22 @@ class LineBuffer(LineSingle):
         allow for "lookahead" operations. The real amount of data that is
         held/can be held in the buffer
         is returned
+
+        The values removed with ``discard`` are also counted
         '''
-        return len(self.array) - self.extension
+        return len(self.array) - self.extension + self.discarded
+
+    # 删除缓存最前面的数据，用于分块计算的时候限制使用的内存
+    def discard(self, size):
+        ''' Removes the first ``size`` values of the buffer, which can no
+        longer be accessed
+
+        The logical index, the length and ``buflen`` are not affected, but
+        the positions in the underlying buffer are moved back ``size`` places
+        '''
+        del self.array[:size]
+        self._idx -= size
+        self.discarded += size
 
     # 获取值
     def __getitem__(self, ago):
@@ -201,7 +458,11 @@ class LineBuffer(LineSingle):
             return list(islice(self.array, start, end))
         
         # 如果不使用切片，直接截取
-        return self.array[self.idx + ago - size + 1:self.idx + ago + 1]
+        values = self.array[self.idx + ago - size + 1:self.idx + ago + 1]
+        # numpy保存数据的时候返回只读的视图，不复制数据
+        if isinstance(self.array, NumpyLineArray):
+            values.flags.writeable = False
+        return values
 
     # 返回array真正的0处的变量值
     def getzeroval(self, idx=0):
@@ -280,9 +541,40 @@ class LineBuffer(LineSingle):
         self.idx += size
         self.lencount += size
 
+        if isinstance(self.array, NumpyLineArray):
+            self.array.fill(value, size)
+            return
+
         for i in range(size):
             self.array.append(value)
 
+    # 一次性向前移动len(values)位，并把values添加到array中
+    def forwardarray(self, values):
+        ''' Moves the logical index forward over ``values``, which are
+        appended to the buffer in a single operation
+
+        Keyword Args:
+            values (sequence): values to be set in the new positions
+        '''
+        size = len(values)
+        start = self.idx + 1
+        self.idx += size
+        self.lencount += size
+
+        # 和forward一样，数据放在扩展的位置(extend)的前面
+        extension = list(self.array[start:])
+        if extension:
+            del self.array[start:]
+
+        if np is not None and isinstance(self.array, array.array):
+            values = np.ascontiguousarray(values, dtype=np.float64)
+            self.array.frombytes(values.tobytes())
+        else:
+            self.array.extend(values)
+
+        if extension:
+            self.array.extend(extension)
+
     # 向后移动一位
     def backwards(self, size=1, force=False):
         ''' Moves the logical index backwards and reduces the buffer as much as needed
@@ -324,6 +616,10 @@ class LineBuffer(LineSingle):
         set values in the buffer "future"
         '''
         self.extension += size
+        if isinstance(self.array, NumpyLineArray):
+            self.array.fill(value, size)
+            return
+
         for i in range(size):
             self.array.append(value)
 
@@ -365,14 +661,19 @@ class LineBuffer(LineSingle):
         return self.array[start:end]
 
     # 在once的时候，给每个binding设置array的变量
-    def oncebinding(self):
+    def oncebinding(self, start=0):
         '''
         Executes the bindings when running in "once" mode
+
+        Only the values from the logical position ``start`` are copied (the
+        previous ones are already in the bindings when calculating in chunks)
         '''
         larray = self.array
-        blen = self.buflen()
+        blen = len(larray) - self.extension
+        begin = start - self.discarded
         for binding in self.bindings:
-            binding.array[0:blen] = larray[0:blen]
+            delta = self.discarded - binding.discarded
+            binding.array[begin + delta:blen + delta] = larray[begin:blen]
 
     # 把blinding转变成line
     def bind2lines(self, binding=0):
@@ -649,6 +950,26 @@ class PseudoArray(object):
         return self
 
 
+# 分块计算的时候，根据最小周期把新的bar分成preonce、oncestart和once三部分
+def _onceperiods(obj, start, end, discarded):
+    '''
+    Calls ``preonce``, ``oncestart`` and ``once`` of ``obj`` for the logical
+    positions ``start`` to ``end`` according to its minimum period. The
+    methods receive positions of the buffers, from which ``discarded`` values
+    have been removed
+    '''
+    minperiod = obj._minperiod
+    if start < minperiod - 1:
+        obj.preonce(start - discarded, min(end, minperiod - 1) - discarded)
+
+    if start <= minperiod - 1 < end:
+        obj.oncestart(minperiod - 1 - discarded, minperiod - discarded)
+
+    start = max(start, minperiod)
+    if start < end:
+        obj.once(start - discarded, end - discarded)
+
+
 class LineActions(with_metaclass(MetaLineActions, LineBuffer)):
     '''
     Base class derived from LineBuffer intented to defined the
@@ -713,6 +1034,19 @@ class LineActions(with_metaclass(MetaLineActions, LineBuffer)):
 
         self.oncebinding()                                      # oncebindling操作
 
+    def _oncechunk(self):
+        '''
+        Calculates in "once" mode the values of the bars added to the clock
+        since the last call, keeping the logical position (see the parameter
+        ``oncechunk`` of ``Cerebro``)
+        '''
+        start = self.buflen()
+        size = self._clock.buflen() - start
+        self.forward(size=size)
+        self.rewind(size=size)
+        _onceperiods(self, start, start + size, self.discarded)
+        self.oncebinding(start)
+
 
 def LineDelay(a, ago=0, **kwargs):
     # line向前和向后的操作，如果ago小于0,就使用_LineSelay,如果ago大于0,就使用_LineForward
@@ -868,6 +1202,15 @@ class LinesOperation(LineActions):
         srcb = self.b.array
         op = self.operation
 
+        # 数据使用numpy保存的时候，对整段数据进行向量化计算
+        if mathsupport.isvectorizable(dst, srca, srcb):
+            a, b = srca[start:end], srcb[start:end]
+            if len(a) == len(b) == end - start:
+                vals = mathsupport.vectorized_op(op, a, b)
+                if vals is not None:
+                    dst[start:end] = vals
+                    return
+
         for i in range(start, end):
             dst[i] = op(srca[i], srcb[i])
 
@@ -891,6 +1234,15 @@ class LinesOperation(LineActions):
         srcb = self.b
         op = self.operation
 
+        if mathsupport.isvectorizable(dst, srca) and \
+                isinstance(srcb, (int, float)):
+            a = srca[start:end]
+            if len(a) == end - start:
+                vals = mathsupport.vectorized_op(op, a, srcb)
+                if vals is not None:
+                    dst[start:end] = vals
+                    return
+
         for i in range(start, end):
             dst[i] = op(srca[i], srcb)
 
@@ -902,6 +1254,15 @@ class LinesOperation(LineActions):
         srcb = self.b.array
         op = self.operation
 
+        if mathsupport.isvectorizable(dst, srcb) and \
+                isinstance(srca, (int, float)):
+            b = srcb[start:end]
+            if len(b) == end - start:
+                vals = mathsupport.vectorized_op(op, srca, b)
+                if vals is not None:
+                    dst[start:end] = vals
+                    return
+
         for i in range(start, end):
             dst[i] = op(srca, srcb[i])
 
@@ -931,5 +1292,13 @@ class LineOwnOperation(LineActions):
         srca = self.a.array
         op = self.operation
 
+        if mathsupport.isvectorizable(dst, srca):
+            a = srca[start:end]
+            if len(a) == end - start:
+                vals = mathsupport.vectorized_op(op, a)
+                if vals is not None:
+                    dst[start:end] = vals
+                    return
+
         for i in range(start, end):
             dst[i] = op(srca[i])
@@ -29,7 +29,7 @@ from .utils.py3 import map, range, zip, with_metaclass, string_types
 from .utils import DotDict
 
 from .lineroot import LineRoot, LineSingle
-from .linebuffer import LineActions, LineNum
+from .linebuffer import LineActions, LineNum, _onceperiods
 from .lineseries import LineSeries, LineSeriesMaker
 from .dataseries import DataSeries
 from . import metabase
@@ -370,6 +370,37 @@ class LineIterator(with_metaclass(MetaLineIterator, LineSeries)):
         for line in self.lines:
             line.oncebinding()
 
+    def _oncechunk(self):
+        '''
+        Calculates in "once" mode the values of the bars added to the clock
+        since the last call (see the parameter ``oncechunk`` of ``Cerebro``)
+
+        The bars already calculated may have been partially discarded. The
+        logical positions of the lines are kept and the datas and indicators
+        are positioned before the new bars (instead of at the beginning as
+        done by ``_once``)
+        '''
+        start = self.buflen()
+        size = self._clock.buflen() - start
+        self.forward(size=size)
+        self.rewind(size=size)
+
+        for indicator in self._lineiterators[LineIterator.IndType]:
+            indicator._oncechunk()
+
+        self._oncechunkseek(start)
+        _onceperiods(self, start, start + size, self.lines[0].discarded)
+
+        for line in self.lines:
+            line.oncebinding(start)
+
+    def _oncechunkseek(self, start):
+        # 把数据、指标和自身的逻辑位置移动到start(相当于_once中的home)
+        objs = [self] + self.datas + self._lineiterators[LineIterator.IndType]
+        for obj in objs:
+            for line in obj.lines:
+                line.rewind(len(line) - start)
+
     def preonce(self, start, end):
         pass
 
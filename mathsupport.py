@@ -21,7 +21,15 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import collections
 import math
+import operator
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    np = None
 
 # 看了一下，这几个函数主要用于计算一些指标使用，在主体中没有用到，注释一下，稍后回来看是否需要用cython改进，暂时没有改进的必要。
 # 但是这几个函数其实可以考虑使用numpy改进一下，numpy提供了具体的函数用于计算均值，计算标准差
@@ -67,3 +75,356 @@ def standarddev(x, avgx=None, bessel=False):
       A float with the standard deviation of the elements of x
     '''
     return math.sqrt(average(variance(x, avgx), bessel=bessel))
+
+
+# 下面的函数用于在line使用numpy保存数据的时候(Cerebro(linestorage='numpy')),
+# 让指标的once可以对整段的数据进行向量化的计算，替代python层面的循环
+def isvectorizable(*arrays):
+    '''
+    Returns ``True`` if all the ``arrays`` (the ``array`` attribute of lines)
+    can be viewed as contiguous ``numpy`` arrays without copying (see
+    ``linebuffer.NumpyLineArray``)
+    '''
+    if np is None:
+        return False
+
+    return all(hasattr(x, '__array__') for x in arrays)
+
+
+def rolling_window(src, period, start, end):
+    '''
+    Returns a 2-D view with shape ``(end - start, period)`` in which row
+    ``i`` holds the values ``src[start + i - period + 1:start + i + 1]`` or
+    ``None`` if the values are not available or contain ``NaN`` (in which
+    case the caller must use the regular loop to keep the results identical)
+    '''
+    first = start - period + 1
+    if first < 0 or end <= start:
+        return None
+
+    seg = np.asarray(src)[first:end]
+    if len(seg) != end - first or np.isnan(seg).any():
+        return None
+
+    return sliding_window_view(seg, period)
+
+
+# python的函数和numpy中对应的沿着窗口计算的函数
+_VREDUCERS = dict()
+if np is not None:
+    _VREDUCERS.update({
+        max: np.max,
+        min: np.min,
+        sum: np.sum,
+        math.fsum: np.sum,
+        any: np.any,
+        all: np.all,
+    })
+
+
+def rolling_reduce(func, src, period, start, end):
+    '''
+    Applies the vectorized equivalent of ``func`` (``max``, ``min``, ``sum``,
+    ``math.fsum``, ``any``, ``all``) over a rolling window of ``period``
+    values for the indices ``start`` to ``end``
+
+    Returns ``None`` if there is no vectorized equivalent or the values
+    cannot be used (see ``rolling_window``)
+    '''
+    try:
+        vfunc = _VREDUCERS.get(func)
+    except TypeError:  # not hashable
+        return None
+
+    if vfunc is None:
+        return None
+
+    window = rolling_window(src, period, start, end)
+    if window is None:
+        return None
+
+    return vfunc(window, axis=1)
+
+
+def exp_smoothing(src, start, end, prev, alpha, alpha1, blocksize=64):
+    '''
+    Calculates the recursion ``av = prev * alpha1 + src * alpha`` for the
+    indices ``start`` to ``end`` starting with ``prev``
+
+    The recursion is solved in blocks of ``blocksize`` values with a
+    lower-triangular matrix of powers of ``alpha1``, carrying the last value
+    of each block to the next one
+
+    Returns ``None`` if the values cannot be used
+    '''
+    seg = np.asarray(src)[start:end]
+    if len(seg) != end - start or np.isnan(seg).any() or math.isnan(prev):
+        return None
+
+    n = len(seg)
+    out = np.empty(n, dtype=np.float64)
+    if not n:
+        return out
+
+    k = np.arange(blocksize)
+    # tril[i, j] = alpha1 ** (i - j) for j <= i
+    diff = k[:, None] - k[None, :]
+    tril = np.where(diff >= 0,
+                    np.power(alpha1, np.maximum(diff, 0)), 0.0) * alpha
+    carry = np.power(alpha1, k + 1)
+
+    nfull = n // blocksize * blocksize
+    if nfull:
+        blocks = seg[:nfull].reshape(-1, blocksize) @ tril.T
+        outb = out[:nfull].reshape(-1, blocksize)
+        for i, block in enumerate(blocks):
+            outb[i] = block + carry * prev
+            prev = outb[i, -1]
+
+    rest = n - nfull
+    if rest:
+        out[nfull:] = tril[:rest, :rest] @ seg[nfull:] + carry[:rest] * prev
+
+    return out
+
+
+# 可以直接向量化的python运算符及其对应的numpy的函数
+_VOPERATIONS = dict()
+if np is not None:
+    _VOPERATIONS.update({
+        operator.add: np.add,
+        operator.sub: np.subtract,
+        operator.mul: np.multiply,
+        operator.truediv: np.true_divide,
+        operator.floordiv: np.floor_divide,
+        operator.pow: np.power,
+        operator.lt: np.less,
+        operator.gt: np.greater,
+        operator.le: np.less_equal,
+        operator.ge: np.greater_equal,
+        operator.eq: np.equal,
+        operator.ne: np.not_equal,
+        operator.abs: np.abs,
+        operator.neg: np.negative,
+        abs: np.abs,
+        bool: lambda x: np.not_equal(x, 0.0),
+    })
+
+
+def vectorized_op(operation, *args):
+    '''
+    Applies the ``numpy`` equivalent of ``operation`` to ``args`` (arrays
+    and/or scalars)
+
+    Returns ``None`` if there is no equivalent or if python would have raised
+    an exception (zero division, negative base or zero base with a negative
+    exponent for ``pow``), to let the regular loop run and keep the same
+    behavior
+    '''
+    try:
+        vop = _VOPERATIONS.get(operation)
+    except TypeError:  # not hashable
+        return None
+
+    if vop is None:
+        return None
+
+    if operation in (operator.truediv, operator.floordiv):
+        if np.any(np.asarray(args[1]) == 0.0):
+            return None
+    elif operation is operator.pow:
+        base, exp = np.asarray(args[0]), np.asarray(args[1])
+        # 0的负数次方python会抛出ZeroDivisionError
+        if np.any(base < 0.0) or np.any((base == 0.0) & (exp < 0.0)):
+            return None
+
+    return vop(*args)
+
+
+# 下面的类用于在next模式下增量计算滚动窗口的值，每个bar的计算量是O(1),
+# 而不是每次都对过去period个值重新进行计算
+def _addexact(partials, x):
+    # 把x精确的加到partials中(Shewchuk算法，和math.fsum使用的算法一样)
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+
+    partials[i:] = [x]
+
+
+class RollingKernel(object):
+    '''
+    Base class for the incremental calculation of a value over the last
+    ``period`` values of a data (line) in ``next`` mode
+
+    ``update(data)`` has to be called on each ``next`` and returns the value
+    for the current window (the last ``period`` values of ``data``)
+
+      - If the data has moved forward a single bar, the new value enters the
+        window and the oldest one leaves it
+
+      - If the length of the data has not changed (replay, multiple
+        timeframes) the last value is replaced
+
+      - Else the window is rebuilt from the data
+
+    Subclasses must implement ``_reset``, ``_push``, ``_replace`` and
+    ``_value``
+    '''
+    def __init__(self, period):
+        self.period = period
+        self.window = collections.deque(maxlen=period)
+        self.lastlen = -1
+
+    def update(self, data):
+        dlen = len(data)
+        if dlen == self.lastlen + 1 and len(self.window) == self.period:
+            value = data[0]
+            old = self.window[0]
+            self.window.append(value)
+            self._push(value, old)
+        elif dlen == self.lastlen and self.window:
+            value = data[0]
+            old = self.window[-1]
+            if value != old:  # NaN != NaN also replaces
+                self.window[-1] = value
+                self._replace(value, old)
+        else:
+            self.window.clear()
+            self.window.extend(data.get(size=self.period))
+            self._reset()
+
+        self.lastlen = dlen
+        return self._value()
+
+
+class RollingSum(RollingKernel):
+    '''
+    Running sum of the window, which keeps the exact sum of the values as
+    a list of partials like ``math.fsum`` does. The result is therefore the
+    same as ``math.fsum(window)``
+    '''
+    def _reset(self):
+        self.partials = []
+        self.nonfinite = 0
+        for x in self.window:
+            self._add(x)
+
+    def _add(self, x):
+        if math.isinf(x) or math.isnan(x):
+            self.nonfinite += 1
+        else:
+            _addexact(self.partials, x)
+
+    def _sub(self, x):
+        if math.isinf(x) or math.isnan(x):
+            self.nonfinite -= 1
+        else:
+            _addexact(self.partials, -x)
+
+    def _push(self, value, old):
+        self._sub(old)
+        self._add(value)
+
+    _replace = _push
+
+    def _value(self):
+        if self.nonfinite:
+            return math.fsum(self.window)
+
+        return math.fsum(self.partials)
+
+
+class RollingMax(RollingKernel):
+    '''
+    Running maximum of the window using a monotonic deque. If the window
+    holds ``NaN`` values, the builtin ``max`` is used to deliver the same
+    result as before
+    '''
+    func = max
+
+    @staticmethod
+    def _drop(last, value):
+        return last < value
+
+    def _reset(self):
+        self.count = 0  # number of values which have entered the window
+        self.mono = collections.deque()
+        self.nans = 0
+        for x in self.window:
+            self._add(x)
+
+    def _add(self, x):
+        self.count += 1
+        if x != x:  # NaN
+            self.nans += 1
+            return
+
+        mono = self.mono
+        while mono and self._drop(mono[-1][1], x):
+            mono.pop()
+        mono.append((self.count, x))
+
+    def _push(self, value, old):
+        if old != old:
+            self.nans -= 1
+
+        self._add(value)
+        first = self.count - self.period
+        mono = self.mono
+        while mono and mono[0][0] <= first:
+            mono.popleft()
+
+    def _replace(self, value, old):
+        self._reset()
+
+    def _value(self):
+        if self.nans or not self.mono:
+            return self.func(self.window)
+
+        return self.mono[0][1]
+
+
+class RollingMin(RollingMax):
+    '''
+    Running minimum of the window using a monotonic deque. If the window
+    holds ``NaN`` values, the builtin ``min`` is used to deliver the same
+    result as before
+    '''
+    func = min
+
+    @staticmethod
+    def _drop(last, value):
+        return last > value
+
+
+# 可以增量计算的python函数和对应的增量计算的类
+_ROLLINGKERNELS = {
+    max: RollingMax,
+    min: RollingMin,
+    math.fsum: RollingSum,
+}
+
+
+def rollingkernel(func, period):
+    '''
+    Returns an instance of the ``RollingKernel`` which delivers the same
+    result as ``func`` (``max``, ``min``, ``math.fsum``) over a window of
+    ``period`` values or ``None`` if there is no such kernel
+    '''
+    try:
+        kernel = _ROLLINGKERNELS.get(func)
+    except TypeError:  # not hashable
+        return None
+
+    if kernel is None:
+        return None
+
+    return kernel(period)
@@ -113,8 +113,7 @@ class Benchmark(TimeReturn):
     # 设置benchmark的值
     def next(self):
         super(Benchmark, self).next()
-        self.lines.benchmark[0] = self.tbench.rets.get(self.treturn.dtkey,
-                                                       float('NaN'))
+        self.lines.benchmark[0] = self.tbench.getret(self.treturn.dtkey)
     # prenext
     def prenext(self):
         if self.p._doprenext:
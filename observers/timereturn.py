@@ -87,5 +87,4 @@ class TimeReturn(Observer):
                                                       **self.p._getkwargs())
     # 每个next设置当前的收益率
     def next(self):
-        self.lines.timereturn[0] = self.treturn.rets.get(self.treturn.dtkey,
-                                                         float('NaN'))
+        self.lines.timereturn[0] = self.treturn.getret()
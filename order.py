@@ -722,3 +722,225 @@ class StopSellOrder(SellOrder):
 # 创建止损限价卖单
 class StopLimitSellOrder(SellOrder):
     pass
+
+
+# 轻量级订单的创建和执行信息，克隆的时候直接复制属性，不经过copy
+class LightOrderData(OrderData):
+    '''
+    ``OrderData`` used by ``LightOrder``, which is cloned by copying the
+    attributes instead of going through ``copy``
+    '''
+    def clone(self):
+        self.markpending()
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(self.__dict__)
+        return obj
+
+
+# 回测使用的轻量级订单，参数直接保存在__slots__中，不经过MetaParams元类
+class LightOrder(object):
+    '''
+    Lightweight version of ``Order`` with the same public attributes and
+    methods, used by ``BackBroker`` when ``lightorders`` is ``True``
+
+    The parameters are kept in ``__slots__`` (``p`` and ``params`` return
+    the order itself) instead of going through the ``MetaParams`` machinery.
+    ``info`` is only created when used and the end of session ``dteos``
+    (only needed by ``Close`` orders) when it is first read
+
+    The order is not an instance of ``Order``
+    '''
+    __slots__ = (
+        # params
+        'owner', 'data', 'size', 'price', 'pricelimit', 'exectype', 'valid',
+        'tradeid', 'oco', 'trailamount', 'trailpercent', 'parent',
+        'transmit', 'simulated', 'histnotify',
+        # attributes
+        'ref', 'broker', 'comminfo', 'triggered', '_active', 'status',
+        '_plimit', 'created', 'executed', 'position', '_limitoffset',
+        '_info', '_dteos', 'plen', 'pannotated',
+        '__dict__',  # attributes added by the broker or by the user
+    )
+
+    def __init__(self, owner=None, data=None,
+                 size=None, price=None, pricelimit=None,
+                 exectype=None, valid=None, tradeid=0, oco=None,
+                 trailamount=None, trailpercent=None,
+                 parent=None, transmit=True,
+                 simulated=False,
+                 histnotify=False):
+
+        self.owner = owner
+        self.data = data
+        self.size = size
+        self.price = price
+        self.pricelimit = pricelimit
+        self.exectype = exectype
+        self.valid = valid
+        self.tradeid = tradeid
+        self.oco = oco
+        self.trailamount = trailamount
+        self.trailpercent = trailpercent
+        self.parent = parent
+        self.transmit = transmit
+        self.simulated = simulated
+        self.histnotify = histnotify
+
+        # 和OrderBase.__init__一样，info和dteos在使用的时候才创建
+        self.ref = next(self.refbasis)
+        self.broker = None
+        self._info = None
+        self._dteos = None
+        self.comminfo = None
+        self.triggered = False
+        self._active = parent is None
+        self.status = Order.Created
+        self.plimit = pricelimit
+        if exectype is None:
+            self.exectype = Order.Market
+
+        if not self.isbuy():
+            self.size = -self.size
+
+        pclose = data.close[0] if not simulated else price
+        price = pclose if not price and not pricelimit else price
+        dcreated = data.datetime[0] if not simulated else 0.0
+        self.created = LightOrderData(dt=dcreated,
+                                      size=self.size,
+                                      price=price,
+                                      pricelimit=pricelimit,
+                                      pclose=pclose,
+                                      trailamount=trailamount,
+                                      trailpercent=trailpercent)
+
+        if self.exectype in [Order.StopTrail, Order.StopTrailLimit]:
+            self._limitoffset = self.created.price - self.created.pricelimit
+            price = self.created.price
+            self.created.price = float('inf' * self.isbuy() or '-inf')
+            self.trailadjust(price)
+        else:
+            self._limitoffset = 0.0
+
+        self.executed = LightOrderData(remsize=self.size)
+        self.position = 0
+
+        if isinstance(valid, datetime.date):
+            self.valid = data.date2num(valid)
+        elif isinstance(valid, datetime.timedelta):
+            if valid == self.DAY:
+                valid = datetime.datetime.combine(
+                    data.datetime.date(), datetime.time(23, 59, 59, 9999))
+            else:
+                valid = data.datetime.datetime() + valid
+
+            self.valid = data.date2num(valid)
+
+    # 克隆订单，copy对于有__slots__的对象比较慢，直接复制设置过的属性
+    def clone(self):
+        obj = self.__class__.__new__(self.__class__)
+        for name in LightOrder.__slots__[:-1]:  # skip __dict__
+            try:
+                setattr(obj, name, getattr(self, name))
+            except AttributeError:
+                pass  # not set (plen, pannotated)
+
+        if self.__dict__:
+            obj.__dict__.update(self.__dict__)
+
+        obj.executed = self.executed.clone()
+        return obj
+
+    # 参数就是订单自身的属性
+    @property
+    def p(self):
+        return self
+
+    params = p
+
+    # 使用的时候才创建info
+    def _getinfo(self):
+        if self._info is None:
+            self._info = AutoOrderedDict()
+
+        return self._info
+
+    def _setinfo(self, info):
+        self._info = info
+
+    info = property(_getinfo, _setinfo)
+
+    # 使用的时候才计算dteos，和OrderBase.__init__中的计算一样
+    def _getdteos(self):
+        if self._dteos is None:
+            if self.simulated:
+                self._dteos = 0.0
+            else:
+                dtime = self.data.num2date(self.created.dt)
+                session = self.data.p.sessionend
+                dteos = dtime.replace(hour=session.hour,
+                                      minute=session.minute,
+                                      second=session.second,
+                                      microsecond=session.microsecond)
+
+                if dteos < dtime:
+                    dteos += datetime.timedelta(days=1)
+
+                self._dteos = self.data.date2num(dteos)
+
+        return self._dteos
+
+    def _setdteos(self, dteos):
+        self._dteos = dteos
+
+    dteos = property(_getdteos, _setdteos)
+
+    # 和Order.execute一样
+    def execute(self, dt, size, price,
+                closed, closedvalue, closedcomm,
+                opened, openedvalue, openedcomm,
+                margin, pnl,
+                psize, pprice):
+
+        if size:
+            self.executed.add(dt, size, price,
+                              closed, closedvalue, closedcomm,
+                              opened, openedvalue, openedcomm,
+                              pnl, psize, pprice)
+
+            self.executed.margin = margin
+
+        if self.executed.remsize:
+            self.status = Order.Partial
+        else:
+            self.status = Order.Completed
+
+
+# 其他的常量和方法直接使用Order中的
+for _name in ('DAY', 'T_Close', 'T_Day', 'T_Date', 'T_None', 'V_None',
+              'Market', 'Close', 'Limit', 'Stop', 'StopLimit', 'StopTrail',
+              'StopTrailLimit', 'Historical', 'ExecTypes', 'OrdTypes',
+              'Buy', 'Sell', 'Created', 'Submitted', 'Accepted', 'Partial',
+              'Completed', 'Canceled', 'Expired', 'Margin', 'Rejected',
+              'Cancelled', 'Status', 'refbasis', 'plimit', '__str__',
+              'getstatusname', 'getordername', 'ExecType', 'ordtypename',
+              'active', 'activate', 'alive', 'addcomminfo', 'addinfo',
+              '__eq__', '__ne__', '__hash__', 'isbuy', 'issell',
+              'setposition', 'submit', 'accept', 'brokerstatus', 'reject',
+              'cancel', 'margin', 'completed', 'partial', 'expire',
+              'trailadjust'):
+    setattr(LightOrder, _name,
+            Order.__dict__.get(_name, OrderBase.__dict__.get(_name)))
+
+del _name
+
+
+# 轻量级买单
+class LightBuyOrder(LightOrder):
+    __slots__ = ()
+    ordtype = Order.Buy
+
+
+# 轻量级卖单
+class LightSellOrder(LightOrder):
+    __slots__ = ()
+    ordtype = Order.Sell
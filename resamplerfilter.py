@@ -22,12 +22,18 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 
+import bisect
 from datetime import datetime, date, timedelta
 
 from .dataseries import TimeFrame, _Bar
 from .utils.py3 import with_metaclass
 from . import metabase
-from .utils.date import date2num, num2date
+from .utils.date import date2num, num2date, num2date_array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # 这个类仅仅用在了_checkbarover这样一个函数中
@@ -520,6 +526,351 @@ class _BaseResampler(with_metaclass(metabase.MetaParams, object)):
         self.bar.datetime = dtnum
         return True
 
+    # 判断是否可以在预加载的时候使用数组一次性抽样
+    def _canbulk(self, data):
+        '''Returns ``True`` if the bars of ``data`` can be resampled or
+        replayed in bulk with ``_bulkresample``/``_bulkreplay`` (no trading
+        calendars are in use)'''
+        if np is None:
+            return False
+
+        while True:
+            if data._calendar is not None:
+                return False
+            if not data._clone:
+                return True
+            data = data.data  # the end of session comes from the source
+
+    # 计算每个抽样的bar包含的第一个和最后一个bar以及抽样的bar的时间
+    def _bulkgroups(self, data, dts):
+        '''
+        Returns the positions of the first and last bars, the datetime and
+        the position of the bar which delivers (``len(dts)`` for ``last``)
+        each resampled bar, updating the state of the resampler as the bar by
+        bar resampling does
+        '''
+        n = len(dts)
+        dtl = dts.tolist()
+        tframe = self.p.timeframe
+        comp = self.p.compression
+        bar2edge = self.p.bar2edge
+        subdays, subweeks, componly = self.subdays, self.subweeks, self.componly
+        ordered = n < 2 or bool((dts[1:] >= dts[:-1]).all())
+
+        if componly or subweeks:
+            eos, eosdts = self._bulkeos(data, dts)
+
+        # 可能越过bar边界的位置(其他的位置只需要更新bar)
+        events = np.zeros(n, dtype=bool)
+        if componly:
+            pass
+        elif subdays:
+            upoints = self._bulkpoints(dts)[0]  # as in _barover_subdays
+            lpoints, lrests = self._bulkpoints(dts, data._tz)  # _dataonedge
+            bounds, brests = np.divmod(lpoints, comp)
+            edges = (lrests == 0) & (brests == 0) & (lpoints == bounds * comp)
+            events |= edges
+            over = upoints[1:] > upoints[:-1]
+            if bar2edge and comp != 1:
+                over &= upoints[1:] // comp > upoints[:-1] // comp
+
+            events[1:] |= over
+            edges = edges.tolist()
+            upoints = upoints.tolist()
+        elif not subweeks:
+            keys = self._bulkkeys(dts, data._tz)
+            events[1:] = keys[1:] != keys[:-1]
+            keys = keys.tolist()
+
+        if componly or tframe == TimeFrame.Ticks or not ordered:
+            events[:] = True
+
+        events = np.flatnonzero(events).tolist()
+        events.append(n)
+
+        compcount = self.compcount
+        nexte, nexti, eosnext = None, 0, n
+        if self._nexteos is not None:
+            nexte = self._nextdteos
+            eosnext = bisect.bisect_left(dtl, nexte) if ordered else 0
+
+        lastdteos = getattr(self, '_lastdteos', None)
+        late = forced = 0  # positions to check one by one
+        firsts, lasts, bardts, triggers = list(), list(), list(), list()
+        bopen, bfirst, blast, bdt = False, 0, 0, None
+
+        def adjtime(greater):
+            # 使用_calcadjtime计算调整后的时间
+            self.bar.datetime = bdt
+            self._nexteos = None
+            if nexte is not None:
+                self._nexteos = eosdts[nexti].item()
+                self._nextdteos = nexte
+
+            if lastdteos is not None:
+                self._lastdteos = lastdteos
+
+            return self._calcadjtime(greater=greater)
+
+        i, ev = 0, 0
+        while i < n:
+            while events[ev] < i:
+                ev += 1
+
+            j = events[ev]
+            if subweeks and not componly:
+                j = min(j, i if nexte is None else eosnext)
+            if i < late or i <= forced:
+                j = i
+
+            if j > i:  # no boundary can be crossed up to j
+                if not bopen:
+                    bopen, bfirst = True, i
+                blast, bdt = j - 1, dtl[j - 1]
+                i = j
+                continue
+
+            dt = dtl[i]
+            if componly:
+                lastdteos = eos[i]
+                if not bopen:
+                    bopen, bfirst = True, i
+                blast, bdt = i, dt
+                compcount += 1
+                if not compcount % comp:
+                    if self.doadjusttime:
+                        dtnum = adjtime(True)
+                        if dtnum > bdt:
+                            bdt = dtnum
+
+                    firsts.append(bfirst)
+                    lasts.append(blast)
+                    bardts.append(bdt)
+                    triggers.append(i)
+                    bopen = False
+
+                i += 1
+                continue
+
+            if subdays and bardts and dt <= bardts[-1]:  # late data
+                if not self.p.takelate:
+                    return None
+
+                if not bopen:
+                    bopen, bfirst = True, i
+                blast, bdt = i, bardts[-1] + 0.000001
+                forced = i + 1
+                i += 1
+                continue
+
+            onedge = False
+            if subweeks:
+                if nexte is None:
+                    nexte, nexti = eos[i], i
+                    eosnext = bisect.bisect_left(dtl, nexte, i)
+                if dt == nexte:
+                    lastdteos, nexte = nexte, None
+                    onedge = True
+                elif subdays:
+                    onedge = edges[i]
+
+            if onedge:
+                if not bopen:
+                    bopen, bfirst = True, i
+                blast, bdt = i, dt
+
+            cond = bopen
+            if cond and not onedge:
+                if tframe == TimeFrame.Ticks:
+                    cond = True
+                elif tframe <= TimeFrame.Days:
+                    if nexte is None:
+                        nexte, nexti = eos[i], i
+                        eosnext = bisect.bisect_left(dtl, nexte, i)
+                    if dt > nexte:
+                        cond = bdt <= nexte
+                    else:
+                        cond = dt == nexte
+
+                    if cond:
+                        lastdteos, nexte = nexte, None
+                    elif tframe < TimeFrame.Days and dt >= bdt:
+                        if bdt == dtl[blast]:
+                            point = upoints[blast]
+                        else:
+                            point = self._gettmpoint(num2date(bdt).time())[0]
+
+                        barpoint = upoints[i]
+                        if barpoint > point:
+                            cond = (not bar2edge or comp == 1 or
+                                    barpoint // comp > point // comp)
+                else:
+                    cond = keys[i] > keys[blast]
+
+                if cond and not (subdays and bar2edge):
+                    compcount += 1
+                    cond = not compcount % comp
+
+            if cond:
+                if not onedge and self.doadjusttime:
+                    dtnum = adjtime(True)
+                    if dtnum > bdt:
+                        bdt = dtnum
+
+                firsts.append(bfirst)
+                lasts.append(blast)
+                bardts.append(bdt)
+                triggers.append(i)
+                bopen = False
+                if subdays:
+                    late = bisect.bisect_right(dtl, bdt, i + 1)
+
+            if not onedge:
+                if not bopen:
+                    bopen, bfirst = True, i
+                blast, bdt = i, dt
+
+            i += 1
+
+        if bopen:  # as done by last
+            if self.doadjusttime:
+                bdt = adjtime(False)
+
+            firsts.append(bfirst)
+            lasts.append(blast)
+            bardts.append(bdt)
+            triggers.append(n)
+
+        # 保存状态，和逐个bar抽样之后一样
+        self.compcount = compcount
+        self._nexteos, self._nextdteos = None, float('-inf')
+        if nexte is not None:
+            self._nexteos = eosdts[nexti].item()
+            self._nextdteos = nexte
+
+        if lastdteos is not None:
+            self._lastdteos = lastdteos
+
+        self.bar.bstart(maxdate=True)
+        return firsts, lasts, bardts, triggers
+
+    # 使用数组计算每个bar的交易日结束时间(和data._getnexteos一样)
+    def _bulkeos(self, data, dts):
+        '''
+        Returns for each datetime in ``dts`` the end of session which
+        ``data._getnexteos`` returns (as float and as ``datetime64``)
+        '''
+        while data._clone:
+            data = data.data
+
+        dtimes = num2date_array(dts)
+        days, inverse = np.unique(dtimes.astype('datetime64[D]'),
+                                  return_inverse=True)
+        eosdts = list()
+        for day in days.tolist():
+            nexteos = datetime.combine(day, data.p.sessionend)
+            eosdts.append(num2date(data.date2num(nexteos)))
+
+        eosdts = np.array(eosdts, dtype='datetime64[us]')[inverse]
+        while True:
+            after = dtimes > eosdts
+            if not after.any():
+                break
+
+            eosdts[after] += np.timedelta64(1, 'D')
+
+        uniques, inverse = np.unique(eosdts, return_inverse=True)
+        eos = np.array([date2num(x) for x in uniques.tolist()])
+        return eos[inverse].tolist(), eosdts
+
+    # 使用数组计算每个bar的时间点数(和_gettmpoint一样)
+    def _bulkpoints(self, dts, tz=None):
+        '''Returns the arrays of points and rest points which ``_gettmpoint``
+        returns for the time of each datetime in ``dts``'''
+        dtimes = num2date_array(dts, tz)
+        tms = (dtimes - dtimes.astype('datetime64[D]')).astype(np.int64)
+        minutes, microseconds = np.divmod(tms, 60000000)
+        seconds, microseconds = np.divmod(microseconds, 1000000)
+        point = minutes
+        if self.p.timeframe < TimeFrame.Minutes:
+            point = point * 60 + seconds
+            if self.p.timeframe < TimeFrame.Seconds:
+                point = point * 1e6 + microseconds
+                restpoint = np.zeros(len(dts), dtype=np.int64)
+            else:
+                restpoint = microseconds
+        else:
+            restpoint = seconds + microseconds
+
+        return point + self.p.boundoff, restpoint
+
+    # 使用数组计算每个bar所在的周、月或者年
+    def _bulkkeys(self, dts, tz=None):
+        '''Returns an array with a key which increases with the week, month
+        or year (according to the timeframe) of each datetime in ``dts``'''
+        days = num2date_array(dts, tz).astype('datetime64[D]')
+        if self.p.timeframe == TimeFrame.Weeks:
+            # 和isocalendar一样的年和周
+            ndays = days.astype(np.int64)
+            thursdays = ndays - (ndays + 3) % 7 + 3
+            years = thursdays.astype('datetime64[D]').astype('datetime64[Y]')
+            weeks = (thursdays - years.astype('datetime64[D]').astype(
+                np.int64)) // 7 + 1
+            return years.astype(np.int64) * 100 + weeks
+
+        if self.p.timeframe == TimeFrame.Months:
+            return days.astype('datetime64[M]').astype(np.int64)
+
+        return days.astype('datetime64[Y]').astype(np.int64)
+
+    # _bulkgroups会修改的状态
+    _bulkattrs = ('compcount', '_firstbar', '_nexteos', '_nextdteos',
+                  '_lasteos', '_lastdteos')
+
+    # 保存状态，在不能一次性完成的时候恢复之后逐个bar处理
+    def _bulksave(self):
+        '''Returns the state modified by ``_bulkgroups`` to be restored with
+        ``_bulkrestore`` if the bars have to be processed one by one'''
+        attrs = dict((x, getattr(self, x)) for x in self._bulkattrs
+                     if hasattr(self, x))
+        return attrs, list(self.bar.items())
+
+    def _bulkrestore(self, state):
+        '''Restores the state returned by ``_bulksave``'''
+        attrs, bar = state
+        for attr in self._bulkattrs:
+            if attr in attrs:
+                setattr(self, attr, attrs[attr])
+            elif hasattr(self, attr):
+                delattr(self, attr)
+
+        for key, value in bar:
+            self.bar[key] = value
+
+    # 在每组bar中按照顺序累计计算(和逐个bar更新_Bar一样)
+    def _bulkaccumulate(self, ufunc, values, firsts, counts, initial):
+        '''
+        Returns for each position of ``values`` the result of applying
+        ``ufunc`` one by one to ``initial`` and the values of the group
+        (given by ``firsts`` and ``counts``) up to the position
+        '''
+        out = np.empty(len(values))
+        size = len(firsts)
+        maxcount = int(counts.max()) if size else 0
+        if maxcount < size:  # many small groups: one pass per position
+            acc = np.full(size, initial)
+            for i in range(maxcount):
+                active = np.flatnonzero(counts > i)
+                idxs = firsts[active] + i
+                acc[active] = ufunc(acc[active], values[idxs])
+                out[idxs] = acc[active]
+        else:
+            for first, count in zip(firsts.tolist(), counts.tolist()):
+                group = slice(first, first + count)
+                out[group] = ufunc(ufunc.accumulate(values[group]), initial)
+
+        return out
+
 
 # 把小周期的数据抽样形成大周期的数据
 class Resampler(_BaseResampler):
@@ -657,6 +1008,80 @@ class Resampler(_BaseResampler):
 
         return True
 
+    # 使用数组一次性对预加载的全部bar进行抽样
+    def _bulkresample(self, data, values):
+        '''
+        Resamples in a single pass the bars given in ``values`` (one array
+        per line of ``data`` in the order of the lines) which have already
+        been filtered by date. Returns one array per line with the resampled
+        bars and an array with the datetime of the source bar at which each
+        resampled bar is delivered (``inf`` if delivered by ``last``) or
+        ``None`` if the bars have to be resampled one by one (``NaN`` opening
+        prices or late bars with ``takelate=False``)
+
+        The resulting bars are the ones delivered bar by bar: the bars at
+        which a boundary can be crossed are located with array operations
+        and checked with the same rules and the values of the resampled bars
+        are aggregated with array operations
+        '''
+        if self.bar.isopen():
+            return None
+
+        lines = dict(zip(data.getlinealiases(), values))
+        dts = lines['datetime']
+        if np.isnan(dts).any() or np.isnan(lines['open']).any():
+            return None
+
+        state = self._bulksave()
+        groups = self._bulkgroups(data, dts)
+        if groups is None:
+            self._bulkrestore(state)
+            return None
+
+        firsts, lasts, bardts, triggers = groups
+        firsts = np.array(firsts, dtype=np.int64)
+        lasts = np.array(lasts, dtype=np.int64)
+        size = len(firsts)
+
+        bar = dict(datetime=np.array(bardts, dtype=np.float64),
+                   open=lines['open'][firsts],
+                   close=lines['close'][lasts],
+                   openinterest=lines['openinterest'][lasts])
+        if size:
+            # 和_Bar.bupdate一样使用max/min,忽略NaN
+            bar['high'] = np.fmax(np.fmax.reduceat(lines['high'], firsts),
+                                  float('-inf'))
+            bar['low'] = np.fmin(np.fmin.reduceat(lines['low'], firsts),
+                                 float('inf'))
+        else:
+            bar['high'] = bar['low'] = np.zeros(0)
+
+        # 成交量按照顺序逐个累加，和逐个bar抽样的结果一致
+        volumes = lines['volume']
+        counts = lasts - firsts + 1
+        maxcount = int(counts.max()) if size else 0
+        if maxcount < size:
+            volume = np.zeros(size)
+            for i in range(maxcount):
+                active = counts > i
+                volume[active] += volumes[firsts[active] + i]
+        else:
+            volume = np.array(
+                [np.add.accumulate(volumes[first:last + 1])[-1]
+                 for first, last in zip(firsts.tolist(), lasts.tolist())],
+                dtype=np.float64) + 0.0  # sums start at 0.0 (no -0.0)
+
+        bar['volume'] = volume
+
+        # 抽样的bar按照位置保存到line中(和_fromstack一样)
+        bars = [bar[key] for key in self.bar.keys()]
+        nan = np.full(size, float('NaN'))
+        bars = [bars[i] if i < len(bars) else nan.copy()
+                for i in range(len(values))]
+        delivers = np.append(dts, float('inf'))[triggers]
+        return bars, delivers
+
+
 # replayer类
 class Replayer(_BaseResampler):
     '''This class replays data of a given timeframe to a larger timeframe.
@@ -811,6 +1236,114 @@ class Replayer(_BaseResampler):
 
         return False  # the existing bar can be processed by the system
 
+    # 使用数组一次性计算回放的时候每次交付的bar
+    def _bulkreplay(self, data, values):
+        '''
+        Replays in a single pass the bars given in ``values`` (one array per
+        line of ``data`` in the order of the lines) which have already been
+        filtered by date. Returns, with one entry per delivery of the
+        replayed data, an array telling if the delivery opens a new bar, one
+        array per line with the values of the delivered (partial) bar and one
+        array per line with the values of the source bar (``tick_xxx``)
+
+        Returns ``None`` if the bars have to be replayed one by one (``NaN``
+        opening prices, datetimes which are not strictly ascending or
+        adjusted times which make the next bar late)
+
+        The bars are grouped as ``_bulkresample`` does and the partial bars
+        seen after each bar of the source are accumulated with array
+        operations, leaving the replayer in the state in which replaying bar
+        by bar leaves it
+        '''
+        if self.bar.isopen() or (self.componly and self.doadjusttime):
+            return None
+
+        lines = dict(zip(data.getlinealiases(), values))
+        dts = lines['datetime']
+        n = len(dts)
+        if np.isnan(dts).any() or np.isnan(lines['open']).any():
+            return None
+
+        if n > 1 and not (dts[1:] > dts[:-1]).all():
+            return None  # late bars
+
+        state = self._bulksave()
+        groups = self._bulkgroups(data, dts)
+        if groups is not None:
+            firsts, lasts, triggers = [np.array(x, dtype=np.int64)
+                                       for x in (groups[0], groups[1],
+                                                 groups[3])]
+            bardts = np.array(groups[2], dtype=np.float64)
+            counts = lasts - firsts + 1
+            # 调整后的时间可能让日内的下一个bar变成晚到的bar
+            nexts = triggers + 1
+            nexts = nexts[nexts < n]
+            if (counts.sum() != n or
+                    (self.subdays and
+                     (dts[nexts] <= bardts[:len(nexts)]).any())):
+                groups = None
+
+        if groups is None:
+            self._bulkrestore(state)
+            return None
+
+        bar = dict(datetime=dts,
+                   open=np.repeat(lines['open'][firsts], counts),
+                   close=lines['close'],
+                   openinterest=lines['openinterest'])
+        bar['high'] = self._bulkaccumulate(np.fmax, lines['high'], firsts,
+                                           counts, float('-inf'))
+        bar['low'] = self._bulkaccumulate(np.fmin, lines['low'], firsts,
+                                          counts, float('inf'))
+        bar['volume'] = self._bulkaccumulate(np.add, lines['volume'], firsts,
+                                             counts, 0.0)
+
+        # 和_updatebar一样按照位置更新line，其他的line是新bar的第一个bar的值
+        keys = list(self.bar.keys())
+        bars = [np.array(bar[keys[i]], dtype=np.float64) if i < len(keys)
+                else np.repeat(values[i][firsts], counts)
+                for i in range(len(values))]
+
+        # 最后一个bar没有结束，保留回放的状态
+        if len(triggers) and triggers[-1] == n:
+            self.bar.bstart()
+            for i, key in enumerate(keys):
+                self.bar[key] = bars[i][lasts[-1]].item()
+
+            self._firstbar = False
+        else:
+            self._firstbar = True
+
+        # 越过边界的bar开始新的bar，交付的是原始的数据
+        crossing = (triggers < n) & (triggers != lasts)
+        starts = triggers[crossing]
+        if self.doadjusttime:
+            glasts = lasts[crossing]
+            adjusted = bardts[crossing] > dts[glasts]
+            partials = [x[glasts] for x in bars]
+
+        for x, value in zip(bars, values):
+            x[starts] = value[starts]
+
+        forwards = np.zeros(n, dtype=bool)
+        forwards[firsts] = True
+        ticks = [np.asarray(value, dtype=np.float64) for value in values]
+        if self.doadjusttime and len(starts):
+            # 开始新的bar之前交付调整时间后的bar
+            forwards = np.insert(forwards, starts, False)
+            for i, x in enumerate(bars):
+                extra = x[glasts]
+                if i < len(keys):
+                    extra = np.where(adjusted, partials[i], extra)
+                if i < len(keys) and keys[i] == 'datetime':
+                    extra = bardts[crossing]
+
+                bars[i] = np.insert(x, starts, extra)
+
+            ticks = [np.insert(x, starts, x[starts]) for x in ticks]
+
+        return forwards, bars, ticks
+
 
 class ResamplerTicks(Resampler):
     params = (('timeframe', TimeFrame.Ticks),)
@@ -94,6 +94,9 @@ class MetaStrategy(StrategyBase.__class__):
         _obj._slave_analyzers = list()
 
         _obj._tradehistoryon = False
+        _obj._histretain = None  # keep all notified orders and trades
+        _obj._histspill = None
+        _obj._tradehistmax = None
 
         return _obj, args, kwargs
     # 给_sizer设置策略和broker
@@ -380,19 +383,43 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
                                          for d in self.datas if len(d))
             # 返回数据长度
             return clk_len
-        # 当前最新的数据长度
-        newdlens = [len(d) for d in self.datas]
-        # 如果新的数据长度大于旧的数据长度，就forward
-        if any(nl > l for l, nl in zip(self._dlens, newdlens)):
+        # 退出事件循环的数据的长度和时间不会再变化，不需要再计算
+        if any(d._retired for i, d in self._dactive):
+            self._retiredatas()
+
+        # 当前最新的数据长度，如果新的数据长度大于旧的数据长度，就forward
+        dlens = self._dlens
+        moved = False
+        dtmax = self._dtretired
+        for i, d in self._dactive:
+            dlen = len(d)
+            if dlen > dlens[i]:
+                moved = True
+
+            dlens[i] = dlen
+            if dlen:
+                dt = d.datetime[0]
+                if dt > dtmax:
+                    dtmax = dt
+
+        if moved:
             self.forward()
         # 设置时间，当前数据中的最大的时间
-        self.lines.datetime[0] = max(d.datetime[0]
-                                     for d in self.datas if len(d))
-        # 旧的数据长度等于新的数据长度
-        self._dlens = newdlens
+        self.lines.datetime[0] = dtmax
 
         return len(self)
 
+    def _retiredatas(self):
+        # 把退出事件循环的数据从需要检查的数据中去掉，并记录这些数据的最大时间
+        active = list()
+        for i, d in self._dactive:
+            if not d._retired:
+                active.append((i, d))
+            elif len(d):
+                self._dtretired = max(self._dtretired, d.datetime[0])
+
+        self._dactive = active
+
     # _next_open方法，这个和_once_post_open方法一样
     def _next_open(self):
         minperstatus = self._minperstatus
@@ -447,7 +474,13 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
                 observer._next()
     # 把最小周期状态传递到analyzer中
     def _next_analyzers(self, minperstatus, once=False):
-        for analyzer in self.analyzers:
+        # 记录运行结束之后计算的analyzer需要的数据
+        record = self._anrecord
+        if record is not None:
+            record.datetime.append(self.lines.datetime[0])
+            record.status.append((minperstatus > 0) - (minperstatus < 0))
+
+        for analyzer in self._nextanalyzers:
             if minperstatus < 0:
                 analyzer._next()
             elif minperstatus == 0:
@@ -466,6 +499,16 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
         # analyzer开始
         for analyzer in itertools.chain(self.analyzers, self._slave_analyzers):
             analyzer._start()
+        # 运行结束之后才计算的analyzer，运行的时候只记录需要的数据
+        self._postanalyzers = list()
+        if self.cerebro.p.postanalyzers:
+            self._postanalyzers = [a for a in self.analyzers
+                                   if a._canpostrun()]
+
+        self._anrecord = bt.AnalyzerRecord() if self._postanalyzers else None
+        self._nextanalyzers = [a for a in self.analyzers
+                               if a not in self._postanalyzers]
+        self._notifyanalyzers = self._nextanalyzers + self._slave_analyzers
         # observer开始
         for obs in self.observers:
             if not isinstance(obs, list):
@@ -479,6 +522,9 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
         self._stage2()
         # 当前每个数据的长度
         self._dlens = [len(data) for data in self.datas]
+        # 没有退出事件循环的数据和已经退出的数据的最大时间
+        self._dactive = list(enumerate(self.datas))
+        self._dtretired = float('-inf')
         # 当前最小周期状态默认是最大的整数
         self._minperstatus = MAXINT  # start in prenext
         # 调用开始
@@ -566,6 +612,11 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
     def _stop(self):
         # 结束策略，可以在策略实例中重写
         self.stop()
+        # 运行结束之后才计算的analyzer根据记录的数据进行计算
+        if self._anrecord is not None:
+            record = self._anrecord.finish()
+            for analyzer in self._postanalyzers:
+                analyzer._postrun(record)
         # 结束analyzer和observer的analyzer
         for analyzer in itertools.chain(self.analyzers, self._slave_analyzers):
             analyzer._stop()
@@ -583,12 +634,90 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
     def set_tradehistory(self, onoff=True):
         self._tradehistoryon = onoff
 
+    # 设置保存的订单和交易的历史
+    def set_histretain(self, retain, spill=None):
+        '''
+        Controls which of the notified orders and trades are kept by the
+        strategy (``_orders`` and ``_trades``)
+
+          - ``None``: keep everything
+
+          - ``'open'``: keep only the orders which are alive and the trades
+            which are open
+
+          - ``int``: keep the last ``retain`` notified orders, the last
+            ``retain`` trades of each data/tradeid and the last ``retain``
+            entries of the history of each trade
+
+        ``spill`` can be a ``HistorySpill`` to which the dropped orders and
+        trades are written
+
+        The notifications to the strategy, analyzers and observers are not
+        affected
+        '''
+        if not (retain is None or retain == 'open' or
+                (isinstance(retain, integer_types) and retain >= 0)):
+            raise ValueError('histretain must be None, "open" or an int >= 0')
+
+        self._histretain = retain
+        self._histspill = spill
+        if isinstance(retain, integer_types):
+            self._tradehistmax = retain
+
     # 清空_orders、_orderspending,_tradespending
     def clear(self):
-        self._orders.extend(self._orderspending)
+        if self._histretain is None:
+            self._orders.extend(self._orderspending)
+        elif self._orderspending:
+            self._retainorders(self._orderspending)
+
         self._orderspending = list()
         self._tradespending = list()
 
+    # 按照histretain只保存一部分通知过的订单
+    def _retainorders(self, orders):
+        spill = self._histspill
+        if self._histretain == 'open':
+            # 删除不再存活的订单的所有通知
+            done = set(o.ref for o in orders if not o.alive())
+            if not done:
+                self._orders.extend(orders)
+                return
+
+            keep = list()
+            for order in itertools.chain(self._orders, orders):
+                if order.ref not in done:
+                    keep.append(order)
+                elif spill is not None:
+                    spill.order(self, order)
+
+            self._orders = keep
+            return
+
+        self._orders.extend(orders)
+        ndrop = len(self._orders) - self._histretain
+        if ndrop > 0:
+            if spill is not None:
+                for order in self._orders[:ndrop]:
+                    spill.order(self, order)
+
+            del self._orders[:ndrop]
+
+    # 按照histretain只保存一部分交易，最后一个交易总是保存，因为可能会继续更新
+    def _retaintrades(self, trades):
+        if self._histretain == 'open':
+            drop = [t for t in trades[:-1] if t.status == t.Closed]
+        else:
+            drop = trades[:max(len(trades) - max(self._histretain, 1), 0)]
+
+        if drop:
+            if self._histspill is not None:
+                for trade in drop:
+                    self._histspill.trade(self, trade)
+
+            dropped = set(id(t) for t in drop)
+            trades[:] = [t for t in trades if id(t) not in dropped]
+
     # 增加通知
     def _addnotification(self, order, quicknotify=False):
         # 如果不是模拟交易，把order添加到self._orderspending中
@@ -612,7 +741,8 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
         datatrades = self._trades[tradedata][order.tradeid]
         if not datatrades:
             trade = Trade(data=tradedata, tradeid=order.tradeid,
-                          historyon=self._tradehistoryon)
+                          historyon=self._tradehistoryon,
+                          historymax=self._tradehistmax)
             datatrades.append(trade)
         else:
             trade = datatrades[-1]
@@ -645,8 +775,11 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
                 # 如果trade是关闭的，初始化一个trade，并保存到datatrades中
                 if trade.isclosed:
                     trade = Trade(data=tradedata, tradeid=order.tradeid,
-                                  historyon=self._tradehistoryon)
+                                  historyon=self._tradehistoryon,
+                                  historymax=self._tradehistmax)
                     datatrades.append(trade)
+                    if self._histretain is not None:
+                        self._retaintrades(datatrades)
                 # 更新trade
                 trade.update(order,
                              exbit.opened,
@@ -698,15 +831,16 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
             if order.exectype != order.Historical or order.histnotify:
                 self.notify_order(order)
             # 对于analyzer和observer中的analyzer，通知order
-            for analyzer in itertools.chain(self.analyzers,
-                                            self._slave_analyzers):
+            for analyzer in self._notifyanalyzers:
                 analyzer._notify_order(order)
         # 循环待处理的trade，进行通知，并对于analyzer和observer中的analyzer进行通知
+        record = self._anrecord
         for trade in proctrades:
             self.notify_trade(trade)
-            for analyzer in itertools.chain(self.analyzers,
-                                            self._slave_analyzers):
+            for analyzer in self._notifyanalyzers:
                 analyzer._notify_trade(trade)
+            if record is not None:
+                record.trades.append((len(record.status), trade))
         # 如果qorders是空的话，通知结束
         if qorders:
             return  # cash is notified on a regular basis
@@ -719,10 +853,16 @@ class Strategy(with_metaclass(MetaStrategy, StrategyBase)):
         self.notify_cashvalue(cash, value)
         # 给fund通知cash,value，fundvalue,fundshares，并对于analyzer和observer中的analyzer进行通知
         self.notify_fund(cash, value, fundvalue, fundshares)
-        for analyzer in itertools.chain(self.analyzers, self._slave_analyzers):
+        for analyzer in self._notifyanalyzers:
             analyzer._notify_cashvalue(cash, value)
             analyzer._notify_fund(cash, value, fundvalue, fundshares)
 
+        if record is not None:
+            record.cash.append(cash)
+            record.value.append(value)
+            record.fundvalue.append(fundvalue)
+            record.fundshares.append(fundshares)
+
     # 增加计时器
     def add_timer(self, when,
                   offset=datetime.timedelta(), repeat=datetime.timedelta(),
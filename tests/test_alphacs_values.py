@@ -0,0 +1,104 @@
+"""测试AlphaCs向量化计算的净值和原来逐行循环计算的结果一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('alphalens')
+
+from backtrader.vectors.cs import AlphaCs
+from backtrader.vectors.cal_functions import (cal_signals_by_numpy,
+                                              cal_signals_by_offsets,
+                                              cal_total_value_by_numpy)
+
+
+def loop_total_value(signals_arr, opens_arr, closes_arr, hold_days,
+                     commission, initial_capital):
+    # 原来AlphaCs.cal_values中逐行循环的计算方法
+    data_rows, data_cols = signals_arr.shape
+    values_arr = np.zeros(signals_arr.shape)
+    sig_arr = signals_arr[0]
+    count = np.count_nonzero(sig_arr)
+    symbol_value = initial_capital / count * (1 - commission)
+    symbol_value_arr = np.array([symbol_value] * data_cols) * sig_arr * sig_arr
+    symbol_open_price_arr = opens_arr[0]
+    for i in range(data_rows - 1):
+        if (i + 1) % hold_days == 0:
+            sig_arr = signals_arr[i]
+            open_arr = opens_arr[i + 1]
+            symbol_close_price_arr = open_arr
+            return_arr = (symbol_close_price_arr - symbol_open_price_arr) / \
+                symbol_open_price_arr * sig_arr
+            symbol_value_arr_cur = (1 - commission) * symbol_value_arr * \
+                (1.0 + return_arr)
+            values_arr[i] = symbol_value_arr_cur
+            new_sig_arr = signals_arr[i + 1]
+            total_value_val = np.nansum(symbol_value_arr_cur)
+            count = np.count_nonzero(new_sig_arr)
+            symbol_value = (1 - commission) * total_value_val / count
+            symbol_value_arr = np.array([symbol_value] * data_cols) * \
+                new_sig_arr * new_sig_arr
+            symbol_open_price_arr = open_arr
+        else:
+            sig_arr = signals_arr[i]
+            symbol_close_price_arr = closes_arr[i]
+            return_arr = (symbol_close_price_arr - symbol_open_price_arr) / \
+                symbol_open_price_arr * sig_arr
+            values_arr[i] = symbol_value_arr * (1 + return_arr)
+
+    sig_arr = signals_arr[data_rows - 1]
+    return_arr = (symbol_close_price_arr - symbol_open_price_arr) / \
+        symbol_open_price_arr * sig_arr
+    values_arr[data_rows - 1] = symbol_value_arr * (1 + return_arr)
+    return np.nansum(values_arr, axis=1)
+
+
+def make_arrays(rows=300, cols=8, seed=13):
+    rng = np.random.RandomState(seed)
+    closes = 100 * np.cumprod(1 + rng.randn(rows, cols) * 0.01, axis=0)
+    opens = closes * (1 + rng.randn(rows, cols) * 0.002)
+    factors = pd.DataFrame(rng.randn(rows, cols))
+    return opens, closes, factors
+
+
+@pytest.mark.parametrize('hold_days', [1, 3, 5])
+@pytest.mark.parametrize('commission', [0.0, 0.0005])
+def test_total_value(hold_days, commission):
+    opens, closes, factors = make_arrays()
+    signals = cal_signals_by_numpy(factors.to_numpy(), 0.25, hold_days)[1:]
+    opens, closes = opens[1:], closes[1:]
+    expected = loop_total_value(signals, opens, closes, hold_days,
+                                commission, 1000000.0)
+    values = cal_total_value_by_numpy(signals, opens, closes, hold_days,
+                                      commission, 1000000.0)
+    np.testing.assert_allclose(values, expected, rtol=1e-12)
+
+
+def test_values_by_offsets(capsys):
+    opens, closes, factors = make_arrays()
+    hold_days = 4
+    params = dict(commission=0.0005, percent=0.25, hold_days=hold_days,
+                  opens_arr=opens, closes_arr=closes)
+    alpha = AlphaCs(dict(), params)
+    values = alpha.cal_values_by_offsets(factors, hold_days)
+    assert capsys.readouterr().out == ''
+
+    expected = []
+    for offset in range(hold_days):
+        signals = cal_signals_by_numpy(factors.to_numpy(), 0.25, hold_days,
+                                       offset)
+        expected.append(alpha.cal_values(None, signals, hold_days))
+    rows = min(len(arr) for arr in expected)
+    expected = sum(arr[-rows:] / arr[-rows] * 1000000.0 / hold_days
+                   for arr in expected)
+    np.testing.assert_allclose(values, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('percent', [0.25, 0.1])
+def test_signals_by_offsets(percent):
+    factors = make_arrays()[2].to_numpy()
+    factors[:20, :6] = np.nan
+    factors[50, :] = np.nan
+    signals = cal_signals_by_offsets(factors, percent, 5, range(5))
+    for offset in range(5):
+        expected = cal_signals_by_numpy(factors, percent, 5, offset)
+        np.testing.assert_array_equal(signals[offset], expected)
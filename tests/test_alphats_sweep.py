@@ -0,0 +1,43 @@
+"""测试AlphaTs批量计算多个参数组合的净值和逐个参数计算的结果一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from backtrader.vectors.ts import AlphaTs
+from backtrader.vectors.cal_functions import get_rate_sharpe_drawdown
+
+
+def make_signals(n, cols, seed):
+    rng = np.random.RandomState(seed)
+    # 信号保持一段时间之后再变化
+    signals = rng.choice([-1.0, 0.0, 1.0], size=(n, cols))
+    keep = rng.rand(n, cols) < 0.9
+    for i in range(1, n):
+        signals[i] = np.where(keep[i], signals[i - 1], signals[i])
+    return pd.DataFrame(signals, columns=['p%d' % i for i in range(cols)])
+
+
+@pytest.mark.parametrize('commission', [0.0, 0.0003])
+def test_cal_values(commission):
+    df = pd.DataFrame(index=pd.date_range('2020-01-01', periods=500))
+    rng = np.random.RandomState(11)
+    df['close'] = 100 + np.cumsum(rng.randn(500))
+    df['open'] = df['close'] + rng.randn(500) * 0.5
+    arrs = [df.index.values, df['open'].values, df['close'].values + 1,
+            df['close'].values - 1, df['close'].values, np.ones(500)]
+    signals = make_signals(500, 6, seed=12)
+    params = dict(commission=commission, init_value=100000, percent=0.5)
+
+    alpha = AlphaTs(*arrs, params=params)
+    values = alpha.cal_values(signals)
+    sweep = alpha.run_sweep(signals)
+    assert list(values.columns) == list(signals.columns)
+    for col in signals.columns:
+        single = AlphaTs(*arrs, params=params,
+                         signal_arr=signals[col].values).cal_value()
+        np.testing.assert_allclose(values[col].values, single, rtol=1e-12)
+        expected = get_rate_sharpe_drawdown(pd.Series(single))
+        np.testing.assert_allclose(sweep.loc[col].values, expected,
+                                   rtol=1e-9)
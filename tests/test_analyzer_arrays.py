@@ -0,0 +1,180 @@
+"""测试数组保存的分析器的结果和逐个bar用字典保存(每个bar都转换时间)的结果一致"""
+import datetime
+
+import numpy as np
+import pytest
+
+import backtrader as bt
+from backtrader import TimeFrameAnalyzerBase
+
+import testcommon
+
+TF = bt.TimeFrame
+
+
+class RefTimeReturn(bt.analyzers.TimeReturn):
+    """原来的TimeReturn，每个bar更新字典中当前周期的收益率"""
+
+    def on_dt_over(self):
+        if self.p.data is None or self._lastvalue is not None:
+            self._value_start = self._lastvalue
+        elif self.p.firstopen:
+            self._value_start = self.p.data.open[0]
+        else:
+            self._value_start = self.p.data[0]
+
+    def next(self):
+        self.rets[self.dtkey] = (self._value / self._value_start) - 1.0
+        self._lastvalue = self._value
+
+    def getret(self, dtkey=None):
+        if dtkey is None:
+            dtkey = self.dtkey
+        return self.rets.get(dtkey, float('NaN'))
+
+    get_analysis = bt.Analyzer.get_analysis
+
+
+class RefPositionsValue(bt.analyzers.PositionsValue):
+    """原来的PositionsValue，每个bar以datetime为key保存价值"""
+
+    def next(self):
+        broker = self.strategy.broker
+        pvals = [broker.get_value([d]) for d in self.datas]
+        if self.p.cash:
+            pvals.append(broker.get_cash())
+        if self._usedate:
+            self.rets[self.strategy.datetime.date()] = pvals
+        else:
+            self.rets[self.strategy.datetime.datetime()] = pvals
+
+    get_analysis = bt.Analyzer.get_analysis
+
+
+class RefTransactions(bt.analyzers.Transactions):
+    """原来的Transactions，每个有成交的bar以datetime为key保存交易"""
+
+    def next(self):
+        entries = []
+        for i, dname in self._idnames:
+            pos = self._positions.get(dname, None)
+            if pos is not None:
+                size, price = pos.size, pos.price
+                if size:
+                    entries.append([size, price, i, dname, -size * price])
+        if entries:
+            self.rets[self.strategy.datetime.datetime()] = entries
+        self._positions.clear()
+
+    get_analysis = bt.Analyzer.get_analysis
+
+
+ANALYZERS = [
+    ('ret_m5', 'TimeReturn', dict(timeframe=TF.Minutes, compression=5)),
+    ('ret_m30', 'TimeReturn', dict(timeframe=TF.Minutes, compression=30)),
+    ('ret_d', 'TimeReturn', dict(timeframe=TF.Days)),
+    ('ret_w', 'TimeReturn', dict(timeframe=TF.Weeks)),
+    ('ret_mo', 'TimeReturn', dict(timeframe=TF.Months)),
+    ('ret_y', 'TimeReturn', dict(timeframe=TF.Years)),
+    ('ret_all', 'TimeReturn', dict(timeframe=TF.NoTimeFrame)),
+    ('ret_data', 'TimeReturn', dict(timeframe=TF.Days, data=1)),
+    ('pos', 'PositionsValue', dict(cash=True)),
+    ('trans', 'Transactions', dict()),
+    ('tdd_d', 'TimeDrawDown', dict(timeframe=TF.Days)),
+    ('tdd_m15', 'TimeDrawDown', dict(timeframe=TF.Minutes, compression=15)),
+]
+
+REFERENCE = dict(TimeReturn=RefTimeReturn, PositionsValue=RefPositionsValue,
+                 Transactions=RefTransactions)
+
+
+class Snapshots(testcommon.RandomOrders):
+    """在运行的过程中也获取分析的结果，检查增量转换的字典"""
+    params = (('kinds', ['market', 'limit', 'close']),)
+
+    def start(self):
+        super(Snapshots, self).start()
+        self.snapshots = []
+
+    def next(self):
+        super(Snapshots, self).next()
+        if len(self) % 97 == 0:
+            self.snapshots.append(analyses(self))
+
+
+def analyses(strategy):
+    return [(name, list(strategy.analyzers.getbyname(name)
+                        .get_analysis().items()))
+            for name, _, _ in ANALYZERS]
+
+
+def run(reference, monkeypatch, tz=None):
+    if reference:
+        # 每个bar都计算dtcmp和dtkey，observer使用原来的TimeReturn
+        monkeypatch.setattr(TimeFrameAnalyzerBase, '_get_dt_next',
+                            lambda self, dt, dtkey: float('-inf'))
+        monkeypatch.setattr(bt.analyzers, 'TimeReturn', RefTimeReturn)
+
+    cerebro = bt.Cerebro(stdstats=False)
+    df = testcommon.make_intraday(days=70, freq='5min', seed=3)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df, tz=tz))
+    df = testcommon.make_intraday(days=70, freq='15min', seed=4)
+    data1 = bt.feeds.PandasData(dataname=df, tz=tz, timeframe=TF.Minutes,
+                                compression=15)
+    cerebro.adddata(data1)
+    cerebro.addstrategy(Snapshots)
+    for name, clsname, kwargs in ANALYZERS:
+        cls = getattr(bt.analyzers, clsname)
+        if reference:
+            cls = REFERENCE.get(clsname, cls)
+        kwargs = dict(kwargs)
+        if 'data' in kwargs:
+            kwargs['data'] = data1
+        cerebro.addanalyzer(cls, _name=name, **kwargs)
+
+    cerebro.addobserver(bt.observers.TimeReturn, timeframe=TF.Days)
+    cerebro.addobserver(bt.observers.TimeReturn, timeframe=TF.Minutes,
+                        compression=30)
+    cerebro.addobserver(bt.observers.Benchmark, data=data1,
+                        timeframe=TF.Weeks)
+    strategy = cerebro.run()[0]
+    lines = [np.array(line.array) for obs in strategy.observers
+             for line in obs.lines]
+    return strategy, lines
+
+
+@pytest.mark.parametrize('tz', [None, 'US/Eastern'])
+def test_same_analysis(tz, monkeypatch):
+    arrays, arraylines = run(False, monkeypatch, tz=tz)
+    default, defaultlines = run(True, monkeypatch, tz=tz)
+    assert len(default.snapshots) > 50
+    assert testcommon.same(default.snapshots, arrays.snapshots)
+
+    expected, got = analyses(default), analyses(arrays)
+    assert testcommon.same(expected, got)
+    for name, items in expected:
+        assert items, name
+
+    # 跨过了夏令时的切换
+    keys = [key for key, _ in dict(expected)['ret_d']]
+    assert keys[0] < datetime.datetime(2021, 3, 14) < keys[-1]
+
+    assert len(defaultlines) == len(arraylines) == 4
+    for x, y in zip(defaultlines, arraylines):
+        assert np.array_equal(x, y, equal_nan=True)
+
+
+def test_getret():
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(
+        dataname=testcommon.make_intraday(days=10, freq='5min')))
+    cerebro.addstrategy(testcommon.RandomOrders, kinds=['market'])
+    cerebro.addanalyzer(bt.analyzers.TimeReturn, timeframe=TF.Days)
+    treturn = cerebro.run()[0].analyzers[0]
+    rets = treturn.get_analysis()
+    assert len(rets) == 10
+    for dtkey, ret in rets.items():
+        assert treturn.getret(dtkey) == ret
+    assert treturn.getret() == ret
+    assert treturn.getret(datetime.datetime(2000, 1, 1)) != \
+        treturn.getret(datetime.datetime(2000, 1, 1))  # NaN
@@ -0,0 +1,85 @@
+"""测试编译之后的函数和SharpeRatio、DrawDown分析器中python的计算结果完全一致
+
+需要先编译: python -m backtrader.utils.build_extensions
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtrader as bt
+from backtrader.mathsupport import average, standarddev
+import backtrader.analyzers.drawdown as drawdown_module
+import backtrader.analyzers.sharpe as sharpe_module
+import backtrader.vectors.cal_functions as cal_functions
+
+ts = pytest.importorskip(
+    "backtrader.utils.cal_return_sharpe_drawdown.cal_return_sharpe_drawdown")
+
+
+def test_sharpe_stats():
+    rng = np.random.RandomState(1)
+    for i in range(1000):
+        n = rng.randint(1, 500)
+        returns = (rng.randn(n) * 10.0 ** rng.randint(-8, 8, size=n)).tolist()
+        rate = rng.randn() * 0.001
+        bessel = i % 2
+        if n - bessel <= 0:
+            continue
+        ret_free = [r - rate for r in returns]
+        avg = average(ret_free)
+        dev = standarddev(ret_free, avgx=avg, bessel=bessel)
+        assert ts.cal_sharpe_stats_cy(returns, rate, bessel) == (avg, dev)
+
+    # 不是有限的值的时候由python计算
+    assert ts.cal_sharpe_stats_cy([0.1, float('inf')]) is None
+    assert ts.cal_sharpe_stats_cy([0.1, float('nan')]) is None
+    assert ts.cal_sharpe_stats_cy([1e308, 1e308]) is None
+
+
+def test_vector_functions():
+    rng = np.random.RandomState(3)
+    for i in range(20):
+        values = pd.Series(np.cumprod(1 + rng.randn(1000) * 0.01) * 1e6)
+        # 夏普率多线程求和的顺序不同，存在舍入误差
+        assert ts.cal_sharpe_ratio_cy(values) == pytest.approx(
+            cal_functions._cal_sharpe_ratio(values.values), rel=1e-12)
+        assert ts.cal_average_rate_cy(values) == \
+            cal_functions._cal_average_rate(values.values)
+        assert ts.cal_max_drawdown_cy(values) == \
+            cal_functions._cal_max_drawdown(values.values)
+
+
+def run_strategy(postanalyzers):
+    n = 3000
+    index = pd.date_range('2020-01-01 09:30', periods=n, freq='min')
+    close = 100 + np.cumsum(np.random.RandomState(2).randn(n) * 0.1)
+    df = pd.DataFrame(dict(open=close, high=close + 0.1, low=close - 0.1,
+                           close=close, volume=1000.0), index=index)
+
+    class St(bt.Strategy):
+        def next(self):
+            if len(self) % 37 == 0:
+                self.buy() if not self.position else self.close()
+
+    cerebro = bt.Cerebro(postanalyzers=postanalyzers)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df,
+                                        timeframe=bt.TimeFrame.Minutes))
+    cerebro.addstrategy(St)
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe',
+                        timeframe=bt.TimeFrame.Minutes, compression=30)
+    strat = cerebro.run()[0]
+    return [analyzer.get_analysis() for analyzer in strat.analyzers]
+
+
+def test_analyzers(monkeypatch):
+    native = [run_strategy(postanalyzers) for postanalyzers in (False, True)]
+    monkeypatch.setattr(drawdown_module, 'cal_drawdown_stats_cy', None)
+    monkeypatch.setattr(sharpe_module, 'cal_sharpe_stats_cy', None)
+    python = [run_strategy(postanalyzers) for postanalyzers in (False, True)]
+    assert native == python
+    assert native[0] == native[1]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
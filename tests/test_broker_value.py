@@ -0,0 +1,109 @@
+"""测试用数组计算持仓价值的时候，账户价值和逐个数据使用佣金类计算的结果完全一致"""
+import pytest
+
+import backtrader as bt
+import backtrader.brokers.bbroker as bbroker_module
+
+import testcommon
+
+
+class HalfLever(bt.CommInfoBase):
+    """重写了计算价值的方法的佣金类，使用佣金类自己计算"""
+    params = (('stocklike', True), ('commtype', bt.CommInfoBase.COMM_PERC))
+
+    def getvalue(self, position, price):
+        return 0.5 * position.size * price
+
+
+class Rotate(bt.Strategy):
+    """每个数据按照不同的周期开多、开空和平仓，记录每个bar的价值"""
+
+    def start(self):
+        self.values = []
+
+    def next(self):
+        for i, d in enumerate(self.datas):
+            if len(self) % (5 + i % 7) == 0:
+                pos = self.getposition(d).size
+                if not pos:
+                    (self.buy if i % 3 else self.sell)(data=d, size=10 + i)
+                else:
+                    self.close(data=d)
+        broker = self.broker
+        self.values.append((broker.getvalue(), broker.getcash(),
+                            broker.get_value(mkt=True),
+                            broker.get_value(lever=True),
+                            broker._unrealized))
+
+
+def run(shortcash=True, count=40, change=None):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.set_shortcash(shortcash)
+    for i in range(count):
+        df = testcommon.make_df(150, seed=60 + i)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name='d%d' % i)
+    # 股票、期货、杠杆和自定义的佣金类
+    cerebro.broker.setcommission(commission=0.001)
+    cerebro.broker.setcommission(commission=2.0, margin=500.0, mult=10.0,
+                                 name='d1')
+    cerebro.broker.setcommission(commission=0.001, leverage=2.0, name='d2')
+    cerebro.broker.setcommission(commission=2.0, margin=300.0, mult=5.0,
+                                 leverage=3.0, name='d4')
+    cerebro.broker.addcommissioninfo(HalfLever(), name='d3')
+    cerebro.addstrategy(Rotate)
+    if change is not None:
+        cerebro.addstrategy(change)
+    return cerebro.run()[0].values
+
+
+@pytest.mark.parametrize('shortcash', [True, False])
+def test_same_values(monkeypatch, shortcash):
+    arrays = run(shortcash)
+    monkeypatch.setattr(bbroker_module.BackBroker, '_valarraymin', 10 ** 9)
+    loop = run(shortcash)
+    assert arrays == loop
+
+
+def test_numpy_missing(monkeypatch):
+    arrays = run()
+    monkeypatch.setattr(bbroker_module, 'np', None)
+    assert run() == arrays
+
+
+class ChangeMult(bt.Strategy):
+    """运行中修改佣金类的参数"""
+
+    def next(self):
+        if len(self) == 70:
+            self.broker.getcommissioninfo(self.datas[1]).p.mult = 20.0
+
+
+def test_param_change(monkeypatch):
+    arrays = run(change=ChangeMult)
+    assert arrays != run()
+    monkeypatch.setattr(bbroker_module.BackBroker, '_valarraymin', 10 ** 9)
+    assert run(change=ChangeMult) == arrays
+
+
+class Marks(bt.Strategy):
+
+    def start(self):
+        self.marks = []
+
+    def next(self):
+        if len(self) == 3:
+            self.buy(size=1)
+        pos = self.position
+        if pos:
+            self.marks.append((pos.datetime, self.data.datetime.datetime()))
+
+
+def test_position_datetime():
+    # 没有利息的时候，每个bar仍然记录持仓的时间
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(testcommon.make_data(50))
+    cerebro.addstrategy(Marks)
+    marks = cerebro.run()[0].marks
+    assert len(marks) > 40
+    # 持仓的时间是broker上一次处理的bar的时间
+    assert all(m == d for m, d in marks[1:])
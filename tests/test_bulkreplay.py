@@ -0,0 +1,78 @@
+"""测试预先计算回放的数据的时候，策略看到的每个部分的bar和逐个bar回放的结果一致"""
+import pandas as pd
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+TF = bt.TimeFrame
+
+
+class Partial(bt.Strategy):
+    """记录每次调用的回放数据的值、tick_xxx的值、指标和账户价值"""
+
+    def __init__(self):
+        data = self.datas[0]
+        self.inds = [bt.ind.SMA(data, period=3),
+                     bt.ind.Highest(data.high, period=3),
+                     bt.ind.SumN(data.volume, period=2)]
+        self.rows = []
+
+    def next(self):
+        data = self.datas[0]
+        row = [len(self), len(data)] + [line[0] for line in data.lines]
+        row += [getattr(data, 'tick_' + name, None)
+                for name in ('open', 'high', 'low', 'close', 'volume')]
+        row += [ind[0] for ind in self.inds] + [self.broker.getvalue()]
+        self.rows.append(row)
+        if len(self.rows) % 37 == 0:
+            self.buy()
+        elif len(self.rows) % 37 == 20:
+            self.close()
+
+
+def replayed(df, bulk, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, bulkreplay=bulk)
+    data = bt.feeds.PandasData(dataname=df, timeframe=TF.Minutes)
+    cerebro.replaydata(data, **kwargs)
+    cerebro.addstrategy(Partial)
+    return cerebro.run()[0].rows
+
+
+def check(df, **kwargs):
+    default = replayed(df, False, **kwargs)
+    bulk = replayed(df, True, **kwargs)
+    assert len(default) > 100
+    assert testcommon.same(default, bulk)
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(timeframe=TF.Minutes, compression=5),
+    dict(timeframe=TF.Minutes, compression=7, bar2edge=False),
+    dict(timeframe=TF.Minutes, compression=15, rightedge=False),
+    dict(timeframe=TF.Minutes, compression=30, adjbartime=True),
+    dict(timeframe=TF.Days, compression=1),
+])
+def test_same_bars(kwargs):
+    check(testcommon.make_intraday(days=5), **kwargs)
+
+
+def test_weeks():
+    check(testcommon.make_intraday(days=25), timeframe=TF.Weeks,
+          compression=1)
+
+
+@pytest.mark.parametrize('takelate', [True, False])
+def test_late_bars(takelate):
+    df = testcommon.make_intraday(days=5)
+    index = df.index.values.copy()
+    index[1000] = index[990]
+    df.index = pd.DatetimeIndex(index)
+    check(df, timeframe=TF.Minutes, compression=5, takelate=takelate)
+
+
+def test_nan_open():
+    df = testcommon.make_intraday(days=5)
+    df.iloc[10, 0] = float('nan')
+    check(df, timeframe=TF.Minutes, compression=5)
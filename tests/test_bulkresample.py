@@ -0,0 +1,128 @@
+"""测试预加载的时候使用数组一次性抽样，得到的bar和逐个bar抽样的结果一致"""
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+TF = bt.TimeFrame
+
+
+def late(df):
+    # 顺序颠倒和重复时间的bar
+    df = df.iloc[:1500].copy()
+    index = df.index.values.copy()
+    index[100], index[101] = index[101], index[100]
+    index[500] = index[490]
+    df.index = pd.DatetimeIndex(index)
+    return df
+
+
+def nanopen(df):
+    df = df.iloc[:1500].copy()
+    df.iloc[10, 0] = float('nan')
+    return df
+
+
+def resampled(df, bulk, clone=False, dkwargs=None, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, bulkresample=bulk)
+    data = bt.feeds.PandasData(dataname=df, timeframe=TF.Minutes,
+                               **(dkwargs or {}))
+    if clone:
+        cerebro.adddata(data)
+    rdata = cerebro.resampledata(data, **kwargs)
+    cerebro.addstrategy(bt.Strategy)
+    cerebro.run()
+    n = rdata.buflen()
+    return [np.array(line.array[:n]) for line in rdata.lines]
+
+
+CASES = [
+    dict(timeframe=TF.Minutes, compression=5),
+    dict(timeframe=TF.Minutes, compression=7, bar2edge=False),
+    dict(timeframe=TF.Minutes, compression=15, rightedge=False),
+    dict(timeframe=TF.Minutes, compression=60, adjbartime=False),
+    dict(timeframe=TF.Minutes, compression=30, boundoff=2),
+    dict(timeframe=TF.Days, compression=1),
+    dict(timeframe=TF.Weeks, compression=1),
+    dict(timeframe=TF.Months, compression=1),
+]
+
+
+def check(df, **kwargs):
+    default = resampled(df, False, **kwargs)
+    bulk = resampled(df, True, **kwargs)
+    assert len(default[0]) > 0
+    assert testcommon.same([x.tolist() for x in default],
+                           [x.tolist() for x in bulk])
+
+
+@pytest.mark.parametrize('kwargs', CASES)
+def test_same_bars(kwargs):
+    check(testcommon.make_intraday(), **kwargs)
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(clone=True, timeframe=TF.Minutes, compression=5),
+    dict(clone=True, timeframe=TF.Days, compression=1),
+    dict(timeframe=TF.Days, compression=1, dkwargs=dict(tz='US/Eastern')),
+    dict(timeframe=TF.Minutes, compression=15,
+         dkwargs=dict(sessionend=datetime.time(15, 30))),
+])
+def test_options(kwargs):
+    check(testcommon.make_intraday(), **kwargs)
+
+
+@pytest.mark.parametrize('takelate', [True, False])
+def test_late_bars(takelate):
+    # takelate=False的时候逐个bar抽样，抽样器的状态需要先恢复
+    check(late(testcommon.make_intraday()), timeframe=TF.Minutes,
+          compression=5, takelate=takelate)
+
+
+def test_state_restored(monkeypatch):
+    # 一次性抽样失败的时候，抽样器的状态和开始的时候一样
+    states = []
+    bulkresample = bt.resamplerfilter.Resampler._bulkresample
+
+    def wrapper(self, data, values):
+        before = self._bulksave()
+        bars = bulkresample(self, data, values)
+        states.append((bars, before, self._bulksave()))
+        return bars
+
+    monkeypatch.setattr(bt.resamplerfilter.Resampler, '_bulkresample',
+                        wrapper)
+    check(late(testcommon.make_intraday()), timeframe=TF.Minutes,
+          compression=5, takelate=False)
+    assert len(states) == 1 and states[0][0] is None
+    bars, before, after = states[0]
+    assert before[0] == after[0]
+    assert testcommon.same([v for k, v in before[1]],
+                           [v for k, v in after[1]])
+
+
+def test_nan_open():
+    check(nanopen(testcommon.make_intraday()), timeframe=TF.Minutes,
+          compression=5)
+
+
+def test_strategy():
+    # 分钟数据上运行策略，同时抽样成15分钟的数据
+    results = []
+    for bulk in (False, True):
+        cerebro = bt.Cerebro(stdstats=False, bulkresample=bulk)
+        data = bt.feeds.PandasData(dataname=testcommon.make_intraday(),
+                                   timeframe=TF.Minutes)
+        cerebro.adddata(data)
+        cerebro.resampledata(data, timeframe=TF.Minutes, compression=15)
+        cerebro.addstrategy(testcommon.SmaCross)
+        strat = cerebro.run()[0]
+        results.append((strat.values, strat.notified))
+
+    assert testcommon.same(results[0][0], results[1][0])
+    assert results[0][1] == results[1][1]
@@ -0,0 +1,144 @@
+"""测试CSV数据使用缓存和直接解析的数据完全一致"""
+import datetime
+import os
+
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+pytest.importorskip('numpy')
+
+
+class Record(bt.Strategy):
+    def start(self):
+        self.values = []
+
+    def next(self):
+        d = self.data
+        self.values.append((d.datetime[0], d.open[0], d.high[0], d.low[0],
+                            d.close[0], d.volume[0], d.openinterest[0]))
+
+
+def write_csv(path, n=500, freq='D', dtformat='%Y-%m-%d'):
+    df = testcommon.make_df(n, seed=18, freq=freq)
+    df.index = df.index.strftime(dtformat)
+    df.to_csv(path, index_label='datetime', float_format='%.6f')
+    return str(path)
+
+
+def run(data, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    cerebro.adddata(data)
+    cerebro.addstrategy(Record)
+    return cerebro.run()[0].values
+
+
+def cachefiles(tmp_path):
+    cachedir = tmp_path / '__btcache__'
+    return sorted(os.listdir(cachedir)) if cachedir.exists() else []
+
+
+GENERIC = dict(datetime=0, open=1, high=2, low=3, close=4, volume=5,
+               openinterest=6)
+
+
+@pytest.mark.parametrize('preload', [True, False])
+@pytest.mark.parametrize('kwargs', [
+    dict(),
+    dict(fromdate=datetime.datetime(2020, 3, 1),
+         todate=datetime.datetime(2020, 10, 1)),
+    dict(tzinput='US/Eastern'),
+])
+def test_generic_cache(tmp_path, preload, kwargs):
+    path = write_csv(tmp_path / 'daily.csv')
+    kwargs = dict(GENERIC, dtformat='%Y-%m-%d', **kwargs)
+    default = run(bt.feeds.GenericCSVData(dataname=path, **kwargs),
+                  preload=preload)
+    # 预加载的时候生成缓存，之后运行的时候使用缓存
+    first = run(bt.feeds.GenericCSVData(dataname=path, cache=True, **kwargs))
+    assert len(cachefiles(tmp_path)) == 1
+    second = run(bt.feeds.GenericCSVData(dataname=path, cache=True,
+                                         **kwargs), preload=preload)
+    assert len(default) > 100
+    assert default == first == second
+
+
+def test_intraday_cache(tmp_path):
+    path = write_csv(tmp_path / 'minute.csv', n=3000, freq='min',
+                     dtformat='%Y-%m-%d %H:%M:%S')
+    kwargs = dict(GENERIC, dtformat='%Y-%m-%d %H:%M:%S',
+                  timeframe=bt.TimeFrame.Minutes)
+    default = run(bt.feeds.GenericCSVData(dataname=path, **kwargs))
+    run(bt.feeds.GenericCSVData(dataname=path, cache=True, **kwargs))
+    cached = run(bt.feeds.GenericCSVData(dataname=path, cache=True,
+                                         **kwargs))
+    assert default == cached
+
+
+def test_changed_params(tmp_path):
+    path = write_csv(tmp_path / 'daily.csv')
+    run(bt.feeds.GenericCSVData(dataname=path, cache=True,
+                                dtformat='%Y-%m-%d', **GENERIC))
+    first = cachefiles(tmp_path)
+    # 参数不同的时候使用不同的缓存
+    run(bt.feeds.GenericCSVData(dataname=path, cache=True,
+                                dtformat='%Y-%m-%d', nullvalue=0.0,
+                                **GENERIC))
+    # 新的缓存替换同一个文件之前的缓存
+    files = cachefiles(tmp_path)
+    assert len(files) == 1 and files != first
+
+
+def test_changed_file(tmp_path):
+    path = write_csv(tmp_path / 'daily.csv')
+    other = write_csv(tmp_path / 'other.csv')
+    kwargs = dict(GENERIC, dtformat='%Y-%m-%d', cache=True)
+    run(bt.feeds.GenericCSVData(dataname=other, **kwargs))
+    run(bt.feeds.GenericCSVData(dataname=path, **kwargs))
+    first = cachefiles(tmp_path)
+    write_csv(tmp_path / 'daily.csv', n=400)
+    os.utime(path, ns=(1, 1))
+    values = run(bt.feeds.GenericCSVData(dataname=path, **kwargs))
+    assert len(values) == 400
+    # 其他文件的缓存保留
+    files = cachefiles(tmp_path)
+    assert len(files) == 2 and files != first
+    assert [f for f in files if f.startswith('other.csv.')] == \
+        [f for f in first if f.startswith('other.csv.')]
+
+
+def test_lookahead(tmp_path):
+    path = write_csv(tmp_path / 'daily.csv')
+    kwargs = dict(GENERIC, dtformat='%Y-%m-%d')
+    results = []
+    for cache in (False, True, True):
+        cerebro = bt.Cerebro(stdstats=False, lookahead=2)
+        cerebro.adddata(bt.feeds.GenericCSVData(dataname=path, cache=cache,
+                                                **kwargs))
+        cerebro.addstrategy(Record)
+        strat = cerebro.run()[0]
+        # 写入缓存的时候也保留lookahead扩展的位置
+        results.append((strat.values, len(strat.data.close.array)))
+
+    assert results[0] == results[1] == results[2]
+    assert results[0][1] == len(results[0][0]) + 2
+
+
+def test_callable_param(tmp_path):
+    path = write_csv(tmp_path / 'daily.csv')
+
+    def parse(days):
+        def dtformat(text):
+            dt = datetime.datetime.strptime(text, '%Y-%m-%d')
+            return dt + datetime.timedelta(days=days)
+        return dtformat
+
+    # 函数的变化无法检测，不使用缓存
+    first = run(bt.feeds.GenericCSVData(dataname=path, cache=True,
+                                        dtformat=parse(0), **GENERIC))
+    second = run(bt.feeds.GenericCSVData(dataname=path, cache=True,
+                                         dtformat=parse(1), **GENERIC))
+    assert cachefiles(tmp_path) == []
+    assert second[0][0] == first[0][0] + 1
@@ -0,0 +1,90 @@
+"""测试CSV数据通过二分查找跳到fromdate和逐行读取的数据完全一致"""
+import datetime
+
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+
+class Record(bt.Strategy):
+    def start(self):
+        self.values = []
+
+    def next(self):
+        self.values.append((self.data.datetime[0], self.data.close[0]))
+
+
+def write_csv(path, df):
+    df = df.copy()
+    df.index = df.index.strftime('%Y-%m-%d %H:%M:%S')
+    df.to_csv(path, index_label='datetime', float_format='%.6f')
+    return str(path)
+
+
+def run(path, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.GenericCSVData(
+        dataname=path, dtformat='%Y-%m-%d %H:%M:%S', datetime=0, open=1,
+        high=2, low=3, close=4, volume=5, openinterest=6,
+        timeframe=bt.TimeFrame.Minutes, **kwargs))
+    cerebro.addstrategy(Record)
+    return cerebro.run()[0].values
+
+
+FROMDATES = [
+    datetime.datetime(2019, 1, 1),
+    datetime.datetime(2020, 1, 3, 10, 17),
+    datetime.datetime(2020, 1, 5, 0, 0, 30),
+    datetime.datetime(2030, 1, 1),
+]
+
+
+@pytest.mark.parametrize('fromdate', FROMDATES)
+def test_sorted(tmp_path, fromdate):
+    df = testcommon.make_df(6000, seed=20, freq='min')
+    path = write_csv(tmp_path / 'sorted.csv', df)
+    assert run(path, fromdate=fromdate) == \
+        run(path, fromdate=fromdate, seek=True)
+    todate = datetime.datetime(2020, 1, 5)
+    assert run(path, fromdate=fromdate, todate=todate) == \
+        run(path, fromdate=fromdate, todate=todate, seek=True)
+
+
+@pytest.mark.parametrize('order', ['descending', 'rotated'])
+def test_unsorted(tmp_path, order):
+    # 没有按照时间递增排列的数据，逐行读取
+    df = testcommon.make_df(6000, seed=21, freq='min')
+    if order == 'descending':
+        df = df.iloc[::-1]
+    else:
+        df = df.iloc[list(range(2000, 6000)) + list(range(2000))]
+
+    path = write_csv(tmp_path / 'unsorted.csv', df)
+    fromdate = datetime.datetime(2020, 1, 2, 12)
+    default = run(path, fromdate=fromdate)
+    assert len(default) > 1000
+    assert default == run(path, fromdate=fromdate, seek=True)
+
+
+@pytest.mark.parametrize('lineno', [1500, 3000, 4500])
+def test_invalid_line(tmp_path, lineno):
+    # 二分查找读取到不能解析的行的时候，从头开始逐行读取，和不使用二分查找的时候一样报错
+    df = testcommon.make_df(6000, seed=22, freq='min')
+    path = write_csv(tmp_path / 'invalid.csv', df)
+    with open(path) as f:
+        lines = f.readlines()
+    lines[lineno] = 'invalid line\n'
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+    fromdate = datetime.datetime(2020, 1, 2)
+    with pytest.raises(ValueError):
+        run(path, fromdate=fromdate)
+    with pytest.raises(ValueError):
+        run(path, fromdate=fromdate, seek=True)
+
+
+def test_default_no_seek():
+    assert bt.feeds.GenericCSVData.params.seek is False
@@ -0,0 +1,45 @@
+"""测试date2num_array/num2date_array和逐个转换的date2num/num2date结果完全一致"""
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+import pytz
+
+from backtrader.utils import date2num, num2date
+from backtrader.utils.dateintern import date2num_array, num2date_array
+
+
+def make_datetimes(n=5000, seed=17):
+    rng = np.random.RandomState(seed)
+    start = np.datetime64('1990-01-01T00:00:00', 'us')
+    # 包括微秒的随机时间
+    us = rng.randint(0, 40 * 365 * 86400, size=n).astype(np.int64) * 1000000
+    us += rng.randint(0, 1000000, size=n)
+    return pd.DatetimeIndex(np.sort(start + us.astype('timedelta64[us]')))
+
+
+@pytest.mark.parametrize('tz', [None, 'US/Eastern', 'Asia/Shanghai'])
+def test_date2num_array(tz):
+    tz = tz and pytz.timezone(tz)
+    dts = make_datetimes()
+    expected = [date2num(dt.to_pydatetime(), tz=tz) for dt in dts]
+    assert date2num_array(dts, tz=tz).tolist() == expected
+    assert date2num_array(dts.to_pydatetime(), tz=tz).tolist() == expected
+
+
+@pytest.mark.parametrize('tz', [None, 'US/Eastern', 'Asia/Shanghai'])
+def test_num2date_array(tz):
+    tz = tz and pytz.timezone(tz)
+    nums = date2num_array(make_datetimes())
+    expected = [num2date(x, tz=tz, naive=True) for x in nums]
+    result = num2date_array(nums, tz=tz).astype(datetime.datetime).tolist()
+    assert result == expected
+
+
+def test_nat_nan():
+    dts = pd.DatetimeIndex(['2020-01-01 10:00', None, '2020-01-02'])
+    nums = date2num_array(dts)
+    assert np.isnan(nums[1])
+    assert nums[0] == date2num(datetime.datetime(2020, 1, 1, 10))
+    assert np.isnat(num2date_array(nums)[1])
@@ -0,0 +1,74 @@
+"""测试使用堆安排数据的时候，稀疏的数据在每个时间上交付的bar和逐个检查所有数据的时候一致"""
+import numpy as np
+import pytest
+
+import backtrader as bt
+import backtrader.cerebro as cerebro_module
+
+import testcommon
+
+
+def sparse_dfs(count=8, n=200):
+    """每个数据随机去掉一部分bar，并且开始的时间不同"""
+    dfs = []
+    for i in range(count):
+        df = testcommon.make_df(n, seed=40 + i, start='2020-01-%02d' % (i + 1))
+        keep = np.random.RandomState(i).rand(n) < 0.3 + 0.08 * i
+        dfs.append(df[keep])
+    return dfs
+
+
+class Lens(bt.Strategy):
+    """记录每次调用的时间和每个数据的长度"""
+
+    def start(self):
+        self.lens = []
+
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        self.lens.append((self.datetime[0],) + tuple(len(d) for d in self.datas))
+
+
+def run(dfs, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    for df in dfs:
+        cerebro.adddata(bt.feeds.PandasData(dataname=df))
+    cerebro.addstrategy(Lens)
+    return cerebro.run()[0].lens
+
+
+def expected(dfs):
+    # 所有时间的并集上，每个数据的长度是不晚于这个时间的bar的个数
+    index = sorted(set().union(*[df.index for df in dfs]))
+    return [(bt.date2num(t.to_pydatetime()),) +
+            tuple(int((df.index <= t).sum()) for df in dfs)
+            for t in index]
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(runonce=False),
+                                    dict(preload=False)])
+def test_sparse(kwargs):
+    dfs = sparse_dfs()
+    assert run(dfs, **kwargs) == expected(dfs)
+
+
+@pytest.mark.parametrize('kwargs', [dict(runonce=False), dict(preload=False)])
+def test_general_loop(monkeypatch, kwargs):
+    # 不使用堆的时候逐个检查所有数据，结果一致
+    dfs = sparse_dfs()
+    heap = run(dfs, **kwargs)
+    monkeypatch.setattr(cerebro_module._DataHeap, 'usable',
+                        staticmethod(lambda datas: False))
+    assert run(dfs, **kwargs) == heap
+
+
+def test_strategy():
+    datas = [lambda df=df: bt.feeds.PandasData(dataname=df)
+             for df in sparse_dfs(count=4, n=400)]
+    default = testcommon.run(datas)
+    for kwargs in [dict(runonce=False), dict(preload=False)]:
+        other = testcommon.run(datas, **kwargs)
+        assert testcommon.same(default.values, other.values)
+        assert default.notified == other.notified
@@ -0,0 +1,115 @@
+"""测试只保存一部分订单和交易的时候，策略和分析器收到的通知和保存全部历史的时候一致，不再保存的写入到文件中"""
+import json
+import os
+
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+KINDS = ['market', 'limit', 'stop', 'oco', 'bracket', 'cancel']
+
+
+class Notified(bt.Analyzer):
+    """记录分析器收到的订单和交易的通知"""
+
+    def start(self):
+        self.rets = dict(orders=[], trades=[])
+
+    def notify_order(self, order):
+        self.rets['orders'].append((order.getstatusname(),
+                                    order.executed.size))
+
+    def notify_trade(self, trade):
+        self.rets['trades'].append((trade.status, trade.pnl))
+
+
+def make_cerebro(**kwargs):
+    cerebro = bt.Cerebro(stdstats=False, tradehistory=True, **kwargs)
+    for i in range(3):
+        df = testcommon.make_df(200, seed=90 + i)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name='d%d' % i)
+    cerebro.addanalyzer(Notified, _name='notified')
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+    cerebro.addanalyzer(bt.analyzers.Transactions, _name='transactions')
+    return cerebro
+
+
+def run(**kwargs):
+    cerebro = make_cerebro(**kwargs)
+    cerebro.addstrategy(testcommon.RandomOrders, kinds=KINDS)
+    strat = cerebro.run()[0]
+    return strat, [strat.notified, strat.values,
+                   strat.analyzers.notified.get_analysis(),
+                   str(strat.analyzers.trades.get_analysis()),
+                   str(strat.analyzers.transactions.get_analysis())]
+
+
+def read(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('histretain', ['open', 5, 0])
+def test_same_notifications(histretain):
+    full, expected = run()
+    strat, results = run(histretain=histretain)
+    assert results == expected
+    assert len(strat._orders) < len(full._orders)
+
+
+def test_spill(tmpdir):
+    filename = str(tmpdir.join('spill.jsonl'))
+    full, expected = run()
+    strat, results = run(histspill=filename)
+    assert results == expected
+
+    lines = read(filename)
+    orders = [x for x in lines if x['kind'] == 'order']
+    trades = [x for x in lines if x['kind'] == 'trade']
+    # 一个订单的每个通知一行，保存在内存中的是没有结束的订单
+    assert len(orders) + len(strat._orders) == len(full._orders)
+    assert all(o.alive() for o in strat._orders)
+    assert trades and all(x['status'] == 'Closed' for x in trades)
+    assert all(x['strategy'] == 'RandomOrders' and
+               x['params'] == dict(kinds=KINDS) for x in lines)
+
+
+class Failing(testcommon.RandomOrders):
+
+    def next(self):
+        super(Failing, self).next()
+        if len(self) == 150:
+            raise RuntimeError('failing strategy')
+
+
+def test_spill_error(tmpdir):
+    # 运行出错的时候文件也被关闭，已经写入的行都在文件中
+    filename = str(tmpdir.join('spill.jsonl'))
+    cerebro = make_cerebro(histspill=filename)
+    cerebro.addstrategy(Failing, kinds=KINDS)
+    with pytest.raises(RuntimeError):
+        cerebro.run()
+
+    assert read(filename)
+
+
+def test_spill_optimization(tmpdir):
+    # 每个进程写入自己的文件，每一行都可以找到对应的参数
+    filename = str(tmpdir.join('spill.jsonl'))
+    cerebro = make_cerebro(histspill=filename, maxcpus=2)
+    kinds = [['market', 'limit', 'cancel'], ['market', 'stop', 'cancel'],
+             ['market', 'oco', 'cancel'], ['market', 'bracket', 'cancel']]
+    cerebro.optstrategy(testcommon.RandomOrders, kinds=kinds)
+    cerebro.run()
+
+    assert not os.path.exists(filename)
+    names = os.listdir(str(tmpdir))
+    assert names and all(n.startswith('spill.') and n.endswith('.jsonl')
+                         for n in names)
+    lines = []
+    for name in names:
+        lines.extend(read(str(tmpdir.join(name))))
+    params = set(tuple(x['params']['kinds']) for x in lines)
+    assert params == set(tuple(k) for k in kinds)
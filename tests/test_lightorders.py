@@ -0,0 +1,56 @@
+"""测试轻量级订单的成交和通知和普通的订单一致，并且可以在订单的信息上设置新的属性"""
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+KINDS = ['market', 'limit', 'stop', 'stoplimit', 'stoptrail', 'oco',
+         'bracket', 'close', 'cancel']
+
+
+def run(lightorders, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    cerebro.broker.set_lightorders(lightorders)
+    for i in range(3):
+        df = testcommon.make_df(250, seed=80 + i)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name='d%d' % i)
+    cerebro.addstrategy(testcommon.RandomOrders, kinds=KINDS)
+    strat = cerebro.run()[0]
+    return strat.notified, strat.values
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(runonce=False)])
+def test_same_orders(kwargs):
+    assert run(True, **kwargs) == run(False, **kwargs)
+
+
+class Tagged(bt.Strategy):
+    """在订单的创建和执行信息上设置新的属性"""
+
+    def start(self):
+        self.tags = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            exbit = list(order.executed.iterpending())[0]
+            exbit.seen = True
+            self.tags.append((order.created.tag, order.executed.tag,
+                              exbit.seen))
+
+    def next(self):
+        if len(self) % 10 == 1:
+            order = self.buy(size=1)
+            order.created.tag = len(self)
+            order.executed.tag = 'x%d' % len(self)
+
+
+@pytest.mark.parametrize('lightorders', [False, True])
+def test_user_attributes(lightorders):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.set_lightorders(lightorders)
+    cerebro.adddata(testcommon.make_data(50))
+    cerebro.addstrategy(Tagged)
+    tags = cerebro.run()[0].tags
+    # 通知的是克隆的订单，属性也被复制
+    assert tags == [(i, 'x%d' % i, True) for i in range(1, 50, 10)]
@@ -0,0 +1,52 @@
+"""测试linestorage='numpy'和默认的array.array保存数据的时候结果一致"""
+import pytest
+
+import testcommon
+
+pytest.importorskip('numpy')
+
+DATAS = [lambda: testcommon.make_data(500, seed=1),
+         lambda: testcommon.make_data(500, seed=2)]
+
+
+def test_numpy_storage_next():
+    default = testcommon.run(DATAS, runonce=False)
+    numpy = testcommon.run(DATAS, runonce=False, linestorage='numpy')
+    assert len(default.values) > 400 and default.notified
+    assert testcommon.same(default.values, numpy.values)
+    assert default.notified == numpy.notified
+
+
+def test_numpy_storage_once():
+    default = testcommon.run(DATAS)
+    numpy = testcommon.run(DATAS, linestorage='numpy')
+    # 向量化计算指数平滑的时候计算顺序不同，存在舍入误差
+    assert testcommon.same(default.values, numpy.values, rel=1e-12)
+    assert default.notified == numpy.notified
+
+
+def test_get_returns_view():
+    import numpy as np
+    strat = testcommon.run(DATAS[:1], linestorage='numpy')
+    close = strat.data.close
+    values = close.get(size=10)
+    assert not values.flags.writeable
+    assert np.shares_memory(values, np.asarray(close.array))
+    with pytest.raises(ValueError):
+        values[:] = 0.0
+    assert list(values) == [close[i] for i in range(-9, 1)]
+
+
+def test_storage_per_run():
+    import array
+    from backtrader import linebuffer
+    numpy = testcommon.run(DATAS[:1], linestorage='numpy')
+    default = testcommon.run(DATAS[:1])
+    assert numpy.getindicators() and default.getindicators()
+    for obj in [numpy, numpy.data] + numpy.getindicators():
+        for line in obj.lines:
+            assert isinstance(line.array, linebuffer.NumpyLineArray)
+    for obj in [default, default.data] + default.getindicators():
+        for line in obj.lines:
+            assert type(line.array) is array.array
+    assert type(linebuffer.LineBuffer().array) is array.array
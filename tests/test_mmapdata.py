@@ -0,0 +1,40 @@
+"""测试MMapDataWriter写入的数据使用MMapData回测和原来的数据结果一致"""
+import datetime
+
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def mmappath(tmp_path):
+    path = str(tmp_path / 'data')
+    count = bt.feeds.MMapDataWriter(path, chunksize=100).write(
+        testcommon.make_data(600, seed=19))
+    assert count == 600
+    return path
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(),
+    dict(runonce=False),
+    dict(preload=False),
+    dict(exactbars=1),
+])
+@pytest.mark.parametrize('dates', [
+    dict(),
+    dict(fromdate=datetime.datetime(2020, 4, 1),
+         todate=datetime.datetime(2021, 2, 1)),
+])
+def test_mmapdata(mmappath, kwargs, dates):
+    default = testcommon.run(
+        [lambda: testcommon.make_data(600, seed=19, **dates)], **kwargs)
+    mmap = testcommon.run(
+        [lambda: bt.feeds.MMapData(dataname=mmappath, **dates)], **kwargs)
+    assert len(default.values) > 100
+    assert testcommon.same(default.values, mmap.values)
+    assert default.notified == mmap.notified
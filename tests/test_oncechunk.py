@@ -0,0 +1,52 @@
+"""测试exactbars模式下分块使用once计算指标的时候，结果和默认的运行模式一致，并且只保存有限的数据"""
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+
+class Kept(testcommon.SmaCross):
+    """记录运行中数据和指标保存的最大长度"""
+
+    def start(self):
+        self.kept = 0
+
+    def next(self):
+        super(Kept, self).next()
+        lines = [self.data.close]
+        lines.extend(ind.lines[0] for ind in self.inds[self.data])
+        self.kept = max([self.kept] + [len(line.array) for line in lines])
+
+
+def datas(count=1):
+    return [lambda i=i: testcommon.make_data(600, seed=100 + i)
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('oncechunk', [7, 50, 5000])
+def test_same_results(oncechunk):
+    default = testcommon.run(datas())
+    chunked = testcommon.run(datas(), strategy=Kept, exactbars=1,
+                             oncechunk=oncechunk)
+    assert testcommon.same(default.values, chunked.values)
+    assert default.notified == chunked.notified
+
+    # 只保存当前的块和最小周期需要的值
+    assert chunked.kept <= min(oncechunk, 600) + 50
+
+
+def test_exactbars_next():
+    # 标准的exactbars模式(逐个bar计算)的结果也一致
+    chunked = testcommon.run(datas(), exactbars=1, oncechunk=50)
+    standard = testcommon.run(datas(), exactbars=1)
+    assert testcommon.same(chunked.values, standard.values)
+    assert chunked.notified == standard.notified
+
+
+def test_several_datas():
+    # 多个数据的时候使用标准的exactbars模式
+    default = testcommon.run(datas(3))
+    chunked = testcommon.run(datas(3), exactbars=1, oncechunk=50)
+    assert testcommon.same(default.values, chunked.values)
+    assert default.notified == chunked.notified
@@ -0,0 +1,50 @@
+"""测试参数优化按块分配、不按顺序返回结果和run_iter的结果和默认的方式一致"""
+import multiprocessing
+
+import backtrader as bt
+
+import testcommon
+
+
+def make_cerebro(**kwargs):
+    cerebro = bt.Cerebro(maxcpus=2, **kwargs)
+    cerebro.adddata(testcommon.make_data(300, seed=10))
+    cerebro.optstrategy(testcommon.SmaCross, fast=[3, 5, 7, 9],
+                        slow=[20, 30])
+    cerebro.addanalyzer(testcommon.Values, _name='values')
+    return cerebro
+
+
+def result(r):
+    return ((r[0].p.fast, r[0].p.slow), r[0].analyzers.values.get_analysis())
+
+
+# 回调函数会随着cerebro发送到子进程中，需要能够pickle
+called = []
+
+
+def callback(r):
+    called.append(result(r))
+
+
+def test_chunked_unordered():
+    default = [result(r) for r in make_cerebro().run()]
+    cerebro = make_cerebro(optchunksize=3, optordered=False)
+    del called[:]
+    cerebro.optcallback(callback)
+    unordered = [result(r) for r in cerebro.run()]
+    assert len(default) == 8
+    # 不按顺序返回结果的时候，按照参数排序之后和默认的结果一致
+    assert sorted(unordered) == default
+    assert called == unordered
+
+
+def test_run_iter():
+    default = [result(r) for r in make_cerebro().run()]
+    assert [result(r) for r in make_cerebro().run_iter()] == default
+
+    # 提前关闭生成器的时候终止子进程
+    it = make_cerebro().run_iter()
+    assert result(next(it)) == default[0]
+    it.close()
+    assert not multiprocessing.active_children()
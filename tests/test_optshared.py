@@ -0,0 +1,33 @@
+"""测试参数优化的时候使用内存映射文件共享数据和默认的方式结果一致"""
+import pytest
+
+import backtrader as bt
+import backtrader.cerebro as cerebro_module
+
+import testcommon
+
+pytest.importorskip('numpy')
+
+
+def optimize(**kwargs):
+    cerebro = bt.Cerebro(maxcpus=2, **kwargs)
+    cerebro.adddata(testcommon.make_data(400, seed=8))
+    cerebro.adddata(testcommon.make_data(400, seed=9))
+    cerebro.optstrategy(testcommon.SmaCross, fast=[3, 5, 7], slow=[20, 30])
+    cerebro.addanalyzer(testcommon.Values, _name='values')
+    results = cerebro.run()
+    return [(r[0].p.fast, r[0].p.slow, r[0].analyzers.values.get_analysis())
+            for r in results]
+
+
+def test_optshared():
+    default = optimize()
+    shared = optimize(optshared=True)
+    assert len(default) == 6 and len(set(map(str, default))) == 6
+    assert testcommon.same(default, shared)
+
+
+def test_optshared_without_numpy(monkeypatch):
+    monkeypatch.setattr(cerebro_module, 'np', None)
+    with pytest.raises(ImportError):
+        optimize(optshared=True)
@@ -0,0 +1,60 @@
+"""测试按照订单簿只检查可能成交或者到期的订单的时候，订单的成交、取消和到期和逐个检查全部待成交订单的结果一致"""
+import pytest
+
+import backtrader as bt
+import backtrader.brokers.bbroker as bbroker_module
+
+import testcommon
+
+
+def checkall(self, order, seq=None):
+    # 全部订单都在每个bar检查，和使用订单簿之前逐个检查待成交订单一样
+    if seq is None:
+        seq = next(self._bookseq)
+
+    book = self._books.get(order.data)
+    if book is None:
+        book = self._books[order.data] = bbroker_module._OrderBook()
+
+    book.always[seq] = order
+    self._booked[order.ref] = (seq, order.data, [(book.always, seq)])
+
+
+def run(kinds, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    for i in range(4):
+        df = testcommon.make_df(250, seed=70 + i)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name='d%d' % i)
+    cerebro.addstrategy(testcommon.RandomOrders, kinds=kinds)
+    strat = cerebro.run()[0]
+    return strat.notified, strat.values
+
+
+KINDS = [
+    ['limit', 'stop', 'stoplimit'],
+    ['bracket', 'market'],
+    ['oco', 'market'],
+    ['stoptrail', 'market', 'close'],
+    ['limit', 'stop', 'bracket', 'oco', 'cancel'],
+    ['market', 'limit', 'stop', 'stoplimit', 'stoptrail', 'oco', 'bracket',
+     'close', 'cancel'],
+]
+
+
+@pytest.mark.parametrize('kinds', KINDS)
+@pytest.mark.parametrize('kwargs', [dict(), dict(runonce=False),
+                                    dict(quicknotify=True)])
+def test_same_orders(monkeypatch, kinds, kwargs):
+    books = run(kinds, **kwargs)
+    monkeypatch.setattr(bbroker_module.BackBroker, '_book', checkall)
+    assert run(kinds, **kwargs) == books
+
+
+def test_statuses():
+    # 随机的订单覆盖了成交、取消和到期
+    notified, values = run(KINDS[-1])
+    statuses = set(n[3] for n in notified)
+    assert {'Completed', 'Canceled', 'Expired'} <= statuses
+    names = set(n[2] for n in notified if n[3] == 'Completed')
+    assert {'Market', 'Limit', 'Stop', 'StopLimit', 'StopTrail',
+            'StopTrailLimit', 'Close'} <= names
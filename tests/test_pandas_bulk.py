@@ -0,0 +1,50 @@
+"""测试PandasData按列一次性预加载和逐行加载的数据完全一致"""
+import datetime
+
+import pandas as pd
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+
+def load(data, monkeypatch=None):
+    # monkeypatch不是None的时候，禁止按列加载，使用逐行加载
+    if monkeypatch is not None:
+        monkeypatch.setattr(bt.feeds.PandasData, '_preload_columns',
+                            lambda self: False)
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(data)
+    cerebro.addstrategy(bt.Strategy)
+    cerebro.run()
+    if monkeypatch is not None:
+        monkeypatch.undo()
+    return [list(line.array) for line in data.lines]
+
+
+def frames():
+    daily = testcommon.make_df(400, seed=14)
+    minutes = testcommon.make_df(2000, seed=15, start='2021-03-01 09:30:00',
+                                 freq='min')
+    micro = testcommon.make_df(500, seed=16, start='2021-03-01 09:30:00',
+                               freq='1234567us')
+    column = daily.reset_index().rename(columns={'index': 'datetime'})
+    return [
+        (daily, dict()),
+        (daily, dict(fromdate=datetime.datetime(2020, 3, 1),
+                     todate=datetime.datetime(2020, 9, 30))),
+        (minutes, dict(timeframe=bt.TimeFrame.Minutes)),
+        (micro, dict(timeframe=bt.TimeFrame.Seconds)),
+        (column, dict(datetime='datetime')),
+        (daily.drop(columns=['openinterest']), dict(openinterest=None)),
+    ]
+
+
+@pytest.mark.parametrize('index', range(len(frames())))
+def test_bulk_preload(index, monkeypatch):
+    df, kwargs = frames()[index]
+    bulk = load(bt.feeds.PandasData(dataname=df, **kwargs))
+    rows = load(bt.feeds.PandasData(dataname=df, **kwargs), monkeypatch)
+    assert len(bulk[0]) > 0
+    assert testcommon.same(bulk, rows)
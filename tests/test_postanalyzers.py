@@ -0,0 +1,129 @@
+"""测试运行结束之后才计算的analyzer和逐个bar计算的analyzer的结果一致"""
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+TF = bt.TimeFrame
+
+DAILY = [
+    ('dd', bt.analyzers.DrawDown, dict()),
+    ('tdd', bt.analyzers.TimeDrawDown, dict(timeframe=TF.Weeks)),
+    ('sqn', bt.analyzers.SQN, dict()),
+    ('returns', bt.analyzers.Returns, dict()),
+    ('returns_m', bt.analyzers.Returns, dict(timeframe=TF.Months, tann=12)),
+    ('vwr', bt.analyzers.VWR, dict()),
+    ('calmar', bt.analyzers.Calmar, dict()),
+    ('annual', bt.analyzers.AnnualReturn, dict()),
+    ('sharpe', bt.analyzers.SharpeRatio, dict()),
+    ('sharpe_d', bt.analyzers.SharpeRatio, dict(timeframe=TF.Days,
+                                                annualize=True)),
+    ('sharpe_a', bt.analyzers.SharpeRatio_A, dict(timeframe=TF.Months)),
+    ('stats', bt.analyzers.PeriodStats, dict(timeframe=TF.Months)),
+    ('ret_d', bt.analyzers.TimeReturn, dict(timeframe=TF.Days)),
+    ('ret_w', bt.analyzers.TimeReturn, dict(timeframe=TF.Weeks)),
+    ('ret_all', bt.analyzers.TimeReturn, dict(timeframe=TF.NoTimeFrame)),
+    ('logret', bt.analyzers.LogReturnsRolling, dict(timeframe=TF.Months)),
+]
+
+INTRADAY = [
+    ('dd', bt.analyzers.DrawDown, dict()),
+    ('tdd', bt.analyzers.TimeDrawDown, dict(timeframe=TF.Minutes,
+                                            compression=30)),
+    ('returns', bt.analyzers.Returns, dict(timeframe=TF.Days, tann=252)),
+    ('vwr', bt.analyzers.VWR, dict(timeframe=TF.Minutes, compression=60)),
+    ('sharpe', bt.analyzers.SharpeRatio, dict(timeframe=TF.Minutes,
+                                              compression=15, factor=100)),
+    ('stats', bt.analyzers.PeriodStats, dict(timeframe=TF.Days)),
+    ('ret_m5', bt.analyzers.TimeReturn, dict(timeframe=TF.Minutes,
+                                             compression=5)),
+    ('ret_d', bt.analyzers.TimeReturn, dict(timeframe=TF.Days)),
+]
+
+# 运行的时候需要逐个bar计算的analyzer
+PERBAR = [
+    ('trades', bt.analyzers.TradeAnalyzer, dict()),
+    ('trans', bt.analyzers.Transactions, dict()),
+    ('ret_data', bt.analyzers.TimeReturn, dict(timeframe=TF.Days, data=1)),
+]
+
+
+class NextReturn(bt.analyzers.TimeReturn):
+    """重写了next的子类，需要逐个bar调用"""
+
+    def next(self):
+        super(NextReturn, self).next()
+        self.calls = getattr(self, 'calls', 0) + 1
+
+
+def run(post, datas, analyzers, fundmode=False, **kwargs):
+    cerebro = bt.Cerebro(postanalyzers=post, **kwargs)
+    for data in datas:
+        cerebro.adddata(data())
+    cerebro.broker.set_fundmode(fundmode)
+    cerebro.addstrategy(testcommon.RandomOrders,
+                        kinds=['market', 'limit', 'close'])
+    for name, cls, kw in analyzers:
+        kw = dict(kw)
+        if 'data' in kw:
+            kw['data'] = cerebro.datas[kw['data']]
+        cerebro.addanalyzer(cls, _name=name, **kw)
+    strategy = cerebro.run()[0]
+    results = [(name, strategy.analyzers.getbyname(name).get_analysis())
+               for name, _, _ in analyzers]
+    return strategy, results
+
+
+def check(datas, analyzers, post=(), **kwargs):
+    default = run(False, datas, analyzers, **kwargs)[1]
+    strategy, results = run(True, datas, analyzers, **kwargs)
+    names = [name for name, _, _ in analyzers
+             if strategy.analyzers.getbyname(name) in
+             strategy._postanalyzers]
+    assert names == [name for name, _, _ in analyzers if name in post]
+    assert testcommon.same(default, results)
+    return results
+
+
+def daily():
+    return [lambda: testcommon.make_data(800, seed=1),
+            lambda: testcommon.make_data(800, seed=2)]
+
+
+def intraday():
+    return [lambda: bt.feeds.PandasData(
+        dataname=testcommon.make_intraday(days=15, freq='1min'),
+        timeframe=TF.Minutes)]
+
+
+@pytest.mark.parametrize('fundmode', [False, True])
+def test_daily(fundmode):
+    analyzers = DAILY + PERBAR
+    results = check(daily(), analyzers, [name for name, _, _ in DAILY],
+                    fundmode=fundmode)
+    assert dict(results)['trades']['total']['closed'] > 10
+
+
+def test_intraday():
+    check(intraday(), INTRADAY, [name for name, _, _ in INTRADAY])
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(stdstats=False),
+    dict(runonce=False),
+    dict(preload=False),
+])
+def test_modes(kwargs):
+    # AnnualReturn需要broker的observer
+    analyzers = [a for a in DAILY
+                 if kwargs.get('stdstats', True) or a[0] != 'annual']
+    check(daily(), analyzers, [name for name, _, _ in analyzers], **kwargs)
+
+
+def test_perbar_subclass():
+    analyzers = [('dd', bt.analyzers.DrawDown, dict()),
+                 ('nextret', NextReturn, dict(timeframe=TF.Weeks))]
+    check(daily(), analyzers, ['dd'])
+    strategy = run(True, daily(), analyzers)[0]
+    assert strategy.analyzers.nextret.calls == 800
@@ -0,0 +1,78 @@
+"""测试数据退出事件循环之后结果不变，retireclose的时候使用最后的收盘价平掉持仓"""
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+MODES = [dict(), dict(runonce=False), dict(preload=False), dict(oncechunk=50)]
+
+
+class BuyHold(bt.Strategy):
+    """每个数据第一个bar买入之后一直持有"""
+
+    def start(self):
+        self.notified = []
+        self.values = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.notified.append((order.data._name, order.executed.size,
+                                  order.executed.price))
+
+    def next(self):
+        self.values.append(self.broker.getvalue())
+        for d in self.datas:
+            if len(d) == 1 and not self.getposition(d):
+                self.buy(data=d, size=10)
+
+
+def run(nbars, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    for i, n in enumerate(nbars):
+        df = testcommon.make_df(n, seed=23 + i)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name='d%d' % i)
+    cerebro.addstrategy(BuyHold)
+    return cerebro, cerebro.run()[0]
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+def test_same_results(kwargs):
+    # 数据在不同的时间结束，退出事件循环和默认的结果一致
+    default = testcommon.run(
+        [lambda: testcommon.make_data(300, seed=24),
+         lambda: testcommon.make_data(120, seed=25, start='2020-03-01'),
+         lambda: testcommon.make_data(60, seed=26)])
+    other = testcommon.run(
+        [lambda: testcommon.make_data(300, seed=24),
+         lambda: testcommon.make_data(120, seed=25, start='2020-03-01'),
+         lambda: testcommon.make_data(60, seed=26)], **kwargs)
+    assert testcommon.same(default.values, other.values)
+    assert default.notified == other.notified
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+def test_retireclose_single(kwargs):
+    cerebro, strat = run([200], retireclose=True, **kwargs)
+    data = cerebro.datas[0]
+    broker = cerebro.broker
+    assert not broker.getposition(data)
+    assert broker.getvalue() == broker.getcash()
+    # 最后一个bar的收盘价平仓
+    assert strat.notified[-1] == ('d0', -10, data.close[0])
+
+    # 不平仓的时候持仓保留
+    cerebro, strat = run([200], **kwargs)
+    assert cerebro.broker.getposition(cerebro.datas[0]).size == 10
+
+
+@pytest.mark.parametrize('kwargs', MODES)
+def test_retireclose_multiple(kwargs):
+    cerebro, strat = run([300, 120, 60], retireclose=True, **kwargs)
+    closes = [(n, s, p) for n, s, p in strat.notified if s < 0]
+    assert sorted(n for n, s, p in closes) == ['d0', 'd1', 'd2']
+    for data in cerebro.datas:
+        assert not cerebro.broker.getposition(data)
+        # 每个数据在自己的最后一个收盘价平仓
+        price = [p for n, s, p in closes if n == data._name][0]
+        assert price == pytest.approx(data.close[0], rel=1e-12)
@@ -0,0 +1,60 @@
+"""测试next模式下增量计算的滚动窗口和对整个窗口重新计算的结果一致"""
+import math
+
+import backtrader as bt
+
+import testcommon
+
+
+class Rolling(bt.Strategy):
+    params = (('period', 10),)
+
+    def __init__(self):
+        d, period = self.data, self.p.period
+        self.inds = [
+            bt.ind.Highest(d.high, period=period),
+            bt.ind.Lowest(d.low, period=period),
+            bt.ind.SumN(d.close, period=period),
+            bt.ind.SMA(d.close, period=period),
+        ]
+        self.values = []
+        self.expected = []
+
+    def next(self):
+        period = self.p.period
+        d = self.data
+        self.values.append([ind[0] for ind in self.inds])
+        # 使用原来的方式对整个窗口重新计算
+        self.expected.append([
+            max(d.high.get(size=period)),
+            min(d.low.get(size=period)),
+            math.fsum(d.close.get(size=period)),
+            math.fsum(d.close.get(size=period)) / period,
+        ])
+
+
+def test_next_equals_once():
+    datas = [lambda: testcommon.make_data(600, seed=5)]
+    once = testcommon.run(datas, strategy=Rolling)
+    nextmode = testcommon.run(datas, strategy=Rolling, runonce=False)
+    assert nextmode.values == once.values
+    assert nextmode.values == nextmode.expected
+
+
+def test_replay():
+    # replay的时候同一个bar会多次更新，窗口中最后的值被替换
+    cerebro = bt.Cerebro()
+    cerebro.replaydata(testcommon.make_data(600, seed=6),
+                       timeframe=bt.TimeFrame.Weeks)
+    cerebro.addstrategy(Rolling, period=5)
+    strat = cerebro.run()[0]
+    assert len(strat.values) > 400
+    assert strat.values == strat.expected
+
+
+def test_nan_window():
+    df = testcommon.make_df(300, seed=7)
+    df.iloc[50:53] = float('nan')
+    datas = [lambda: bt.feeds.PandasData(dataname=df)]
+    strat = testcommon.run(datas, strategy=Rolling, runonce=False)
+    assert testcommon.same(strat.values, strat.expected)
@@ -0,0 +1,96 @@
+"""测试signalskipidle模式下跳过没有事件的bar的时候，订单、交易和账户价值和正常运行的结果一致，不能使用的时候给出警告"""
+import warnings
+
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+
+class Cross(bt.Indicator):
+    lines = ('signal',)
+    params = (('fast', 10), ('slow', 30))
+
+    def __init__(self):
+        self.lines.signal = (bt.ind.SMA(period=self.p.fast) -
+                             bt.ind.SMA(period=self.p.slow))
+
+
+class Momentum(bt.Indicator):
+    lines = ('signal',)
+
+    def __init__(self):
+        self.lines.signal = self.data - self.data(-5)
+
+
+class Values(bt.Analyzer):
+    """记录正常运行的时候每个bar的账户价值、现金和持仓"""
+
+    def start(self):
+        self.rets = []
+
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        broker = self.strategy.broker
+        self.rets.append((broker.getvalue(), broker.getcash(),
+                          broker.getposition(self.data).size))
+
+    def get_analysis(self):
+        return self.rets
+
+
+SIGNALS = [
+    [(bt.SIGNAL_LONGSHORT, Cross)],
+    [(bt.SIGNAL_LONG, Cross), (bt.SIGNAL_LONGEXIT, Momentum)],
+    [(bt.SIGNAL_SHORT, Cross), (bt.SIGNAL_LONG_INV, Momentum)],
+]
+
+
+def run(signals, signalskipidle, stdstats=False, analyzer=False, **kwargs):
+    cerebro = bt.Cerebro(stdstats=stdstats, signalskipidle=signalskipidle,
+                         **kwargs)
+    cerebro.adddata(testcommon.make_data(1000, seed=5))
+    for sigtype, sigcls in signals:
+        cerebro.add_signal(sigtype, sigcls)
+    cerebro.broker.setcommission(commission=0.001)
+    cerebro.addsizer(bt.sizers.FixedSize, stake=10)
+    if analyzer:
+        cerebro.addanalyzer(Values, _name='values')
+    strat = cerebro.run()[0]
+    orders = [(o.getstatusname(), o.executed.size, o.executed.price,
+               o.executed.comm, o.created.dt) for o in strat._orders]
+    trades = [(t.status, t.size, t.pnl, t.pnlcomm, t.dtopen, t.dtclose)
+              for d in strat._trades.values() for ts in d.values()
+              for t in ts]
+    return strat, (cerebro.broker.getvalue(), cerebro.broker.getcash(),
+                   orders, trades)
+
+
+@pytest.mark.parametrize('signals', SIGNALS)
+def test_same_results(signals):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')  # the idle bars are skipped
+        skip, skipres = run(signals, True)
+
+    regular, regres = run(signals, False, analyzer=True)
+    assert skipres == regres
+    assert skip.signalrun.processed < len(skip)
+    values = list(zip(skip.signalrun.value, skip.signalrun.cash,
+                      skip.signalrun.position))
+    assert testcommon.same(values, regular.analyzers.values.get_analysis())
+
+
+@pytest.mark.parametrize('kwargs,reason', [
+    (dict(stdstats=True), 'observers'),
+    (dict(analyzer=True), 'analyzers'),
+    (dict(runonce=False), 'runonce'),
+])
+def test_warning(kwargs, reason):
+    with pytest.warns(RuntimeWarning, match='signalskipidle.*' + reason):
+        strat, res = run(SIGNALS[0], True, **kwargs)
+
+    assert not hasattr(strat, 'signalrun')
+    assert res == run(SIGNALS[0], False, **kwargs)[1]
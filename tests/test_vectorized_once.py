@@ -0,0 +1,67 @@
+"""测试linestorage='numpy'的时候向量化计算的once和逐个计算的结果一致"""
+import pytest
+
+import backtrader as bt
+
+import testcommon
+
+pytest.importorskip('numpy')
+
+
+class Indicators(bt.Strategy):
+    def __init__(self):
+        d = self.data
+        self.inds = [
+            bt.ind.Highest(d.high, period=10),
+            bt.ind.Lowest(d.low, period=10),
+            bt.ind.SumN(d.close, period=7),
+            bt.ind.AnyN(d.close > d.open, period=3),
+            bt.ind.AllN(d.close > d.open, period=3),
+            bt.ind.SMA(d, period=15),
+            bt.ind.EMA(d, period=15),
+            bt.ind.WMA(d, period=15),
+            d.close - d.open,
+            d.close / d.open,
+            d.close * 2.0,
+            abs(d.close - d.open),
+            bt.And(d.close > d.open, d.volume > 500),
+            bt.ind.MACD(d).macd,
+            bt.ind.BollingerBands(d).top,
+        ]
+        self.values = []
+
+    def next(self):
+        self.values.append([ind[0] for ind in self.inds])
+
+
+def test_vectorized_once():
+    datas = [lambda: testcommon.make_data(800, seed=3)]
+    default = testcommon.run(datas, strategy=Indicators)
+    numpy = testcommon.run(datas, strategy=Indicators, linestorage='numpy')
+    nextmode = testcommon.run(datas, strategy=Indicators, runonce=False,
+                              linestorage='numpy')
+    assert len(default.values) > 700
+    # 向量化计算的时候求和的顺序不同，存在舍入误差，MACD是两个均线的差，相对误差会放大
+    assert testcommon.same(default.values, numpy.values, rel=1e-9)
+    assert testcommon.same(nextmode.values, numpy.values, rel=1e-9)
+
+
+def test_nan_fallback():
+    df = testcommon.make_df(300, seed=4)
+    df.iloc[100:105, df.columns.get_loc('close')] = float('nan')
+    datas = [lambda: bt.feeds.PandasData(dataname=df)]
+    default = testcommon.run(datas, strategy=Indicators)
+    numpy = testcommon.run(datas, strategy=Indicators, linestorage='numpy')
+    assert testcommon.same(default.values, numpy.values, rel=1e-9)
+
+
+def test_pow_fallback():
+    import operator
+    import numpy as np
+    from backtrader.mathsupport import vectorized_op
+    base = np.array([0.0, 2.0, 3.0])
+    assert vectorized_op(operator.pow, base, 2.0).tolist() == [0.0, 4.0, 9.0]
+    assert vectorized_op(operator.pow, base, -1.0) is None
+    assert vectorized_op(operator.pow, base, np.array([1.0, -1.0, -1.0])) \
+        .tolist() == [0.0, 0.5, 1.0 / 3.0]
+    assert vectorized_op(operator.pow, np.array([-2.0, 2.0]), 2.0) is None
@@ -0,0 +1,179 @@
+"""测试中共用的数据和策略，新的运行模式和默认的运行模式在同样的数据上的结果需要完全一致"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import backtrader as bt
+
+
+def make_df(n=1000, seed=1, start='2020-01-01', freq='D'):
+    """生成随机游走的K线数据"""
+    rng = np.random.RandomState(seed)
+    index = pd.date_range(start, periods=n, freq=freq)
+    close = 100 + np.cumsum(rng.randn(n))
+    open_ = close + rng.randn(n) * 0.2
+    high = np.maximum(open_, close) + rng.rand(n)
+    low = np.minimum(open_, close) - rng.rand(n)
+    volume = rng.randint(100, 1000, size=n).astype(np.float64)
+    return pd.DataFrame(dict(open=open_, high=high, low=low, close=close,
+                             volume=volume, openinterest=0.0), index=index)
+
+
+def make_intraday(days=8, freq='1min', seed=0):
+    """交易时间内的分钟K线数据，随机去掉一部分bar"""
+    rng = np.random.RandomState(seed)
+    index = []
+    for day in pd.bdate_range('2021-01-04', periods=days):
+        index.extend(pd.date_range(day + pd.Timedelta('9h30min'),
+                                   day + pd.Timedelta('16h'), freq=freq))
+    index = pd.DatetimeIndex(index)
+    index = index[rng.rand(len(index)) > 0.1]
+    n = len(index)
+    close = 100 + rng.randn(n).cumsum() * 0.1
+    return pd.DataFrame(dict(open=close + rng.randn(n) * 0.01,
+                             high=close + 0.2, low=close - 0.2, close=close,
+                             volume=rng.randint(1, 1000, n) + 0.1,
+                             openinterest=rng.rand(n)), index=index)
+
+
+def make_data(n=1000, seed=1, start='2020-01-01', freq='D', **kwargs):
+    return bt.feeds.PandasData(dataname=make_df(n, seed, start, freq),
+                               **kwargs)
+
+
+class SmaCross(bt.Strategy):
+    """均线交叉的策略，记录每个bar的指标值、账户价值和订单的状态"""
+    params = (('fast', 5), ('slow', 20))
+
+    def __init__(self):
+        self.inds = dict()
+        self.crosses = dict()
+        for d in self.datas:
+            fast = bt.ind.SMA(d, period=self.p.fast)
+            slow = bt.ind.EMA(d, period=self.p.slow)
+            self.inds[d] = (fast, slow, bt.ind.RSI(d), bt.ind.ATR(d))
+            self.crosses[d] = bt.ind.CrossOver(fast, slow)
+        self.values = []
+        self.notified = []
+
+    def notify_order(self, order):
+        if order.status in [order.Completed, order.Canceled, order.Margin,
+                            order.Expired, order.Rejected]:
+            self.notified.append((len(self), order.getstatusname(),
+                                  order.executed.size, order.executed.price))
+
+    def next(self):
+        row = [self.broker.getvalue(), self.broker.getcash()]
+        for d in self.datas:
+            row.append(d.datetime[0])
+            row.extend(ind[0] for ind in self.inds[d])
+            if self.crosses[d][0] > 0:
+                self.buy(data=d, size=10)
+            elif self.crosses[d][0] < 0 and self.getposition(d):
+                self.close(data=d)
+        self.values.append(row)
+
+
+class RandomOrders(bt.Strategy):
+    """随机下各种类型的订单，记录订单的通知和每个bar的账户信息"""
+    params = (('kinds', None),)
+
+    def start(self):
+        self.rng = np.random.RandomState(11)
+        self.notified = []
+        self.values = []
+
+    def notify_order(self, order):
+        self.notified.append((len(self), order.data._name,
+                              order.getordername(), order.getstatusname(),
+                              order.executed.size, order.executed.price))
+
+    def next(self):
+        rng = self.rng
+        broker = self.broker
+        self.values.append((broker.getvalue(), broker.getcash(),
+                            len(broker.get_orders_open())))
+        for k in range(rng.randint(0, 4)):
+            d = self.datas[rng.randint(len(self.datas))]
+            p = d.close[0]
+            kind = rng.choice(self.p.kinds)
+            side = self.buy if rng.rand() < 0.5 else self.sell
+            size = rng.randint(1, 6)
+            valid = None
+            if rng.rand() < 0.3:
+                valid = datetime.timedelta(days=int(rng.randint(1, 10)))
+            off = p * rng.randn() * 0.02
+            if kind == 'market':
+                side(data=d, size=size)
+            elif kind == 'limit':
+                side(data=d, size=size, price=p + off, valid=valid,
+                     exectype=bt.Order.Limit)
+            elif kind == 'stop':
+                side(data=d, size=size, price=p + off, valid=valid,
+                     exectype=bt.Order.Stop)
+            elif kind == 'stoplimit':
+                side(data=d, size=size, price=p + off, valid=valid,
+                     plimit=p + off * rng.rand() * 2,
+                     exectype=bt.Order.StopLimit)
+            elif kind == 'stoptrail':
+                side(data=d, size=size, trailamount=abs(off),
+                     exectype=bt.Order.StopTrail)
+                side(data=d, size=size, trailpercent=0.02, plimit=p,
+                     exectype=bt.Order.StopTrailLimit)
+            elif kind == 'oco':
+                o1 = side(data=d, size=size, price=p - abs(off), valid=valid,
+                          exectype=bt.Order.Limit)
+                side(data=d, size=size, price=p + abs(off), oco=o1,
+                     exectype=bt.Order.Stop)
+                side(data=d, size=size, price=p + 2 * off, oco=o1,
+                     exectype=bt.Order.Limit)
+            elif kind == 'bracket':
+                sign = 1 if side == self.buy else -1
+                bracket = (self.buy_bracket if sign > 0 else
+                           self.sell_bracket)
+                bracket(data=d, size=size, price=p - sign * abs(off) / 2,
+                        stopprice=p - sign * 3 * abs(off),
+                        limitprice=p + sign * 3 * abs(off), valid=valid)
+            elif kind == 'close':
+                side(data=d, size=size, exectype=bt.Order.Close)
+            elif kind == 'cancel':
+                orders = broker.get_orders_open()
+                if orders:
+                    self.cancel(orders[rng.randint(len(orders))])
+
+
+class Values(bt.Analyzer):
+    """记录每个bar的账户价值和现金，参数优化的时候可以从子进程中返回"""
+
+    def start(self):
+        self.rets = []
+
+    def next(self):
+        self.rets.append((self.strategy.broker.getvalue(),
+                          self.strategy.broker.getcash()))
+
+    def get_analysis(self):
+        return self.rets
+
+
+def same(x, y, rel=0.0):
+    """比较两个结果，nan认为是相同的值，rel是浮点数允许的相对误差"""
+    if isinstance(x, float) and isinstance(y, float):
+        return (x == y or (x != x and y != y) or
+                abs(x - y) <= rel * max(abs(x), abs(y)))
+    if isinstance(x, (list, tuple)) and isinstance(y, (list, tuple)):
+        return len(x) == len(y) and all(
+            same(a, b, rel) for a, b in zip(x, y))
+    if isinstance(x, dict) and isinstance(y, dict):
+        return list(x) == list(y) and all(same(x[k], y[k], rel) for k in x)
+    return x == y
+
+
+def run(datas, strategy=SmaCross, **kwargs):
+    """运行策略并返回第一个策略实例，datas是生成数据的函数的列表"""
+    cerebro = bt.Cerebro(**kwargs)
+    for data in datas:
+        cerebro.adddata(data())
+    cerebro.addstrategy(strategy)
+    return cerebro.run()[0]
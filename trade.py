@@ -170,6 +170,9 @@ class Trade(object):
         The first entry in the history is the Opening Event
         The last entry in the history is the Closing Event
         # 用一个列表保存过去每个trade的事件及状态，第一个是开仓事件，最后一个是平仓事件
+      - ``historymax`` (``int``): if not ``None`` only the last
+        ``historymax`` entries of the history are kept
+        # 如果不是None，history中只保存最近的historymax个事件
 
     '''
     # trade的计数器
@@ -192,7 +195,8 @@ class Trade(object):
         )
     # 初始化
     def __init__(self, data=None, tradeid=0, historyon=False,
-                 size=0, price=0.0, value=0.0, commission=0.0):
+                 size=0, price=0.0, value=0.0, commission=0.0,
+                 historymax=None):
 
         self.ref = next(self.refbasis)
         self.data = data
@@ -217,6 +221,7 @@ class Trade(object):
 
         self.historyon = historyon
         self.history = list()
+        self.historymax = historymax
 
         self.status = self.Created
     # 返回交易的绝对大小,todo 感觉这个用法稍微有一些奇怪
@@ -359,3 +364,6 @@ class Trade(object):
                 self.pnl, self.pnlcomm, self.data._tz)
             histentry.doupdate(order, size, price, commission)
             self.history.append(histentry)
+            if (self.historymax is not None and
+                    len(self.history) > self.historymax):
+                del self.history[0]
@@ -0,0 +1,41 @@
+"""编译分析器使用的cython扩展，编译之后分析器会自动使用编译后的函数
+
+    python -m backtrader.utils.build_extensions
+
+- analyzers/my_corr: RollingCorrelation
+- utils/cal_return_sharpe_drawdown: SharpeRatio, DrawDown和向量化回测的指标
+
+没有编译或者编译失败的时候分析器使用python的计算方法，结果一样，
+编译需要安装cython和c++编译器
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXTENSIONS = [
+    os.path.join(ROOT, 'analyzers', 'my_corr'),
+    os.path.join(ROOT, 'utils', 'cal_return_sharpe_drawdown'),
+]
+
+
+def build_extensions(extensions=EXTENSIONS):
+    # 在每个扩展的文件夹中运行python setup.py build_ext --inplace，返回编译失败的文件夹
+    failed = []
+    for path in extensions:
+        cmd = [sys.executable, 'setup.py', 'build_ext', '--inplace']
+        if subprocess.call(cmd, cwd=path) != 0:
+            failed.append(path)
+    return failed
+
+
+def main():
+    failed = build_extensions()
+    for path in failed:
+        print('编译失败:', path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 #include <cmath>
+#include <vector>
 #include <omp.h> // openmp线程库
 
 namespace itdog{
@@ -42,4 +43,131 @@ namespace itdog{
         return -1.0*max_drawdown;
     }
 
+    // 和python的math.fsum一样计算准确的和(只支持有限的值，有无穷大、nan或者溢出的时候返回false)
+    inline bool fsum(const double* arr, const int n, double* result) {
+        std::vector<double> partials;
+        for (int k = 0; k < n; ++k) {
+            double x = arr[k];
+            if (!std::isfinite(x)) {
+                return false;
+            }
+            int i = 0;
+            for (size_t j = 0; j < partials.size(); ++j) {
+                double y = partials[j];
+                if (std::fabs(x) < std::fabs(y)) {
+                    double t = x;
+                    x = y;
+                    y = t;
+                }
+                double hi = x + y;
+                double yr = hi - x;
+                double lo = y - yr;
+                if (lo != 0.0) {
+                    partials[i++] = lo;
+                }
+                x = hi;
+            }
+            partials.resize(i);
+            if (x != 0.0) {
+                if (!std::isfinite(x)) {
+                    return false;  // intermediate overflow
+                }
+                partials.push_back(x);
+            }
+        }
+
+        double hi = 0.0;
+        int n_partials = partials.size();
+        if (n_partials > 0) {
+            double lo = 0.0;
+            hi = partials[--n_partials];
+            while (n_partials > 0) {
+                double x = hi;
+                double y = partials[--n_partials];
+                hi = x + y;
+                double yr = hi - x;
+                lo = y - yr;
+                if (lo != 0.0) {
+                    break;
+                }
+            }
+            // 和python一样进行半数舍入的修正
+            if (n_partials > 0 && ((lo < 0.0 && partials[n_partials - 1] < 0.0) ||
+                                   (lo > 0.0 && partials[n_partials - 1] > 0.0))) {
+                double y = lo * 2.0;
+                double x = hi + y;
+                double yr = x - hi;
+                if (y == yr) {
+                    hi = x;
+                }
+            }
+        }
+        *result = hi;
+        return true;
+    }
+
+    // 和SharpeRatio分析器(mathsupport中的average和standarddev)一样计算超额收益率的平均值和标准差
+    inline bool cal_sharpe_stats(const double* arr, const int n, const double rate,
+                                 const int bessel, double* avg, double* dev) {
+        std::vector<double> values(arr, arr + n);
+        for (int i = 0; i < n; ++i) {
+            values[i] = values[i] - rate;
+        }
+        double total = 0.0;
+        if (!fsum(values.data(), n, &total)) {
+            return false;
+        }
+        *avg = total / n;
+
+        // python中使用libm的pow计算平方，volatile避免编译器把pow换成乘法导致结果有误差
+        volatile double two = 2.0;
+        for (int i = 0; i < n; ++i) {
+            values[i] = std::pow(values[i] - *avg, two);
+        }
+        if (!fsum(values.data(), n, &total)) {
+            return false;
+        }
+        *dev = std::sqrt(total / (n - bessel));
+        return true;
+    }
+
+    // 和DrawDown分析器一样逐个计算回撤，state依次保存
+    // maxvalue, moneydown, drawdown, len, max.moneydown, max.drawdown, max.len
+    inline void cal_drawdown_stats(const double* arr, const int n, double* state) {
+        double maxvalue = state[0];
+        double moneydown = state[1];
+        double drawdown = state[2];
+        double len = state[3];
+        double max_moneydown = state[4];
+        double max_drawdown = state[5];
+        double max_len = state[6];
+
+        for (int i = 0; i < n; ++i) {
+            double value = arr[i];
+            if (value > maxvalue) {
+                maxvalue = value;
+            }
+            moneydown = maxvalue - value;
+            drawdown = 100.0 * moneydown / maxvalue;
+            if (moneydown > max_moneydown) {
+                max_moneydown = moneydown;
+            }
+            if (drawdown > max_drawdown) {
+                max_drawdown = drawdown;
+            }
+            len = drawdown != 0.0 ? len + 1.0 : 0.0;
+            if (len > max_len) {
+                max_len = len;
+            }
+        }
+
+        state[0] = maxvalue;
+        state[1] = moneydown;
+        state[2] = drawdown;
+        state[3] = len;
+        state[4] = max_moneydown;
+        state[5] = max_drawdown;
+        state[6] = max_len;
+    }
+
 }
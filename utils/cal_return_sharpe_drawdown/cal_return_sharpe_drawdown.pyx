@@ -29,6 +29,10 @@ cdef extern from "./cal_return_sharpe_drawdown.hh" namespace "itdog" nogil:
     double mul(double x,double y)
 
     double cal_max_drawdown_parallel(const double* arr, int n)
+
+    bint cal_sharpe_stats(const double* arr, int n, double rate, int bessel, double* avg, double* dev)
+
+    void cal_drawdown_stats(const double* arr, int n, double* state)
 #def 
 
 '''
@@ -123,8 +127,8 @@ cdef inline double cal_sharpe_ratio(const double[:]& arr):
     # cdef double std=cmath.sqrt((div(sq,n))-cmath.pow(mn,2))
     # cdef double ratio = div(mn * 252 ** 0.5 , std)
 
-    cdef int n =arr.shape[0]
     cdef double[:] rate=diff(arr)
+    cdef int n =rate.shape[0]  # 收益率比净值少一个，使用净值的长度会越界
     cdef double sum = 0.0
     cdef double sq = 0.0
     cdef double mn=0.0
@@ -226,6 +230,38 @@ def cal_max_drawdown_cy(ss:pd.Series):
     return cal_max_drawdown(ss.values)
 #def
 
+def cal_sharpe_stats_cy(returns, double rate=0.0, int bessel=0):
+    '''
+    @brief 计算超额收益率的平均值和标准差，结果和SharpeRatio分析器中python的计算完全一致
+    有无穷大、nan或者溢出的时候返回None，由python进行计算
+    '''
+    cdef const double[::1] arr = np.ascontiguousarray(returns, dtype=DTYPE)
+    cdef int n = arr.shape[0]
+    cdef double avg = 0.0
+    cdef double dev = 0.0
+
+    if n - bessel <= 0:
+        return None
+    if not cal_sharpe_stats(&arr[0], n, rate, bessel, &avg, &dev):
+        return None
+    return avg, dev
+#def
+
+
+def cal_drawdown_stats_cy(values, state):
+    '''
+    @brief 和DrawDown分析器一样根据每个bar的价值计算回撤
+    state是(maxvalue, moneydown, drawdown, len, max.moneydown, max.drawdown, max.len)，返回计算之后的state
+    '''
+    cdef const double[::1] arr = np.ascontiguousarray(values, dtype=DTYPE)
+    cdef double[::1] st = np.array(state, dtype=DTYPE)
+
+    if arr.shape[0] > 0:
+        cal_drawdown_stats(&arr[0], arr.shape[0], &st[0])
+    return tuple(st)
+#def
+
+
 # def cal_daily_returns_cy(ss:pd.Series):
 #     cdef vector[double] arr=ss.values
 #     return daily_returns(arr)
@@ -39,6 +39,10 @@ def set_cpp_version(ver:str) -> str:
     #if
 #def
 
+# 在当前文件夹中运行python setup.py build_ext --inplace进行编译，
+# 或者运行python -m backtrader.utils.build_extensions编译所有的扩展，
+# 编译之后SharpeRatio和DrawDown分析器会使用编译后的函数，
+# -ffp-contract=off不把乘法和加法合并成fma，保证计算结果和python完全一致
 #-O3 -march=native
 ext = Extension(
     "cal_return_sharpe_drawdown", sources=["cal_return_sharpe_drawdown.pyx"],
@@ -50,7 +54,7 @@ ext = Extension(
                 # set_compile_args('lpthread'),
                 set_cpp_version('c++17'),
                 # "-march=native"
-    ],
+    ] + (['-ffp-contract=off'] if sys.platform == 'linux' else []),
     extra_link_args=[
         set_extra_link_args('lgomp'),
     ]
@@ -26,6 +26,7 @@
 
 
 from .dateintern import (num2date, num2dt, date2num, time2num, num2time,
+                         date2num_array, num2date_array,
                          UTC, TZLocal, Localizer, tzparse, TIME_MAX, TIME_MIN)
 
 
@@ -33,4 +34,5 @@ from .dateintern import (num2date, num2dt, date2num, time2num, num2time,
 
 
 __all__ = ('num2date', 'num2dt', 'date2num', 'time2num', 'num2time',
+           'date2num_array', 'num2date_array',
            'UTC', 'TZLocal', 'Localizer', 'tzparse', 'TIME_MAX', 'TIME_MIN')
@@ -25,6 +25,11 @@ import datetime
 import math
 import time as _time
 from .py3 import string_types
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # from numba import jit 
 
 # 0的时间差
@@ -260,3 +265,127 @@ def time2num(tm):
            tm.microsecond / MUSECONDS_PER_DAY)
 
     return num
+
+
+EPOCH = datetime.datetime(1970, 1, 1)                       # datetime64的起始时间
+EPOCH_ORDINAL = EPOCH.toordinal()                           # 起始时间的ordinal
+MUSECONDS_PER_DAY_INT = 86400 * 1000000                     # 1天有多少微秒(整数)
+
+
+def _offsets(us, offset):
+    '''
+    Returns the result of ``offset`` (a function taking a naive datetime and
+    returning a timedelta) in microseconds for each of the ``us`` values
+    (microseconds since 1970-01-01)
+
+    The offset is evaluated at the beginning of each day and only for each
+    value in the days in which it changes (i.e.: daylight saving switches)
+    '''
+    def _offset(x):
+        td = offset(EPOCH + datetime.timedelta(microseconds=int(x)))
+        return (td.days * 86400 + td.seconds) * 1000000 + td.microseconds
+
+    days = us // MUSECONDS_PER_DAY_INT
+    udays, inverse = np.unique(days, return_inverse=True)
+    bounds = np.union1d(udays, udays + 1)
+    values = np.array([_offset(b * MUSECONDS_PER_DAY_INT) for b in bounds],
+                      dtype=np.int64)
+
+    dstart = values[np.searchsorted(bounds, udays)]
+    dend = values[np.searchsorted(bounds, udays + 1)]
+    offsets = dstart[inverse]
+    for i in np.flatnonzero((dstart != dend)[inverse]):
+        offsets[i] = _offset(us[i])
+
+    return offsets
+
+
+def _datetimes2us(dts):
+    # 把datetime的序列转换成从1970-01-01开始的微秒数，带有时区的时间转换成UTC
+    values = np.asarray(dts)
+    if values.dtype.kind != 'M':
+        values = np.asarray(dts, dtype='datetime64[us]')
+
+    nat = np.isnat(values)
+    unit, count = np.datetime_data(values.dtype)
+    if unit == 'ns':  # 和datetime一样只保留到微秒
+        us = values.view(np.int64) // (1000 // count)
+    else:
+        us = values.astype('datetime64[us]').view(np.int64)
+
+    return np.where(nat, 0, us), nat
+
+
+def date2num_array(dts, tz=None):
+    '''
+    Converts a sequence of datetimes (``numpy.datetime64``, pandas
+    ``DatetimeIndex``/``Series`` or ``datetime.datetime``) to an array of
+    float days with the same values which ``date2num`` returns for each
+    element. ``NaT`` values are converted to ``NaN``
+
+    If ``tz`` is not ``None`` the naive datetimes are localized to it
+    '''
+    us, nat = _datetimes2us(dts)
+    if tz is not None:
+        us = us - _offsets(us, lambda dt: tz.localize(dt).utcoffset())
+
+    days, us = np.divmod(us, MUSECONDS_PER_DAY_INT)
+    secs, us = np.divmod(us, 1000000)
+    mins, secs = np.divmod(secs, 60)
+    hours, mins = np.divmod(mins, 60)
+
+    # date2num使用math.fsum进行求和，这里逐项累加并保留舍入误差，结果一致
+    total = (days + EPOCH_ORDINAL).astype(np.float64)
+    error = np.zeros(len(total))
+    for part in (hours / HOURS_PER_DAY, mins / MINUTES_PER_DAY,
+                 secs / SECONDS_PER_DAY, us / MUSECONDS_PER_DAY):
+        subtotal = total + part
+        back = subtotal - total
+        error += (total - (subtotal - back)) + (part - back)
+        total = subtotal
+
+    total += error
+    total[nat] = float('nan')
+    return total
+
+
+def num2date_array(x, tz=None):
+    '''
+    Converts a sequence of float days to an array of ``numpy.datetime64[us]``
+    with the same (naive) values which ``num2date`` returns for each element.
+    ``NaN`` values are converted to ``NaT``
+
+    If ``tz`` is not ``None`` the values are converted from UTC to it
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    nan = np.isnan(x)
+    x = np.where(nan, float(EPOCH_ORDINAL), x)
+
+    # 和num2date的计算过程一样，保证结果一致
+    ix = x.astype(np.int64)
+    remainder = x - ix
+    hour, remainder = np.divmod(HOURS_PER_DAY * remainder, 1)
+    minute, remainder = np.divmod(MINUTES_PER_HOUR * remainder, 1)
+    second, remainder = np.divmod(SECONDS_PER_MINUTE * remainder, 1)
+    microsecond = (MUSECONDS_PER_SECOND * remainder).astype(np.int64)
+
+    microsecond[microsecond < 10] = 0  # compensate for rounding errors
+
+    us = ((ix - EPOCH_ORDINAL) * MUSECONDS_PER_DAY_INT +
+          hour.astype(np.int64) * 3600000000 +
+          minute.astype(np.int64) * 60000000 +
+          second.astype(np.int64) * 1000000 + microsecond)
+
+    if tz is not None:
+        us = us + _offsets(
+            us, lambda dt: UTC.localize(dt).astimezone(tz).replace(
+                tzinfo=None) - dt)
+
+    # 和num2date一样，在时区转换之后才补偿舍入误差
+    late = microsecond > 999990
+    us[late] += 1000000 - microsecond[late]  # compensate for rounding errors
+
+    dts = us.view('datetime64[us]')
+    dts[nan] = np.datetime64('NaT')
+    return dts
+
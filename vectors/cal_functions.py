@@ -1,30 +1,127 @@
 import pandas as pd
 import numpy as np
-from backtrader.utils.cal_return_sharpe_drawdown import cal_return_sharpe_drawdown as ts
 
 # 调用cal_return_sharpe_drawdown需要先去文件夹中编译cal_return_sharpe_drawdown，计算三个指标的速度比python提高了16.5倍左右
+# 没有编译的时候使用下面numpy的函数计算，计算方法和编译的函数一样
+try:
+    from backtrader.utils.cal_return_sharpe_drawdown import cal_return_sharpe_drawdown as ts
+except ImportError:
+    ts = None
+
+
+def _cal_sharpe_ratio(arr):
+    rate = np.diff(arr) / arr[:-1]
+    mean = rate.mean()
+    std = np.sqrt((rate * rate).mean() - mean ** 2)
+    return mean * 252 ** 0.5 / std
+
+
+def _cal_average_rate(arr):
+    # 如果计算的实际收益率为负数的话，收益率不能超过-100%,默认最小为-99.99%
+    total_rate = np.fmax((arr[-1] - arr[0]) / arr[0], -0.9999)
+    return (1 + total_rate) ** (252 / arr.shape[0]) - 1
+
+
+def _cal_max_drawdown(arr):
+    cum_max = np.fmax.accumulate(arr)
+    drawdown = (cum_max[1:] - arr[1:]) / cum_max[1:]
+    return -1.0 * np.fmax.reduce(drawdown, initial=0.0)
+
+
 def get_rate_sharpe_drawdown(arr):
     # 计算夏普率、复利年化收益率、最大回撤率
     # arr是每日的净值序列
     # if isinstance(arr, pd.Series):
     #     arr = arr.to_numpy()
-    return [ts.cal_sharpe_ratio_cy(arr), ts.cal_average_rate_cy(arr), ts.cal_max_drawdown_cy(arr)]
+    return [get_sharpe(arr), get_average_rate(arr), get_maxdrawdown(arr)]
 
 def get_sharpe(arr):
     # 计算夏普率
     # arr是每日的净值序列
+    if ts is None:
+        return _cal_sharpe_ratio(np.asarray(arr, dtype=np.float64))
     return ts.cal_sharpe_ratio_cy(arr)
 
 def get_average_rate(arr):
     # 计算复利年化收益率
     # arr是每日的净值序列
+    if ts is None:
+        return _cal_average_rate(np.asarray(arr, dtype=np.float64))
     return ts.cal_average_rate_cy(arr)
 
 def get_maxdrawdown(arr):
     # 计算最大回撤率
     # arr是每日的净值序列
+    if ts is None:
+        return _cal_max_drawdown(np.asarray(arr, dtype=np.float64))
     return ts.cal_max_drawdown_cy(arr)
 
+def get_rate_sharpe_drawdown_by_columns(value_df):
+    # 按列计算夏普率、复利年化收益率、最大回撤率
+    # value_df的每一列是一个参数组合的净值序列，返回的df的index是value_df的列名
+    # 编译的函数直接使用数据的指针，需要使用连续的内存，DataFrame的列可能不是连续的
+    results = [get_rate_sharpe_drawdown(pd.Series(np.ascontiguousarray(value_df[col].values, dtype=np.float64),
+                                                  index=value_df.index))
+               for col in value_df.columns]
+    return pd.DataFrame(results, index=value_df.columns,
+                        columns=["sharpe_ratio", "average_rate", "max_drawdown"])
+
+# 批量计算多个参数组合的净值，signal_matrix的每一行是一个bar，每一列是一个参数组合
+# 计算逻辑和AlphaTs._cal_value一致，只是在每个bar上对所有的参数组合同时进行计算
+def cal_value_by_matrix(open_arr, close_arr, signal_matrix, commission=0.0, init_value=1000000, percent=1.0):
+    signal_matrix = np.asarray(signal_matrix, dtype=np.float64)
+    if signal_matrix.ndim == 1:
+        signal_matrix = signal_matrix.reshape(-1, 1)
+    open_arr = np.asarray(open_arr, dtype=np.float64)
+    close_arr = np.asarray(close_arr, dtype=np.float64)
+    bar_len, col_len = signal_matrix.shape
+    value_arr = np.zeros(signal_matrix.shape)
+    # 保存上一个bar的开仓价格、开仓资金和手续费，每个参数组合一个值
+    open_price = np.full(col_len, open_arr[1])
+    open_value = np.full(col_len, float(init_value))
+    now_signal = signal_matrix[0]
+    now_commission = np.where(now_signal == 0, 0.0, init_value * percent * commission)
+    value_arr[0] = init_value - now_commission
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 从第二个bar开始计算到倒数第二个bar
+        for i in range(1, bar_len - 1):
+            pre_signal = signal_matrix[i - 1]
+            now_signal = signal_matrix[i]
+            pre_value = value_arr[i - 1]
+            next_open = open_arr[i + 1]
+            same = pre_signal == now_signal
+            # 信号不变并且持有仓位
+            hold = same & (pre_signal != 0)
+            # 前一个信号不是0，现在是0了，下个bar平仓
+            close_pos = ~same & (pre_signal != 0) & (now_signal == 0)
+            # 前一个信号是0，现在不是0了，下个bar开仓
+            open_pos = ~same & (pre_signal == 0) & (now_signal != 0)
+            # 前后信号方向相反，下个bar反手
+            reverse = ~same & (pre_signal * now_signal == -1)
+            hold_value = open_value + (close_arr[i] - open_price) / open_price * pre_signal * open_value * percent
+            close_change = (next_open - open_price) / open_price * pre_signal * open_value * percent
+            close_commission = next_open / open_price * open_value * percent * commission
+            reverse_value = pre_value + close_change - now_commission
+            new_value = np.where(open_pos, pre_value, reverse_value)
+            new_commission = new_value * percent * commission
+            value = np.zeros(col_len)
+            value = np.where(same & (pre_signal == 0), pre_value, value)
+            value = np.where(hold, hold_value - now_commission, value)
+            value = np.where(close_pos, open_value + close_change - now_commission - close_commission, value)
+            value = np.where(open_pos | reverse, new_value - new_commission, value)
+            value_arr[i] = value
+            now_commission = np.where(close_pos, close_commission,
+                                      np.where(open_pos | reverse, new_commission, now_commission))
+            open_price = np.where(hold, open_price, np.where(open_pos | reverse, next_open, 0.0))
+            open_value = np.where(hold, open_value, np.where(open_pos | reverse, new_value, 0.0))
+        # 最后一个bar，如果信号不变并且持有仓位，按照收盘价计算价值
+        i = bar_len - 2
+        pre_signal = signal_matrix[i]
+        hold = (pre_signal == signal_matrix[i + 1]) & (pre_signal != 0)
+        hold_value = open_value + (close_arr[i + 1] - open_price) / open_price * pre_signal * open_value * percent
+        value_arr[i + 1] = np.where(hold, hold_value, value_arr[i])
+    return value_arr
+
 def get_symbol(contract_name):
     # 根据具体的期货合约获取标的资产的代码
     """
@@ -41,23 +138,28 @@ def cal_long_short_factor_value(s,a=0.2):
         if num>0:
             return [s[num-1], s[-1*num]]
         else:
-            return [np.NaN, np.NaN]
+            return [np.nan, np.nan]
 
 def cal_long_short_factor_value_c(s, a = 0.2):
     s = s.values
+    if ts is None:
+        s = np.sort(s[~np.isnan(s)])
+        num = int(s.size * a)
+        return (s[num - 1], s[-1 * num]) if num > 0 else (np.nan, np.nan)
     return ts.cal_long_short_factor_value_cy(s, a)
 
 # 使用numpy计算具体的信号
-def cal_signals_by_numpy(factors_arr, percent, hold_days):
+# offset是调仓的偏移量，不同的offset对应不同的调仓日期
+def cal_signals_by_numpy(factors_arr, percent, hold_days, offset=0):
     signals = np.zeros(factors_arr.shape)
     data_length = factors_arr.shape[0]
     col_len = factors_arr.shape[1]
     diff_arr = np.array([-0.00000000000001 * i for i in range(col_len)])
     short_arr = np.zeros(col_len)
     long_arr = np.zeros(col_len)
-    signals[0] = np.array([np.NaN for i in range(col_len)])
+    signals[0] = np.array([np.nan for i in range(col_len)])
     for i in range(data_length - 1):
-        if i % hold_days == 0:
+        if (i - offset) % hold_days == 0:
             s = factors_arr[i,] + diff_arr
             ss = s[~np.isnan(s)]
             ss.sort()
@@ -65,7 +167,7 @@ def cal_signals_by_numpy(factors_arr, percent, hold_days):
             if num > 0:
                 lower_value, upper_value = ss[num - 1], ss[-1 * num]
             else:
-                lower_value, upper_value = np.NaN, np.NaN
+                lower_value, upper_value = np.nan, np.nan
 
             short_arr = np.where(s <= lower_value, -1, 0)
             long_arr = np.where(s >= upper_value, 1, 0)
@@ -75,6 +177,72 @@ def cal_signals_by_numpy(factors_arr, percent, hold_days):
     # signals = np.delete(signals,0,axis=0)
     return signals
 
+# 一次计算多个调仓偏移量的信号，返回的数组第一维是offsets，每一组和cal_signals_by_numpy(factors_arr, percent, hold_days, offset)一样
+# 每一行的排序和多空的阈值和调仓日期无关，只计算一次，每个调仓日期使用最近一次调仓时的信号
+def cal_signals_by_offsets(factors_arr, percent, hold_days, offsets):
+    data_length, col_len = factors_arr.shape
+    diff_arr = np.array([-0.00000000000001 * i for i in range(col_len)])
+    s = factors_arr + diff_arr
+    # 排序的时候nan在最后
+    ss = np.sort(s, axis=1)
+    count_arr = np.count_nonzero(~np.isnan(s), axis=1)
+    num_arr = (count_arr * percent).astype(int)
+    row_arr = np.arange(data_length)
+    lower_arr = np.where(num_arr > 0, ss[row_arr, np.maximum(num_arr - 1, 0)], np.nan)
+    upper_arr = np.where(num_arr > 0, ss[row_arr, np.minimum(count_arr - num_arr, col_len - 1)], np.nan)
+    with np.errstate(invalid="ignore"):
+        day_signals = np.where(s <= lower_arr[:, None], -1, 0) + np.where(s >= upper_arr[:, None], 1, 0)
+    # 每个调仓日期最近一次调仓的行，第一次调仓之前的信号是nan
+    rows = np.arange(data_length - 1)
+    last_rows = rows - (rows - np.asarray(offsets)[:, None]) % hold_days
+    signals = np.full((last_rows.shape[0], data_length, col_len), np.nan)
+    signals[:, 1:] = np.where((last_rows >= 0)[:, :, None], day_signals[np.maximum(last_rows, 0)], np.nan)
+    return signals
+
+# 使用numpy计算持有hold_days调仓的组合净值，signals_arr和opens_arr,closes_arr的行数需要一致
+# 每个调仓周期内各品种分配的资金不变，只有调仓时的总资金需要递推，所以按照调仓周期计算资金的累乘即可
+# signals_arr是三维的时候第一维是不同调仓日期的信号，start_rows是每一组信号开始的行，之前的行净值是nan
+def cal_total_value_by_numpy(signals_arr, opens_arr, closes_arr, hold_days, commission=0.0,
+                             initial_capital=1000000.0, start_rows=None):
+    single = signals_arr.ndim == 2
+    if single:
+        signals_arr = signals_arr[None]
+    group_len, data_rows = signals_arr.shape[:2]
+    if start_rows is None:
+        start_rows = np.zeros(group_len, dtype=int)
+    rows = np.arange(data_rows)
+    # 每一行相对于开始的行数及所在调仓周期的第一行
+    local_rows = rows - np.asarray(start_rows)[:, None]
+    valid = local_rows >= 0
+    local_rows = np.maximum(local_rows, 0)
+    begin_rows = rows - local_rows % hold_days
+    # 调仓的行，在下个bar的开盘价平仓
+    rebalance = valid & ((local_rows + 1) % hold_days == 0) & (rows < data_rows - 1)
+    # 新的调仓周期的第一行，使用上个调仓周期结束时的资金
+    new_period = valid & (local_rows > 0) & (local_rows % hold_days == 0)
+    next_rows = np.minimum(rows + 1, data_rows - 1)
+    price_arr = np.where(rebalance[:, :, None], opens_arr[next_rows], closes_arr)
+    # 最后一行沿用上一行计算收益率的价格
+    price_arr[:, data_rows - 1] = price_arr[:, data_rows - 2]
+    group_arr = np.arange(group_len)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        open_price_arr = opens_arr[begin_rows]
+        return_arr = (price_arr - open_price_arr) / open_price_arr * signals_arr
+        # 每个调仓周期开始时的信号决定哪些品种分配资金
+        begin_signals = signals_arr[group_arr, begin_rows]
+        count_arr = np.count_nonzero(begin_signals, axis=2)
+        unit_arr = begin_signals * begin_signals * (1 + return_arr)
+        unit_arr[rebalance] *= (1 - commission)
+        # 每个调仓周期每个品种分配的资金
+        total_unit = np.nansum(unit_arr[:, rows - 1], axis=2)
+        growth_arr = np.where(new_period, (1 - commission) * total_unit / count_arr, 1.0)
+        start_count = count_arr[group_arr[:, 0], start_rows]
+        symbol_value_arr = (initial_capital / start_count * (1 - commission))[:, None] * \
+            np.cumprod(growth_arr, axis=1)
+        values_arr = np.nansum(symbol_value_arr[:, :, None] * unit_arr, axis=2)
+    values_arr[~valid] = np.nan
+    return values_arr[0] if single else values_arr
+
 # 把datas合并生成具体的array
 def convert_datas_to_array(datas):
     # 把各个品种的开盘价和收盘价数据转化成array
@@ -129,7 +297,7 @@ def convert_datas_to_array(datas):
 #         # 计算最大回撤，直接传递净值
 #         endDate = np.argmax((np.maximum.accumulate(X) - X) / np.maximum.accumulate(X))
 #         if endDate == 0:
-#             return np.NaN
+#             return np.nan
 #         else:
 #             startDate = np.argmax(X[:endDate])
 #
@@ -70,10 +70,13 @@ class AlphaCs(object):
         # todo 分析下为啥signals前些行所有的列都是0
         signals_arr = signals_arr[~np.all(np.isnan(signals_arr) | np.equal(signals_arr, 0), axis=1)]
         # print("after",signals_arr.shape)
-        data_rows = signals_arr.shape[0]
-        data_cols = signals_arr.shape[1]
-        # 初始化values_arr
-        values_arr = np.zeros(signals_arr.shape)
+        opens_arr, closes_arr = self.get_prices_arr(datas, signals_arr.shape[0])
+        # 当前bar的信号，是根据factors计算出来每个bar的signals向下移动一位形成，意味着当前bar应该持有的仓位，1代表多，-1代表空
+        total_value_arr = cal_total_value_by_numpy(signals_arr, opens_arr, closes_arr, hold_days,
+                                                   commission, initial_capital)
+        return total_value_arr
+
+    def get_prices_arr(self, datas, data_rows):
         # 把各个品种的开盘价和收盘价数据转化成array
         opens_arr = self.params.get("opens_arr",None)
         if opens_arr is not None:
@@ -82,63 +85,27 @@ class AlphaCs(object):
         else:
             opens_arr,closes_arr = convert_datas_to_array(datas)
         # 删除部分由于open_arr行数比signals_arr行数多的行
-        delete = range(opens_arr.shape[0] - signals_arr.shape[0])
+        delete = range(opens_arr.shape[0] - data_rows)
         opens_arr = np.delete(opens_arr, delete, axis=0)
         closes_arr = np.delete(closes_arr, delete, axis=0)
-        # 初始化第一行的数据
-        # 当前bar的信号，是根据factors计算出来每个bar的signals向下移动一位形成，意味着当前bar应该持有的仓位，1代表多，-1代表空
-        sig_arr = signals_arr[0]
-        # 计算这一行当中非0的元素的个数
-        count = np.count_nonzero(sig_arr)
-        # 计算出来每个品种开仓后的资金
-        symbol_value = initial_capital / count * (1 - commission)
-        # 记录每个品种的价值
-        symbol_value_arr = np.array([symbol_value] * data_cols) * sig_arr * sig_arr
-        # assert symbol_value_arr.sum()==initial_capital
-        # 记录每个品种的开仓价
-        symbol_open_price_arr = opens_arr[0]
-        # 开始循环每一行,最后一行不循环，避免出现index越界
-        for i in range(data_rows-1):
-            # 如果当前bar持有到期，在下个bar开仓的时候需要平仓并进行新开仓，则
-            if (i+1) % hold_days == 0:
-                # 当前bar的信号
-                sig_arr = signals_arr[i]
-                # 下个bar的开盘价
-                open_arr = opens_arr[i+1]
-                # 计算收益率时候用到的收盘价
-                symbol_close_price_arr = open_arr
-                # print("初始资金分配：", symbol_value_arr)
-                # 计算当前每个品种的value并保存到values_arr中
-                return_arr = (symbol_close_price_arr-symbol_open_price_arr)/symbol_open_price_arr*sig_arr
-                # print("计算得到的return_arr",return_arr)
-                symbol_value_arr_cur = (1-commission)*symbol_value_arr*(1.0+return_arr)
-                values_arr[i] =  symbol_value_arr_cur
-                # 计算接下来预计要分给每个品种的资金
-                new_sig_arr = signals_arr[i + 1]
-                total_value_val =  np.nansum(symbol_value_arr_cur)
-                count = np.count_nonzero(new_sig_arr)
-                symbol_value = (1-commission)*total_value_val / count
-                symbol_value_arr = np.array([symbol_value] * data_cols)*new_sig_arr*new_sig_arr
-                # 保存开仓的信号
-                symbol_open_price_arr = open_arr
-
-            else:
-                sig_arr = signals_arr[i]
-                symbol_close_price_arr = closes_arr[i]
-                return_arr = (symbol_close_price_arr - symbol_open_price_arr) / symbol_open_price_arr * sig_arr
-                symbol_value_arr_cur = symbol_value_arr * (1 + return_arr)
-                values_arr[i] = symbol_value_arr_cur
-
-        # 最后一行的数据
-        sig_arr = signals_arr[data_rows-1]
-        close_arr = closes_arr[data_rows-1]
-        return_arr = (symbol_close_price_arr - symbol_open_price_arr) / symbol_open_price_arr * sig_arr
-        # print("计算得到的return_arr",return_arr)
-        symbol_value_arr_cur = symbol_value_arr * (1 + return_arr)
-        values_arr[data_rows-1] = symbol_value_arr_cur
-        total_value_arr = np.nansum(values_arr,axis=1)
-        return total_value_arr
-
+        return opens_arr, closes_arr
+
+    def cal_values_by_offsets(self, factors_df, hold_days):
+        # 在hold_days个不同的调仓日期上同时进行测试，资金平均分配给每个调仓日期，减少调仓日期对结果的影响
+        # 所有调仓日期的信号叠加在第一维上，一次计算所有调仓日期的净值
+        signals_arr = cal_signals_by_offsets(factors_df.to_numpy(), self.params['percent'], hold_days,
+                                             range(hold_days))
+        signals_arr = np.delete(signals_arr, 0, axis=1)
+        # 每个调仓日期从第一个有信号的行开始计算
+        has_signals = ~np.all(np.isnan(signals_arr) | np.equal(signals_arr, 0), axis=2)
+        start_rows = np.argmax(has_signals, axis=1)
+        opens_arr, closes_arr = self.get_prices_arr(self.datas, signals_arr.shape[1])
+        total_value_arr = cal_total_value_by_numpy(signals_arr, opens_arr, closes_arr, hold_days,
+                                                   self.commission, self.initial_capital, start_rows)
+        # 只保留所有调仓日期都有净值的部分，每个调仓日期的初始资金相同
+        total_value_arr = total_value_arr[:, start_rows.max():]
+        total_value_arr = total_value_arr / total_value_arr[:, :1] * self.initial_capital / hold_days
+        return total_value_arr.sum(axis=0)
 
     def cal_performance(self,total_value_arr,index_list,total_value_save_path=None):
         # print(total_value_arr)
@@ -170,7 +137,11 @@ class AlphaCs(object):
     def run(self):
         factors_df = self.cal_factors()
         _signals_arr,index_list,col_list = self.cal_signals(factors_df)
-        total_value_arr = self.cal_values(self.datas, _signals_arr, self.params['hold_days'])
+        # multi_offsets为True的时候，同时测试不同的调仓日期
+        if self.params.get("multi_offsets", False):
+            total_value_arr = self.cal_values_by_offsets(factors_df, self.params['hold_days'])
+        else:
+            total_value_arr = self.cal_values(self.datas, _signals_arr, self.params['hold_days'])
         return self.cal_performance(total_value_arr,index_list,self.total_value_save_path)
 
     def plot(self):
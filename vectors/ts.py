@@ -199,6 +199,23 @@ class AlphaTs(object):
             value_arr[i + 1] = value_arr[i]
         return value_arr
 
+    # 批量计算多个参数组合的净值，signal_matrix的每一行是一个bar，每一列是一个参数组合
+    # 如果signal_matrix是DataFrame，列名会作为参数组合的名字
+    def cal_values(self, signal_matrix):
+        commission = 0.0 if self.commission is None else self.commission
+        init_value = 1000000 if self.init_value is None else self.init_value
+        percent = 1.0 if self.percent is None else self.percent
+        columns = getattr(signal_matrix, "columns", None)
+        value_arr = cal_value_by_matrix(self.open_arr, self.close_arr, signal_matrix,
+                                        commission=commission, init_value=init_value, percent=percent)
+        return pd.DataFrame(value_arr, index=self.datetime_arr, columns=columns)
+
+    # 对多个参数组合进行快速筛选，返回每个参数组合的夏普率、复利年化收益率、最大回撤率
+    # 筛选出来的较好的参数可以再使用cerebro进行详细的回测
+    def run_sweep(self, signal_matrix):
+        value_df = self.cal_values(signal_matrix)
+        return get_rate_sharpe_drawdown_by_columns(value_df)
+
     def run(self):
         value_arr = self.cal_value()
         value_df = pd.DataFrame(value_arr,index=self.datetime_arr,columns=['total_value'])
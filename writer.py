@@ -24,6 +24,8 @@ from __future__ import (absolute_import, division, print_function,
 import collections
 import io
 import itertools
+import json
+import os
 import sys
 try:  # For new Python versions
     collectionsAbc = collections.abc  # collections.Iterable -> collections.abc.Iterable
@@ -296,3 +298,91 @@ class WriterStringIO(WriterFile):
         super(WriterStringIO, self).stop()
         # Leave the file positioned at the beginning
         self.out.seek(0)
+
+
+# 把策略不再保存的订单和交易追加写入到文件中
+class HistorySpill(object):
+    '''
+    Appends the orders and trades dropped by the history retention of the
+    strategies (see ``histretain`` and ``histspill`` in ``Cerebro``) to a
+    file, one JSON object per line
+
+    Each line has a ``kind`` (``order`` or ``trade``), the name of the
+    ``strategy``, its parameters (``params``) and the name of the ``data``
+    and the values of the order (creation and execution) or of the trade.
+    Datetimes are in the float format of the platform
+
+    The strategies keep a copy of an order for each notification, so an
+    order has a line per notification (with the ``status`` of the
+    notification, the last one has the final status). Trades have a line
+    per trade
+
+    Params:
+
+      - ``filename``: file to which the lines are appended
+
+      - ``perprocess``: append to a file per process, with the process id
+        added before the extension of ``filename``. Used when optimizing,
+        where several processes run strategies at the same time
+    '''
+
+    def __init__(self, filename, perprocess=False):
+        self.filename = filename
+        self.perprocess = perprocess
+        self.out = None
+        self._params = dict()  # id(strategy) -> params
+
+    def start(self):
+        if self.out is None:
+            filename = self.filename
+            if self.perprocess:
+                root, ext = os.path.splitext(filename)
+                filename = '%s.%d%s' % (root, os.getpid(), ext)
+
+            self.out = open(filename, 'a')
+
+    def stop(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+            self._params = dict()
+
+    def _write(self, kind, owner, data, values):
+        params = self._params.get(id(owner))
+        if params is None:
+            # 不能转成json的参数值使用字符串
+            params = self._params[id(owner)] = json.loads(json.dumps(
+                dict(owner.p._getkwargs()), default=str))
+
+        values['kind'] = kind
+        values['strategy'] = owner.__class__.__name__
+        values['params'] = params
+        values['data'] = getattr(data, '_name', '')
+        self.out.write(json.dumps(values, sort_keys=True) + '\n')
+
+    def order(self, owner, order):
+        '''Writes a (notified) order'''
+        created, executed = order.created, order.executed
+        self._write('order', owner, order.data, dict(
+            ref=order.ref, ordtype=order.ordtypename(),
+            exectype=order.getordername(), status=order.getstatusname(),
+            tradeid=order.tradeid,
+            created_dt=created.dt, created_size=created.size,
+            created_price=created.price,
+            executed_dt=executed.dt, executed_size=executed.size,
+            executed_price=executed.price, executed_value=executed.value,
+            executed_comm=executed.comm, executed_pnl=executed.pnl,
+        ))
+
+    def trade(self, owner, trade):
+        '''Writes a trade'''
+        self._write('trade', owner, trade.data, dict(
+            ref=trade.ref, tradeid=trade.tradeid,
+            status=trade.status_names[trade.status],
+            size=trade.size, price=trade.price, value=trade.value,
+            commission=trade.commission, pnl=trade.pnl,
+            pnlcomm=trade.pnlcomm,
+            baropen=trade.baropen, dtopen=trade.dtopen,
+            barclose=trade.barclose, dtclose=trade.dtclose,
+            barlen=trade.barlen,
+        ))